@@ -53,6 +53,8 @@ if not config('SKIP_ELASTICSEARCH', default=False, cast=bool):
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # zstd/brotli/gzip for API responses, including streamed exports
+    'xray_search.middleware.CompressionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,6 +100,37 @@ DATABASES = {
 }
 
 
+# Caches: a per-process LRU in front of a shared cache. The shared tier is
+# Redis when REDIS_URL is set. Without it the shared tier is an in-memory
+# cache inside each process: incr/add stay atomic, but generation bumps and
+# compute locks only reach that process, so REDIS_URL is required whenever
+# more than one worker process serves requests. Bump CACHE_VERSION to drop
+# every cached value at once.
+REDIS_URL = config('REDIS_URL', default='')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'xray_search.cache_backends.TieredCache',
+        'LOCATION': 'shared',
+        'VERSION': config('CACHE_VERSION', default=1, cast=int),
+        'OPTIONS': {
+            'LOCAL_TIMEOUT': config('CACHE_LOCAL_TIMEOUT', default=5, cast=int),
+            'LOCAL_MAX_ENTRIES': 5000,
+            'LOCAL_MAX_BYTES': 32 * 1024 * 1024,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'medproject',
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'medproject-shared',
+        'KEY_PREFIX': 'medproject',
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -142,6 +175,9 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Bulk uploads (POST /api/xrays/bulk/) send up to 1000 images per request
+DATA_UPLOAD_MAX_NUMBER_FILES = 1000
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -157,9 +193,20 @@ REST_FRAMEWORK = {
         'rest_framework.filters.OrderingFilter',
     ],
     'DEFAULT_RENDERER_CLASSES': [
+        # orjson for clients that opt in with the `application/json;
+        # encoder=orjson` media type. Listed first so it wins when asked
+        # for; plain application/json never matches it.
+        'xray_search.renderers.ORJSONRenderer',
+        # Compact layout for bulk readers, only when asked for with
+        # `application/json; layout=columnar` or ?format=columnar
+        'xray_search.renderers.ColumnarJSONRenderer',
         'rest_framework.renderers.JSONRenderer',
+        'xray_search.renderers.MessagePackRenderer',
     ],
+    # ?format= selects a renderer even when Accept is just */*
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'xray_search.renderers.FormatContentNegotiation',
     'DEFAULT_PARSER_CLASSES': [
+        'xray_search.renderers.ORJSONParser',
         'rest_framework.parsers.JSONParser',
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FormParser',
@@ -185,6 +232,12 @@ if not config('SKIP_ELASTICSEARCH', default=False, cast=bool):
         },
     }
 
+    # Serve Elasticsearch from the in-process fake instead of a cluster
+    # (offline development, load tests and benchmarks)
+    if config('ELASTICSEARCH_FAKE', default=False, cast=bool):
+        from xray_search.elasticsearch_fake import FakeNode
+        ELASTICSEARCH_DSL['default']['node_class'] = FakeNode
+
 # Security settings for production
 if not DEBUG:
     SECURE_BROWSER_XSS_FILTER = True
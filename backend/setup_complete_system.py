@@ -79,12 +79,8 @@ def setup_elasticsearch():
     try:
         from django.core.management import call_command
         
-        print("🔄 Creating Elasticsearch index...")
-        call_command('search_index', '--delete', '-f')
-        call_command('search_index', '--create')
-        
-        print("🔄 Populating Elasticsearch index...")
-        call_command('search_index', '--populate')
+        print("🔄 Building Elasticsearch index...")
+        call_command('rebuild_search_index')
         
         xray_count = XRay.objects.count()
         print(f"✅ Elasticsearch setup complete - indexed {xray_count} X-rays")
@@ -35,16 +35,10 @@ def check_elasticsearch():
 def setup_elasticsearch_index():
     """Create and populate Elasticsearch index"""
     try:
-        # Create index
-        print("[RUNNING] Creating Elasticsearch index...")
-        call_command('search_index', '--delete', '-f')
-        call_command('search_index', '--create')
-        print("[SUCCESS] Elasticsearch index created")
-        
-        # Populate index
-        print("[RUNNING] Populating Elasticsearch index with X-ray data...")
-        call_command('search_index', '--populate')
-        print("[SUCCESS] Elasticsearch index populated")
+        # Build a new index version and swap the alias over to it
+        print("[RUNNING] Building Elasticsearch index with X-ray data...")
+        call_command('rebuild_search_index')
+        print("[SUCCESS] Elasticsearch index built and populated")
         
         # Get document count
         xray_count = XRay.objects.count()
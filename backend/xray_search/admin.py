@@ -1,11 +1,14 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin, GroupAdmin as BaseGroupAdmin
 from django.contrib.auth.models import User, Group
+from django.utils import timezone
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from django import forms
+from .cache import bump_data_generation, bump_mutation_generation
 from .models import XRay, BodyPart
+from .rollups import dimension_counts, refresh_rollups
 
 
 # Unregister default User and Group admin to customize them
@@ -274,7 +277,14 @@ class XRayAdmin(admin.ModelAdmin):
     
     def mark_as_normal(self, request, queryset):
         """Bulk action to mark selected X-rays as normal"""
-        count = queryset.update(diagnosis='Normal')
+        # update() bypasses save signals; bumping updated_at lets
+        # sync_search_index pick these rows up, the rollups of the
+        # affected months are recomputed and cached aggregates invalidated
+        months = list(queryset.dates('scan_date', 'month'))
+        count = queryset.update(diagnosis='Normal', updated_at=timezone.now())
+        refresh_rollups(months)
+        bump_data_generation()
+        bump_mutation_generation()
         self.message_user(request, f'{count} X-ray(s) marked as normal.')
     mark_as_normal.short_description = "Mark selected X-rays as normal"
     
@@ -311,22 +321,20 @@ class XRayAdmin(admin.ModelAdmin):
         """Add custom context to changelist view"""
         extra_context = extra_context or {}
         
-        # Add statistics
-        total_xrays = XRay.objects.count()
+        # Add statistics, read from the scan rollups
+        counts = dimension_counts('body_part')
+        total_xrays = sum(counts.values())
         body_part_stats = {}
         
         # Get stats from both old and new body part fields
-        for choice in XRay.BODY_PART_CHOICES:
-            body_part = choice[0]
-            count = XRay.objects.filter(body_part=body_part).count()
-            if count > 0:
-                body_part_stats[body_part] = count
+        body_part_names = [choice[0] for choice in XRay.BODY_PART_CHOICES]
         
         # Add stats from BodyPart categories
-        for body_part_cat in BodyPart.objects.filter(is_active=True):
-            count = XRay.objects.filter(body_part=body_part_cat.name).count()
-            if count > 0:
-                body_part_stats[body_part_cat.name] = count
+        body_part_names += BodyPart.objects.filter(is_active=True).values_list('name', flat=True)
+        
+        for body_part in body_part_names:
+            if counts.get(body_part, 0) > 0:
+                body_part_stats[body_part] = counts[body_part]
         
         extra_context.update({
             'total_xrays': total_xrays,
@@ -14,6 +14,12 @@ class XraySearchConfig(AppConfig):
         admin.site.site_title = "Medical Admin"
         admin.site.index_title = "Medical Image Management"
         
+        # Keep the scan rollups in step with saves and deletes
+        from . import signals  # noqa: F401
+
+        # Warn about cache settings that don't fit multi-process deployments
+        from . import checks  # noqa: F401
+        
         # Only register Elasticsearch documents if not skipping
         skip_es = os.environ.get('SKIP_ELASTICSEARCH', 'False').lower() == 'true'
         if not skip_es:
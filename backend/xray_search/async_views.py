@@ -0,0 +1,212 @@
+"""
+Async Elasticsearch endpoints for serving under ASGI.
+
+A search page needs hits, facet counts and suggestions. The synchronous
+views issue those requests one after another; here they are sent
+concurrently over a shared, pooled ``AsyncElasticsearch`` client, so the
+slowest request sets the latency instead of the sum of all three.
+
+Serve the ASGI application to share the client. Under WSGI the view still
+works, but gets a client of its own per request.
+"""
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+from elasticsearch import AsyncElasticsearch
+
+from .documents import XRayDocument
+from .search_queries import aggregation_search, build_xray_search, get_filter_params
+
+
+# Concurrent HTTP connections kept open to each Elasticsearch node
+ASYNC_CONNECTIONS_PER_NODE = 25
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+SUGGEST_FIELDS = ['diagnosis', 'institution', 'tags']
+
+# One client per event loop. Under ASGI the loop lives as long as the
+# worker, so every request shares one pooled client.
+_clients = weakref.WeakKeyDictionary()
+
+
+def create_async_client():
+    """Return a new AsyncElasticsearch client for the configured cluster"""
+    config = getattr(settings, 'ELASTICSEARCH_DSL', {}).get('default')
+    if config is None:
+        raise RuntimeError('Elasticsearch is not configured')
+    options = {}
+    if config.get('node_class') is not None:
+        # A custom sync node class (the in-process fake) names its
+        # async counterpart
+        options['node_class'] = getattr(
+            config['node_class'], 'async_node_class', config['node_class']
+        )
+    return AsyncElasticsearch(
+        config['hosts'],
+        request_timeout=config.get('timeout', 20),
+        connections_per_node=ASYNC_CONNECTIONS_PER_NODE,
+        **options
+    )
+
+
+def get_async_client():
+    """Return the pooled AsyncElasticsearch client for the running loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = create_async_client()
+    return client
+
+
+@asynccontextmanager
+async def request_client(request):
+    """
+    Yield the AsyncElasticsearch client to use for a request.
+
+    Under WSGI, Django runs each async view in a new event loop that is
+    closed afterwards, so a client can't outlive the request: it is created
+    for the request and closed, with its connections, before returning.
+    """
+    if isinstance(request, ASGIRequest):
+        yield get_async_client()
+        return
+    client = create_async_client()
+    try:
+        yield client
+    finally:
+        await client.close()
+
+
+def get_page_bounds(query_params):
+    """Return ``(from, size)`` for the page and page_size parameters"""
+    try:
+        page = max(int(query_params.get('page', 1)), 1)
+        size = min(max(int(query_params.get('page_size', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError('page and page_size must be integers')
+    return (page - 1) * size, size
+
+
+def build_page_bodies(query, params, offset, size):
+    """Return the request bodies for the hits, facets and suggestions of a page"""
+    hits_search = build_xray_search(query, params)
+    hits_search = hits_search.highlight_options(
+        pre_tags=['<mark>'],
+        post_tags=['</mark>'],
+        fragment_size=150,
+        number_of_fragments=3
+    )
+    hits_search = hits_search.highlight('description', 'diagnosis', 'tags.text')
+    hits_search = hits_search[offset:offset + size]
+
+    # Facet counts for the same query and filters as the hits
+    facets_search = aggregation_search(build_xray_search(query, params))
+    facets_search.aggs.bucket('body_parts', 'terms', field='body_part.raw', size=20)
+    facets_search.aggs.bucket('institutions', 'terms', field='institution.raw', size=20)
+    facets_search.aggs.bucket('diagnoses', 'terms', field='diagnosis.raw', size=20)
+    facets_search.aggs.bucket('tags', 'terms', field='tags', size=30)
+
+    suggest_body = None
+    if query:
+        suggest_search = XRayDocument.search().extra(size=0)
+        for field in SUGGEST_FIELDS:
+            suggest_search = suggest_search.suggest(
+                field,
+                query,
+                completion={
+                    'field': f'{field}.suggest',
+                    'size': 5,
+                    'skip_duplicates': True,
+                    'fuzzy': {'fuzziness': 1},
+                }
+            )
+        suggest_body = suggest_search.to_dict()
+
+    return hits_search.to_dict(), facets_search.to_dict(), suggest_body
+
+
+def format_hits(response):
+    """Flatten raw search hits into result dicts"""
+    results = []
+    for hit in response['hits']['hits']:
+        result = dict(hit['_source'])
+        if 'highlight' in hit:
+            result['highlight'] = hit['highlight']
+        result['search_score'] = hit['_score']
+        results.append(result)
+    return results
+
+
+def format_facets(response):
+    """Turn terms aggregations into name/count lists"""
+    return {
+        name: [
+            {'name': bucket['key'], 'count': bucket['doc_count']}
+            for bucket in aggregation['buckets']
+        ]
+        for name, aggregation in response['aggregations'].items()
+    }
+
+
+def format_suggestions(response):
+    """Return the completion texts per suggested field"""
+    if response is None:
+        return {field: [] for field in SUGGEST_FIELDS}
+    return {
+        field: [
+            option['text']
+            for entry in response['suggest'][field]
+            for option in entry['options']
+        ]
+        for field in SUGGEST_FIELDS
+    }
+
+
+async def search_page(request):
+    """
+    Hits, facet counts and suggestions for one search page in one call
+
+    Accepts the same q/body_part/diagnosis/institution/tags/date_from/date_to
+    parameters as the advanced search, plus page and page_size.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    query = request.GET.get('q', '')
+    params = get_filter_params(request.GET)
+    try:
+        offset, size = get_page_bounds(request.GET)
+        hits_body, facets_body, suggest_body = build_page_bodies(query, params, offset, size)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    index = XRayDocument._index._name
+    try:
+        async with request_client(request) as client:
+            requests = [
+                client.search(index=index, body=hits_body),
+                client.search(index=index, body=facets_body, request_cache=True),
+            ]
+            if suggest_body is not None:
+                requests.append(client.search(index=index, body=suggest_body))
+
+            responses = await asyncio.gather(*requests)
+    except Exception as e:
+        return JsonResponse({'error': f'Search failed: {str(e)}'}, status=500)
+
+    hits_response, facets_response = responses[0], responses[1]
+    suggest_response = responses[2] if suggest_body is not None else None
+
+    return JsonResponse({
+        'results': format_hits(hits_response),
+        'total': hits_response['hits']['total']['value'],
+        'took': max(response['took'] for response in responses),
+        'facets': format_facets(facets_response),
+        'suggestions': format_suggestions(suggest_response),
+    })
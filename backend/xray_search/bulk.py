@@ -0,0 +1,240 @@
+"""
+Bulk writes of X-ray scans.
+
+Creating scans one by one costs an INSERT, a file write, an embedding and a
+synchronous Elasticsearch request per scan, plus the per-row signal work.
+``bulk_create_scans`` instead writes the image files and computes the
+embeddings concurrently, inserts every row with one ``bulk_create`` in a
+single transaction and indexes the new rows with one ``_bulk`` request.
+
+``bulk_update_scans`` applies tag and metadata changes to a set of scans
+with set-based UPDATEs (JSON operators on PostgreSQL) and pushes the
+changed fields to Elasticsearch as partial-document updates in one bulk
+pass.
+
+Neither ``bulk_create`` nor ``update()`` sends save signals, so the work the
+signal handlers do for single saves is done here once per batch: rollups
+and sketches are updated, and the cache generations bumped, when the
+transaction commits.
+"""
+import json
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections, transaction
+from django.db.models import JSONField
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .cache import bump_data_generation, bump_mutation_generation
+from .embeddings import compute_embedding
+from .models import XRay
+from .rollups import ROLLUP_DIMENSIONS, apply_rollup_deltas, refresh_rollups, rollup_key
+from .sketches import add_patients, sketch_keys
+
+
+MAX_BULK_SCANS = 1000
+
+# Threads writing image files and computing embeddings
+FILE_WORKERS = 8
+
+# Fields bulk updates may set to one value across scans
+BULK_SET_FIELDS = ['body_part', 'diagnosis']
+
+# Ids per UPDATE / index batch, well under SQLite's 32766 bound variables
+UPDATE_CHUNK_SIZE = 5000
+
+# Removes ``remove`` from the tags, then appends the ``add`` tags that
+# aren't there yet, in the order given
+POSTGRES_TAGS_SQL = (
+    '({tags} - %s::text[]) || COALESCE(('
+    'SELECT jsonb_agg(added.tag ORDER BY added.position) '
+    'FROM jsonb_array_elements(%s::jsonb) WITH ORDINALITY AS added(tag, position) '
+    'WHERE NOT ({tags} - %s::text[]) @> jsonb_build_array(added.tag)'
+    "), '[]'::jsonb)"
+)
+
+
+def store_image(xray, upload):
+    """Embed an uploaded image and save it to storage under the scan's upload path"""
+    field = XRay._meta.get_field('image')
+    embedding = compute_embedding(upload)
+    name = field.generate_filename(xray, upload.name)
+    stored_name = field.storage.save(name, upload, max_length=field.max_length)
+    return stored_name, embedding
+
+
+def store_images(xrays, uploads):
+    """Store all uploads concurrently, setting each scan's image and embedding"""
+    with ThreadPoolExecutor(max_workers=FILE_WORKERS) as executor:
+        futures = [executor.submit(store_image, xray, upload) for xray, upload in zip(xrays, uploads)]
+
+    errors = [future.exception() for future in futures if future.exception()]
+    if errors:
+        # Don't leave the files of a failed batch behind
+        delete_images({future.result()[0] for future in futures if not future.exception()})
+        raise errors[0]
+    for xray, future in zip(xrays, futures):
+        xray.image, xray.image_embedding = future.result()
+
+
+def delete_images(names):
+    storage = XRay._meta.get_field('image').storage
+    for name in names:
+        storage.delete(name)
+
+
+def schedule_batch_updates(xrays):
+    """Update rollups, sketches and the data generation once the batch commits"""
+    deltas = Counter(
+        rollup_key(xray.scan_date, xray.body_part, xray.institution, xray.diagnosis)
+        for xray in xrays
+    )
+    patients = defaultdict(set)
+    for xray in xrays:
+        for key in sketch_keys(xray.scan_date, xray.body_part, xray.institution):
+            patients[key].add(xray.patient_id)
+
+    transaction.on_commit(lambda: apply_rollup_deltas(deltas))
+    for key, patient_ids in patients.items():
+        transaction.on_commit(lambda key=key, patient_ids=patient_ids: add_patients([key], sorted(patient_ids)))
+    transaction.on_commit(bump_data_generation)
+
+
+def index_scans(ids):
+    """Index the given scans with one ``_bulk`` request; return the number indexed"""
+    from .indexing import ALIAS, get_connection, index_queryset
+
+    es = get_connection()
+    indexed = index_queryset(es, ALIAS, XRay.objects.filter(id__in=ids), chunk_size=max(len(ids), 1))
+    es.indices.refresh(index=ALIAS)
+    return indexed
+
+
+def bulk_create_scans(rows):
+    """
+    Create scans from validated serializer data, each with an ``image`` upload.
+
+    Returns ``(scans, indexed)``; ``indexed`` is False if Elasticsearch
+    couldn't be reached, in which case ``sync_search_index`` picks the new
+    rows up later.
+    """
+    xrays = [XRay(**{key: value for key, value in row.items() if key != 'image'}) for row in rows]
+    store_images(xrays, [row['image'] for row in rows])
+
+    try:
+        with transaction.atomic():
+            XRay.objects.bulk_create(xrays, batch_size=500)
+            schedule_batch_updates(xrays)
+    except Exception:
+        delete_images({xray.image.name for xray in xrays})
+        raise
+
+    try:
+        index_scans([xray.pk for xray in xrays])
+    except Exception:
+        return xrays, False
+    return xrays, True
+
+
+def change_tags(tags, add_tags, remove_tags):
+    """Return ``tags`` without ``remove_tags``, followed by the missing ``add_tags``"""
+    tags = [tag for tag in tags or [] if tag not in remove_tags]
+    return tags + [tag for tag in add_tags if tag not in tags]
+
+
+def tags_expression(connection, add_tags, remove_tags):
+    """Return the PostgreSQL expression applying tag changes to the ``tags`` column"""
+    sql = POSTGRES_TAGS_SQL.format(tags=connection.ops.quote_name('tags'))
+    params = [list(remove_tags), json.dumps(list(add_tags)), list(remove_tags)]
+    return RawSQL(sql, params, output_field=JSONField())
+
+
+def update_tags(scans, add_tags, remove_tags):
+    """Apply tag changes to every scan in the queryset"""
+    connection = connections[scans.db]
+    if connection.vendor == 'postgresql':
+        scans.update(tags=tags_expression(connection, add_tags, remove_tags))
+        return
+
+    # Other databases have no portable JSON array operators; rewrite the
+    # rows whose tags actually change
+    changed = []
+    for xray in scans.only('id', 'tags').iterator(chunk_size=2000):
+        tags = change_tags(xray.tags, add_tags, remove_tags)
+        if tags != xray.tags:
+            xray.tags = tags
+            changed.append(xray)
+    XRay.objects.bulk_update(changed, ['tags'], batch_size=500)
+
+
+def id_chunks(ids):
+    """Split ids into lists that fit one statement"""
+    return [ids[start:start + UPDATE_CHUNK_SIZE] for start in range(0, len(ids), UPDATE_CHUNK_SIZE)]
+
+
+def update_index(ids, fields):
+    """Send the given fields of the scans to Elasticsearch as partial updates"""
+    from elasticsearch import helpers
+
+    from .indexing import ALIAS, get_connection
+
+    es = get_connection()
+    actions = (
+        {'_op_type': 'update', '_index': ALIAS, '_id': row.pop('id'), 'doc': row}
+        for chunk in id_chunks(ids)
+        for row in XRay.objects.filter(id__in=chunk).order_by().values('id', 'updated_at', *fields).iterator()
+    )
+    helpers.bulk(es, actions, chunk_size=500)
+    es.indices.refresh(index=ALIAS)
+
+
+def bulk_update_scans(queryset, add_tags=(), remove_tags=(), values=None):
+    """
+    Apply tag changes and set ``values`` on every scan in ``queryset``.
+
+    Returns ``(updated, indexed)``; ``indexed`` is False if Elasticsearch
+    couldn't be reached, in which case ``sync_search_index`` picks the
+    changes up later from ``updated_at``.
+    """
+    values = values or {}
+    updated_at = timezone.now()
+    with transaction.atomic():
+        # Lock the selection and fix it as a list of ids: the filter may stop
+        # matching once values change, and the ids address exactly these
+        # rows in every later statement and in the index pass after commit
+        ids = list(
+            XRay.objects.select_for_update()
+            .filter(id__in=queryset.order_by().values('id'))
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        if not ids:
+            return 0, True
+
+        months = set()
+        patient_ids = set()
+        for chunk in id_chunks(ids):
+            scans = XRay.objects.filter(id__in=chunk)
+            if set(values) & set(ROLLUP_DIMENSIONS):
+                months.update(scans.dates('scan_date', 'month'))
+            if 'body_part' in values:
+                patient_ids.update(scans.values_list('patient_id', flat=True).distinct())
+            scans.update(updated_at=updated_at, **values)
+            if add_tags or remove_tags:
+                update_tags(scans, add_tags, remove_tags)
+
+        if months:
+            refresh_rollups(months)
+        if patient_ids:
+            keys = [('body_part', values['body_part'])]
+            transaction.on_commit(lambda: add_patients(keys, sorted(patient_ids)))
+        transaction.on_commit(bump_data_generation)
+        transaction.on_commit(bump_mutation_generation)
+
+    fields = list(values) + (['tags'] if add_tags or remove_tags else [])
+    try:
+        update_index(ids, fields)
+    except Exception:
+        return len(ids), False
+    return len(ids), True
@@ -0,0 +1,171 @@
+"""
+Cache helpers for derived X-ray data.
+
+Cached aggregates are validated against generation counters kept in the
+cache. The data generation is bumped on every committed write, so anything
+keyed on it is recomputed after any change. The mutation generation is
+only bumped when an existing scan is updated or deleted; aggregates that
+can fold new rows in incrementally by id (see ``timeseries.py``) use it to
+survive inserts.
+
+``get_or_compute`` coalesces concurrent misses for a key: the caller that
+takes the key's lock computes the value while the others wait for it, so an
+invalidation or expiry under load costs one computation instead of one per
+request. Values can also be served stale for a while past their timeout
+while a single background thread refreshes them.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+DATA_GENERATION_KEY = 'xray_search:data_generation'
+MUTATION_GENERATION_KEY = 'xray_search:mutation_generation'
+
+DERIVED_CACHE_TIMEOUT = 10 * 60
+# Search results also depend on the index, which sync jobs update on their own
+SEARCH_CACHE_TIMEOUT = 60
+# How long past its timeout a value may be served while it is refreshed
+STALE_CACHE_TIMEOUT = 5 * 60
+
+# A computation holding a key's lock longer than this is presumed dead
+COMPUTE_LOCK_TIMEOUT = 30
+# How long callers wait for another caller's computation before running their own
+COMPUTE_WAIT_TIMEOUT = 10
+COMPUTE_POLL_INTERVAL = 0.05
+
+
+def new_generation():
+    # Seeded from the clock, so a counter lost to eviction restarts above
+    # every value cached entries can have been stamped with
+    return time.time_ns()
+
+
+def get_generation(key):
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, new_generation(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, new_generation(), timeout=None)
+
+
+def get_data_generation():
+    """Return the current data generation"""
+    return get_generation(DATA_GENERATION_KEY)
+
+
+def bump_data_generation():
+    """Invalidate everything cached from scan data"""
+    bump_generation(DATA_GENERATION_KEY)
+
+
+def get_mutation_generation():
+    """Return the current mutation generation"""
+    return get_generation(MUTATION_GENERATION_KEY)
+
+
+def bump_mutation_generation():
+    """Invalidate aggregates that can't absorb an update or delete incrementally"""
+    bump_generation(MUTATION_GENERATION_KEY)
+
+
+def filter_signature(filterset):
+    """
+    Return a stable digest of the active filters of a bound FilterSet.
+
+    Equivalent requests (different parameter order, empty parameters) get
+    the same signature, so they share a cache entry.
+    """
+    active = sorted(
+        (name, str(value))
+        for name, value in filterset.form.cleaned_data.items()
+        if value not in (None, '', [])
+    )
+    return hashlib.sha1(repr(active).encode('utf-8')).hexdigest()
+
+
+def data_cache_key(name, *parts):
+    """Return a key for a value derived from scan data, scoped to the data generation"""
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    return f'xray_search:{name}:{get_data_generation()}:{digest}'
+
+
+def store_computed(key, value, timeout, stale_timeout):
+    """Cache ``value`` under ``key``, fresh for ``timeout`` seconds (None: until evicted)"""
+    if timeout is None:
+        cache.set(key, {'value': value, 'fresh_until': None}, None)
+    else:
+        cache.set(key, {'value': value, 'fresh_until': time.time() + timeout}, timeout + stale_timeout)
+    return value
+
+
+def compute_once(key, compute, timeout, stale_timeout):
+    """Compute and cache the value for ``key``, or wait for a caller already doing so"""
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, True, COMPUTE_LOCK_TIMEOUT):
+        try:
+            return store_computed(key, compute(), timeout, stale_timeout)
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + COMPUTE_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(COMPUTE_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['value']
+        if not cache.has_key(lock_key):
+            # The other computation failed; run our own
+            break
+    return store_computed(key, compute(), timeout, stale_timeout)
+
+
+def refresh_in_background(key, compute, timeout, stale_timeout):
+    """Start one thread recomputing ``key`` unless a computation is already running"""
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, True, COMPUTE_LOCK_TIMEOUT):
+        return None
+
+    def refresh():
+        try:
+            store_computed(key, compute(), timeout, stale_timeout)
+        except Exception:
+            # The stale value stays in place until it expires
+            logger.exception('Refreshing cached value %s failed', key)
+        finally:
+            cache.delete(lock_key)
+            connections.close_all()
+
+    thread = threading.Thread(target=refresh, name=f'cache-refresh:{key}', daemon=True)
+    thread.start()
+    return thread
+
+
+def get_or_compute(key, compute, timeout=DERIVED_CACHE_TIMEOUT, stale_timeout=0):
+    """
+    Return the cached value for ``key``, computing and caching it on a miss.
+
+    Concurrent misses share one computation. With ``stale_timeout``, a value
+    past its ``timeout`` is still returned for that many more seconds while
+    a background thread recomputes it.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        return compute_once(key, compute, timeout, stale_timeout)
+    if entry['fresh_until'] is not None and entry['fresh_until'] <= time.time():
+        refresh_in_background(key, compute, timeout, stale_timeout)
+    return entry['value']
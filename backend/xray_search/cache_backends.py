@@ -0,0 +1,194 @@
+"""
+Two-tier cache backend: a per-process LRU in front of a shared cache.
+
+Reads check the local tier first and fall back to the shared backend (Redis
+in production, an in-process ``LocMemCache`` for single-process setups),
+copying hits into the local tier for a few seconds. Writes go through to both tiers, so a
+process always sees its own writes, and other processes see them within
+``LOCAL_TIMEOUT`` seconds.
+
+Local entries are stored pickled, like ``LocMemCache``, so callers that
+mutate a returned value can't corrupt the cache, and the local tier is
+bounded by both entry count and pickled size, evicting least recently used
+entries first.
+
+Configuration::
+
+    'default': {
+        'BACKEND': 'xray_search.cache_backends.TieredCache',
+        'LOCATION': 'shared',  # alias of the shared cache
+        'OPTIONS': {
+            'LOCAL_TIMEOUT': 5,
+            'LOCAL_MAX_ENTRIES': 5000,
+            'LOCAL_MAX_BYTES': 32 * 1024 * 1024,
+        },
+    }
+"""
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.functional import cached_property
+
+
+class LocalLRU:
+    """Thread-safe, size-bounded LRU of pickled values with expiry"""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (expires_at, pickled)
+        self.size = 0
+        self.lock = threading.Lock()
+        self.counters = Counter()
+
+    def get(self, key):
+        """Return the pickled value, or None if missing or expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, pickled = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return pickled
+
+    def set(self, key, pickled, ttl):
+        if len(pickled) > self.max_bytes:
+            self.delete(key)
+            return
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = (time.monotonic() + ttl, pickled)
+            self.size += len(pickled)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.counters['evictions'] += 1
+
+    def delete(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+# Django creates a cache backend instance per thread; the local tier is
+# shared by all threads of the process, like LocMemCache's storage
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    """Cache backend with a per-process LRU in front of a shared cache alias"""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = location
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        with _local_tiers_lock:
+            self.local = _local_tiers.setdefault(location, LocalLRU(
+                max_entries=options.get('LOCAL_MAX_ENTRIES', 5000),
+                max_bytes=options.get('LOCAL_MAX_BYTES', 32 * 1024 * 1024),
+            ))
+
+    @cached_property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def _version(self, version):
+        return self.version if version is None else version
+
+    def _local_ttl(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return self.local_timeout
+        return min(self.local_timeout, max(timeout - time.time(), 0))
+
+    def _store_local(self, key, value, timeout=DEFAULT_TIMEOUT):
+        ttl = self._local_ttl(timeout)
+        if ttl > 0:
+            self.local.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ttl)
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        pickled = self.local.get(local_key)
+        if pickled is not None:
+            self.local.counters['local_hits'] += 1
+            return pickle.loads(pickled)
+
+        missing = object()
+        value = self.shared.get(key, missing, version=self._version(version))
+        if value is missing:
+            self.local.counters['misses'] += 1
+            return default
+        self.local.counters['shared_hits'] += 1
+        self._store_local(local_key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self.shared.set(key, value, timeout, version=self._version(version))
+        self.local.counters['sets'] += 1
+        self._store_local(local_key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        if self.shared.add(key, value, timeout, version=self._version(version)):
+            self.local.counters['sets'] += 1
+            self._store_local(local_key, value, timeout)
+            return True
+        # Someone else's value won; don't keep a stale local copy
+        self.local.delete(local_key)
+        return False
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=self._version(version))
+
+    def delete(self, key, version=None):
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=self._version(version))
+
+    def has_key(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        return self.local.get(local_key) is not None or self.shared.has_key(key, version=self._version(version))
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self.shared.incr(key, delta, version=self._version(version))
+        self._store_local(local_key, value)
+        return value
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def metrics(self):
+        """Return this process's hit/miss counters and local tier size"""
+        counters = self.local.counters
+        lookups = counters['local_hits'] + counters['shared_hits'] + counters['misses']
+        hits = counters['local_hits'] + counters['shared_hits']
+        return {
+            'local_hits': counters['local_hits'],
+            'shared_hits': counters['shared_hits'],
+            'misses': counters['misses'],
+            'sets': counters['sets'],
+            'evictions': counters['evictions'],
+            'hit_ratio': round(hits / lookups, 4) if lookups else None,
+            'local_entries': len(self.local.entries),
+            'local_bytes': self.local.size,
+        }
@@ -0,0 +1,52 @@
+"""System checks for deployment settings."""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+PROCESS_LOCAL_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def shared_cache_is_process_local():
+    """Return True if the shared cache tier only lives inside this process"""
+    shared = settings.CACHES.get('shared')
+    return shared is not None and shared.get('BACKEND') in PROCESS_LOCAL_BACKENDS
+
+
+def warn_if_cache_not_shared(command):
+    """
+    Tell a management command's user that the web processes won't see its
+    cache invalidation.
+
+    Commands and scripts run in their own process, so with a process-local
+    shared tier their generation bumps never reach the web processes, which
+    keep serving cached statistics, filter options and search results until
+    those expire.
+    """
+    if shared_cache_is_process_local():
+        command.stdout.write(command.style.WARNING(
+            'No shared cache is configured (REDIS_URL is unset): running web processes keep '
+            'serving cached statistics and filter options until they expire.'
+        ))
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Warn when the shared cache tier isn't shared between processes.
+
+    Besides other web workers, this covers management commands and scripts
+    writing to the database (see ``warn_if_cache_not_shared``).
+    """
+    if not shared_cache_is_process_local():
+        return []
+    return [
+        Warning(
+            'The shared cache only lives inside each process, so cache invalidation '
+            'and compute locks don\'t reach other worker processes.',
+            hint='Set REDIS_URL, or serve requests from a single worker process.',
+            id='xray_search.W001',
+        )
+    ]
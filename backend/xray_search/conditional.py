@@ -0,0 +1,72 @@
+"""
+Conditional GET for the X-ray API.
+
+Validators are derived from the scans table itself: the latest
+``updated_at`` and the row count, read with one aggregate per request. Every
+write either stamps ``updated_at`` or, for deletes, changes the count, so
+the validators move with writes made by any process, whatever the cache
+backend. A revalidation that matches is answered with 304 by Django's
+``condition`` decorator before the view body runs, so no scan rows are
+fetched or serialized.
+
+ETags are weak: they change with any committed write, not only writes that
+affect the response, and they fold in the negotiated media type so JSON,
+columnar and other renderings don't share validators.
+"""
+import hashlib
+from datetime import date, timedelta
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .models import XRay
+
+
+def data_state(request):
+    """Return the latest ``updated_at`` and row count of the scans, read once per request"""
+    state = getattr(request, '_xray_data_state', None)
+    if state is None:
+        state = XRay.objects.aggregate(latest=Max('updated_at'), count=Count('id'))
+        request._xray_data_state = state
+    return state
+
+
+def data_etag(request, *parts):
+    """Return a weak ETag for the current scan data and representation"""
+    state = data_state(request)
+    key = '|'.join(
+        [str(state['latest']), str(state['count']), getattr(request, 'accepted_media_type', '') or '']
+        + [str(part) for part in parts]
+    )
+    return f'W/"{hashlib.sha1(key.encode("utf-8")).hexdigest()}"'
+
+
+def data_last_modified(request, *args, **kwargs):
+    """Return the time of the last write to scan data"""
+    latest = data_state(request)['latest']
+    # Last-Modified has one-second precision; a write in the current second
+    # could be followed by another that it can't tell apart, so until the
+    # second is over only the ETag validates
+    if latest is None or latest > timezone.now() - timedelta(seconds=1):
+        return None
+    return latest
+
+
+def list_etag(request, *args, **kwargs):
+    return data_etag(request)
+
+
+def detail_etag(request, *args, **kwargs):
+    return data_etag(request, kwargs.get('pk'))
+
+
+def daily_etag(request, *args, **kwargs):
+    # Statistics with "last 30 days" figures change at midnight too
+    return data_etag(request, date.today())
+
+
+def conditional_on_data(etag_func=list_etag):
+    """Decorate a ViewSet method with ETag / Last-Modified validation"""
+    return method_decorator(condition(etag_func=etag_func, last_modified_func=data_last_modified))
@@ -0,0 +1,90 @@
+"""
+Document viewset over the X-ray search index.
+
+Needs django-elasticsearch-dsl-drf, which the function views in
+``elasticsearch_views`` don't; import this module only where that package
+is installed.
+"""
+from django_elasticsearch_dsl_drf.viewsets import DocumentViewSet
+from django_elasticsearch_dsl_drf.filter_backends import (
+    FilteringFilterBackend,
+    SearchFilterBackend,
+    OrderingFilterBackend,
+    DefaultOrderingFilterBackend,
+    SuggesterFilterBackend,
+)
+from django_elasticsearch_dsl_drf.constants import SUGGESTER_COMPLETION
+from .documents import XRayDocument
+from .serializers import XRaySerializer
+
+
+class XRayDocumentViewSet(DocumentViewSet):
+    """
+    Advanced Elasticsearch-powered X-ray search viewset
+    """
+    document = XRayDocument
+    serializer_class = XRaySerializer
+    
+    filter_backends = [
+        FilteringFilterBackend,
+        SearchFilterBackend,
+        OrderingFilterBackend,
+        DefaultOrderingFilterBackend,
+        SuggesterFilterBackend,
+    ]
+    
+    # Define search fields with boosting for relevance
+    search_fields = {
+        'description': {'boost': 2.0},  # Description gets higher weight
+        'description.english': {'boost': 1.5},
+        'diagnosis': {'boost': 3.0},  # Diagnosis gets highest weight
+        'tags.text': {'boost': 1.8},
+        'patient_id': {'boost': 1.0},
+        'institution': {'boost': 1.2},
+        'body_part': {'boost': 1.5},
+    }
+    
+    # Define filtering fields
+    filter_fields = {
+        'body_part': 'body_part.raw',
+        'diagnosis': 'diagnosis.raw',
+        'institution': 'institution.raw',
+        'scan_date': 'scan_date',
+        'created_at': 'created_at',
+        'patient_id': 'patient_id.raw',
+        'tags': 'tags',
+    }
+    
+    # Define ordering fields
+    ordering_fields = {
+        'scan_date': 'scan_date',
+        'created_at': 'created_at',
+        'patient_id': 'patient_id.raw',
+        'body_part': 'body_part.raw',
+        'diagnosis': 'diagnosis.raw',
+    }
+    
+    # Default ordering
+    ordering = ('-created_at',)
+    
+    # Suggester fields for autocomplete
+    suggester_fields = {
+        'institution_suggest': {
+            'field': 'institution.suggest',
+            'suggesters': [
+                SUGGESTER_COMPLETION,
+            ],
+        },
+        'diagnosis_suggest': {
+            'field': 'diagnosis.suggest',
+            'suggesters': [
+                SUGGESTER_COMPLETION,
+            ],
+        },
+        'tags_suggest': {
+            'field': 'tags.suggest',
+            'suggesters': [
+                SUGGESTER_COMPLETION,
+            ],
+        },
+    }
@@ -1,54 +1,108 @@
 from django_elasticsearch_dsl import Document, fields
 from django_elasticsearch_dsl.registries import registry
+from elasticsearch_dsl import DenseVector
+from .embeddings import EMBEDDING_DIMS
 from .models import XRay
 
 
+class DenseVectorField(fields.DEDField, DenseVector):
+    pass
+
+
+def faceted_text_field():
+    """
+    Text field with the subfields the search views rely on:
+    ``.raw`` for term filters, sorting and aggregations, and ``.suggest``
+    for completion suggestions.
+    """
+    return fields.TextField(
+        fields={
+            # Global ordinals are built at refresh time instead of on the
+            # first terms aggregation after every refresh
+            'raw': fields.KeywordField(eager_global_ordinals=True),
+            'suggest': fields.CompletionField(),
+        }
+    )
+
+
 @registry.register_document
 class XRayDocument(Document):
     """
     Elasticsearch document for X-ray scans with advanced search capabilities
     """
-    
-    # Custom field for tags (JSONField)
-    tags = fields.TextField()
-    
+
+    patient_id = fields.TextField(
+        fields={
+            'raw': fields.KeywordField(),
+        }
+    )
+    body_part = faceted_text_field()
+    institution = faceted_text_field()
+    diagnosis = faceted_text_field()
+    description = fields.TextField(
+        fields={
+            'english': fields.TextField(analyzer='english'),
+        }
+    )
+
+    # Tags are indexed as a keyword array so term filters and the popular
+    # tags aggregation work on exact values; ``.text`` is for full-text search
+    tags = fields.KeywordField(
+        multi=True,
+        eager_global_ordinals=True,
+        fields={
+            'text': fields.TextField(),
+            'suggest': fields.CompletionField(),
+        }
+    )
+
+    # Image feature vector (see embeddings.py), indexed for approximate kNN
+    image_embedding = DenseVectorField(
+        dims=EMBEDDING_DIMS,
+        index=True,
+        similarity='cosine',
+    )
+
     class Index:
-        # Name of the Elasticsearch index
+        # Alias used for reads and writes. The data lives in versioned
+        # indices (xray_scans_v1, xray_scans_v2, ...) created by the
+        # rebuild_search_index command, which swaps this alias atomically.
         name = 'xray_scans'
         # See Elasticsearch Indices API reference for available settings
         settings = {
             'number_of_shards': 1,
             'number_of_replicas': 0,
+            # Segments are stored in newest-scan-first order, so queries
+            # sorted by scan_date can terminate early. Index sorting can only
+            # be set at creation time; apply it with rebuild_search_index.
+            'sort.field': ['scan_date', 'created_at'],
+            'sort.order': ['desc', 'desc'],
         }
-    
+
     class Django:
         model = XRay  # The model associated with this Document
-        
-        # The fields of the model you want to be indexed in Elasticsearch
+
+        # Model fields mapped automatically; the text fields above are
+        # declared explicitly for their subfields
         fields = [
             'id',
-            'patient_id',
-            'body_part',
             'scan_date',
-            'institution',
-            'description',
-            'diagnosis',
             'created_at',
             'updated_at',
         ]
-        
+
         # Ignore auto updating of Elasticsearch when a model is saved
         # or deleted (default is True):
         ignore_signals = False
-        
+
         # Configure how the index should be refreshed after an update
         auto_refresh = True
-        
+
         # Paginate the django queryset used to populate the index with the specified size
         queryset_pagination = 50
-    
+
     def prepare_tags(self, instance):
-        """Convert tags JSONField to searchable text"""
+        """Index tags JSONField as a list of keywords"""
         if instance.tags and isinstance(instance.tags, list):
-            return ' '.join(instance.tags)
-        return '' 
\ No newline at end of file
+            return [tag for tag in instance.tags if isinstance(tag, str)]
+        return []
@@ -0,0 +1,1742 @@
+"""
+In-process Elasticsearch stand-in for tests, benchmarks and offline work.
+
+The fake plugs in at the HTTP transport layer as an ``elastic_transport``
+node class, so the real ``Elasticsearch``/``AsyncElasticsearch`` clients,
+the bulk and scan helpers, elasticsearch-dsl and django-elasticsearch-dsl
+all run unmodified against it::
+
+    Elasticsearch('http://localhost:9200', node_class=FakeNode)
+
+It implements the subset of the REST API used by this project: index and
+alias management, mappings with multi-fields, ``_bulk``, scroll, the query
+DSL clauses built by the search views (bool, match, multi_match, term,
+terms, range with date math, ...), BM25 scoring, highlighting, terms and
+date_histogram aggregations, completion suggesters and exact kNN search.
+Writes are visible immediately; refresh is a no-op.
+
+This module has no Django dependencies so it can be imported from settings.
+"""
+import copy
+import fnmatch
+import itertools
+import json
+import math
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from elastic_transport import ApiResponseMeta, HttpHeaders
+from elastic_transport._node import BaseNode, NodeApiResponse
+from elastic_transport._node._base_async import BaseAsyncNode
+
+
+# ---------------------------------------------------------------------------
+# Errors
+# ---------------------------------------------------------------------------
+
+class FakeElasticsearchError(Exception):
+    """An error that is returned to the client as an HTTP error response"""
+
+    def __init__(self, status, error_type, reason):
+        super().__init__(reason)
+        self.status = status
+        self.error_type = error_type
+        self.reason = reason
+
+    def to_dict(self):
+        error = {'type': self.error_type, 'reason': self.reason}
+        return {'error': {'root_cause': [error], **error}, 'status': self.status}
+
+
+def index_not_found(name):
+    return FakeElasticsearchError(404, 'index_not_found_exception', f'no such index [{name}]')
+
+
+def bad_request(reason, error_type='illegal_argument_exception'):
+    return FakeElasticsearchError(400, error_type, reason)
+
+
+# ---------------------------------------------------------------------------
+# Analysis
+# ---------------------------------------------------------------------------
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+ENGLISH_STOPWORDS = frozenset(
+    'a an and are as at be but by for if in into is it no not of on or such '
+    'that the their then there these they this to was will with'.split()
+)
+
+
+def english_stem(token):
+    """A light English stemmer, close enough to Lucene's for matching"""
+    if len(token) <= 3:
+        return token
+    for suffix, replacement in (('ies', 'y'), ('sses', 'ss'), ('ing', ''), ('ed', '')):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)] + replacement
+    if token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def analyze(text, analyzer='standard'):
+    """Return the tokens an analyzer produces for a value"""
+    if text is None:
+        return []
+    text = str(text)
+    if analyzer == 'keyword':
+        return [text]
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    if analyzer == 'english':
+        tokens = [english_stem(token) for token in tokens if token not in ENGLISH_STOPWORDS]
+    return tokens
+
+
+def levenshtein(a, b, limit=None):
+    """Edit distance between two strings, optionally capped at ``limit + 1``"""
+    if a == b:
+        return 0
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def max_edits(fuzziness, term):
+    """Translate a fuzziness setting into allowed edits for a term"""
+    if fuzziness in (None, 0, '0'):
+        return 0
+    if str(fuzziness).upper().startswith('AUTO'):
+        if len(term) <= 2:
+            return 0
+        return 1 if len(term) <= 5 else 2
+    return int(fuzziness)
+
+
+# ---------------------------------------------------------------------------
+# Dates
+# ---------------------------------------------------------------------------
+
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}([T ][\d:.]+(Z|[+-]\d{2}:?\d{2})?)?$')
+DATE_MATH_PATTERN = re.compile(r'([+-]\d+|/)([yMwdhms])')
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def parse_datetime(value):
+    """Parse an indexed date value into an aware UTC datetime"""
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, date):
+        parsed = datetime(value.year, value.month, value.day)
+    elif isinstance(value, (int, float)):
+        return EPOCH + timedelta(milliseconds=value)
+    else:
+        text = str(value).strip()
+        if text.endswith('Z'):
+            text = text[:-1] + '+00:00'
+        parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def to_millis(value):
+    return int((value - EPOCH).total_seconds() * 1000)
+
+
+def format_datetime(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%S.') + '%03dZ' % (value.microsecond // 1000)
+
+
+def add_months(value, months):
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    return value.replace(year=year, month=month_index % 12 + 1, day=1)
+
+
+def round_down(value, unit):
+    """Round a datetime down to the start of a calendar unit"""
+    if unit == 'y':
+        return value.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    if unit == 'q':
+        month = (value.month - 1) // 3 * 3 + 1
+        return value.replace(month=month, day=1, hour=0, minute=0, second=0, microsecond=0)
+    if unit == 'M':
+        return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if unit == 'w':
+        start = value - timedelta(days=value.weekday())
+        return start.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == 'd':
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == 'h':
+        return value.replace(minute=0, second=0, microsecond=0)
+    if unit == 'm':
+        return value.replace(second=0, microsecond=0)
+    return value.replace(microsecond=0)
+
+
+def add_unit(value, amount, unit):
+    if unit == 'y':
+        return add_months(value, 12 * amount).replace(day=value.day) if amount else value
+    if unit == 'q':
+        return add_unit(value, 3 * amount, 'M')
+    if unit == 'M':
+        day = value.day
+        shifted = add_months(value, amount)
+        try:
+            return shifted.replace(day=day)
+        except ValueError:
+            return add_months(shifted, 1) - timedelta(days=1)
+    seconds = {'w': 604800, 'd': 86400, 'h': 3600, 'm': 60, 's': 1}[unit]
+    return value + timedelta(seconds=seconds * amount)
+
+
+def parse_date_math(expression, round_up=False):
+    """
+    Evaluate ``now-30d/d`` or ``2024-01-01||/M`` style date math.
+
+    Rounding goes down to the start of the unit, or to the last millisecond
+    of the unit when ``round_up`` is set (used by ``gt`` and ``lte``).
+    """
+    if isinstance(expression, (int, float, date)):
+        return parse_datetime(expression)
+    text = str(expression)
+    if text.startswith('now'):
+        anchor, math_part = datetime.now(timezone.utc), text[3:]
+    elif '||' in text:
+        anchor_text, math_part = text.split('||', 1)
+        anchor = parse_datetime(anchor_text)
+    else:
+        return parse_datetime(text)
+
+    value = anchor
+    for operator, unit in DATE_MATH_PATTERN.findall(math_part):
+        if operator == '/':
+            value = round_down(value, unit)
+            if round_up:
+                value = add_unit(value, 1, unit) - timedelta(milliseconds=1)
+        else:
+            value = add_unit(value, int(operator), unit)
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Mappings
+# ---------------------------------------------------------------------------
+
+class FieldInfo:
+    """Resolved mapping of a (possibly multi-) field path"""
+
+    def __init__(self, path, source_path, mapping):
+        self.path = path
+        self.source_path = source_path
+        self.type = mapping.get('type', 'object')
+        self.analyzer = mapping.get('search_analyzer') or mapping.get('analyzer', 'standard')
+        self.mapping = mapping
+
+    @property
+    def is_text(self):
+        return self.type in ('text', 'match_only_text', 'search_as_you_type')
+
+    @property
+    def is_date(self):
+        return self.type in ('date', 'date_nanos')
+
+    @property
+    def is_numeric(self):
+        return self.type in (
+            'long', 'integer', 'short', 'byte', 'double', 'float',
+            'half_float', 'scaled_float', 'unsigned_long',
+        )
+
+    def tokens(self, value):
+        if self.is_text:
+            return analyze(value, self.analyzer)
+        if self.type == 'completion':
+            return [str(value).lower()]
+        return [self.normalize(value)]
+
+    def normalize(self, value):
+        """Bring a value into the comparable form used for this field"""
+        if value is None:
+            return None
+        if self.is_date:
+            return parse_datetime(value)
+        if self.is_numeric:
+            return float(value)
+        if self.type == 'boolean':
+            return value in (True, 'true')
+        return value if isinstance(value, str) else json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+
+
+def dynamic_mapping(value):
+    """Mapping Elasticsearch would infer for a new field"""
+    if isinstance(value, bool):
+        return {'type': 'boolean'}
+    if isinstance(value, int):
+        return {'type': 'long'}
+    if isinstance(value, float):
+        return {'type': 'float'}
+    if isinstance(value, dict):
+        return {'properties': {}}
+    if isinstance(value, str) and DATE_PATTERN.match(value):
+        return {'type': 'date'}
+    return {'type': 'text', 'fields': {'keyword': {'type': 'keyword', 'ignore_above': 256}}}
+
+
+def get_source_values(source, path):
+    """Return the flattened list of values at a dotted source path"""
+    values = [source]
+    for part in path.split('.'):
+        next_values = []
+        for value in values:
+            if isinstance(value, dict) and part in value:
+                item = value[part]
+                if isinstance(item, list):
+                    next_values.extend(item)
+                else:
+                    next_values.append(item)
+        values = next_values
+    return [value for value in values if value is not None]
+
+
+# ---------------------------------------------------------------------------
+# Indices
+# ---------------------------------------------------------------------------
+
+class FakeIndex:
+    def __init__(self, name, settings=None, mappings=None):
+        self.name = name
+        self.settings = flatten_settings(settings or {})
+        self.mappings = copy.deepcopy(mappings or {})
+        self.mappings.setdefault('properties', {})
+        self.aliases = {}
+        self.docs = {}
+        self.versions = {}
+        self.created = time.time()
+
+    # -- mappings ----------------------------------------------------------
+
+    def field(self, path):
+        """Resolve a field path such as ``body_part.raw`` against the mapping"""
+        parts = path.split('.')
+        properties = self.mappings['properties']
+        source_parts = []
+        mapping = None
+        index = 0
+        while index < len(parts):
+            part = parts[index]
+            if mapping is not None and 'fields' in mapping and part in mapping['fields']:
+                # Multi-field: same source value, different mapping
+                mapping = mapping['fields'][part]
+                index += 1
+                continue
+            if properties is None or part not in properties:
+                return None
+            mapping = properties[part]
+            properties = mapping.get('properties')
+            source_parts.append(part)
+            index += 1
+        if mapping is None:
+            return None
+        return FieldInfo(path, '.'.join(source_parts), mapping)
+
+    def update_dynamic_mapping(self, source, properties=None):
+        properties = self.mappings['properties'] if properties is None else properties
+        if self.mappings.get('dynamic') in (False, 'false'):
+            return
+        for key, value in source.items():
+            sample = value[0] if isinstance(value, list) and value else value
+            if sample is None or (isinstance(value, list) and not value):
+                continue
+            if key not in properties:
+                properties[key] = dynamic_mapping(sample)
+            if isinstance(sample, dict):
+                self.update_dynamic_mapping(sample, properties[key].setdefault('properties', {}))
+
+    def put_mapping(self, body):
+        for key, value in body.items():
+            if key == 'properties':
+                self.mappings['properties'].update(copy.deepcopy(value))
+            else:
+                self.mappings[key] = copy.deepcopy(value)
+
+    # -- documents ---------------------------------------------------------
+
+    def put(self, doc_id, source):
+        self.update_dynamic_mapping(source)
+        created = doc_id not in self.docs
+        self.docs[doc_id] = source
+        self.versions[doc_id] = self.versions.get(doc_id, 0) + 1
+        return 'created' if created else 'updated'
+
+    def to_dict(self):
+        return {
+            'aliases': copy.deepcopy(self.aliases),
+            'mappings': copy.deepcopy(self.mappings),
+            'settings': {'index': unflatten_settings(self.settings)},
+        }
+
+
+def flatten_settings(settings, prefix=''):
+    """Flatten nested settings into ``index.``-less dotted keys"""
+    flat = {}
+    for key, value in settings.items():
+        full_key = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten_settings(value, f'{full_key}.'))
+        else:
+            flat[full_key[6:] if full_key.startswith('index.') else full_key] = value
+    return flat
+
+
+def unflatten_settings(flat):
+    nested = {}
+    for key, value in flat.items():
+        target = nested
+        parts = key.split('.')
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value if isinstance(value, (list, dict)) else str(value)
+    return nested
+
+
+# ---------------------------------------------------------------------------
+# Query evaluation
+# ---------------------------------------------------------------------------
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class SearchContext:
+    """Per-request state: the target indices and memoized field statistics"""
+
+    def __init__(self, indices):
+        self.indices = indices
+        self.docs = [
+            (index, doc_id, source)
+            for index in indices
+            for doc_id, source in index.docs.items()
+        ]
+        self._token_cache = {}
+        self._stats = {}
+
+    def field(self, index, path):
+        return index.field(path)
+
+    def doc_tokens(self, index, doc_id, source, field):
+        key = (index.name, doc_id, field.path)
+        tokens = self._token_cache.get(key)
+        if tokens is None:
+            tokens = []
+            for value in get_source_values(source, field.source_path):
+                tokens.extend(field.tokens(value))
+            self._token_cache[key] = tokens
+        return tokens
+
+    def field_stats(self, index, field):
+        """Return (doc count, average length, document frequency) for a field"""
+        key = (index.name, field.path)
+        stats = self._stats.get(key)
+        if stats is None:
+            doc_count = 0
+            total_length = 0
+            frequencies = {}
+            for doc_id, source in index.docs.items():
+                tokens = self.doc_tokens(index, doc_id, source, field)
+                if not tokens:
+                    continue
+                doc_count += 1
+                total_length += len(tokens)
+                for token in set(tokens):
+                    frequencies[token] = frequencies.get(token, 0) + 1
+            average = total_length / doc_count if doc_count else 0
+            stats = (doc_count, average, frequencies)
+            self._stats[key] = stats
+        return stats
+
+    def bm25(self, index, doc_id, source, field, token, boost=1.0):
+        tokens = self.doc_tokens(index, doc_id, source, field)
+        tf = tokens.count(token)
+        if not tf:
+            return 0.0
+        doc_count, average, frequencies = self.field_stats(index, field)
+        df = frequencies.get(token, 0)
+        idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+        if not field.is_text:
+            return boost * idf
+        length_norm = 1 - BM25_B + BM25_B * len(tokens) / (average or 1)
+        return boost * idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * length_norm)
+
+
+def single_field_clause(clause, query_type):
+    """Split ``{field: value}`` or ``{field: {...}}`` into field and options"""
+    options = {key: value for key, value in clause.items() if key not in ('boost', '_name')}
+    if len(options) != 1:
+        raise bad_request(f'[{query_type}] query malformed, expected a single field')
+    field, value = next(iter(options.items()))
+    if not isinstance(value, dict):
+        value = {'value' if query_type in ('term', 'prefix') else 'query': value}
+    boost = float(value.get('boost', clause.get('boost', 1.0)))
+    return field, value, boost
+
+
+class QueryEvaluator:
+    """Evaluates a query DSL clause against single documents"""
+
+    def __init__(self, context):
+        self.context = context
+
+    def evaluate(self, query, index, doc_id, source, scoring=True):
+        """Return ``(matches, score)`` for one document"""
+        if not query:
+            return True, 1.0
+        if len(query) != 1:
+            raise bad_request(f'query malformed, found {len(query)} clauses in one object', 'parsing_exception')
+        query_type, clause = next(iter(query.items()))
+        handler = getattr(self, f'q_{query_type}', None)
+        if handler is None:
+            raise bad_request(f'unknown query [{query_type}]', 'parsing_exception')
+        matches, score = handler(clause or {}, index, doc_id, source, scoring)
+        return matches, (score if scoring else 0.0)
+
+    # -- compound ----------------------------------------------------------
+
+    def q_match_all(self, clause, index, doc_id, source, scoring):
+        return True, float(clause.get('boost', 1.0))
+
+    def q_match_none(self, clause, index, doc_id, source, scoring):
+        return False, 0.0
+
+    def q_bool(self, clause, index, doc_id, source, scoring):
+        def as_list(value):
+            if value is None:
+                return []
+            return value if isinstance(value, list) else [value]
+
+        score = 0.0
+        for sub_query in as_list(clause.get('must')):
+            matches, sub_score = self.evaluate(sub_query, index, doc_id, source, scoring)
+            if not matches:
+                return False, 0.0
+            score += sub_score
+        for sub_query in as_list(clause.get('filter')):
+            if not self.evaluate(sub_query, index, doc_id, source, False)[0]:
+                return False, 0.0
+        for sub_query in as_list(clause.get('must_not')):
+            if self.evaluate(sub_query, index, doc_id, source, False)[0]:
+                return False, 0.0
+
+        should = as_list(clause.get('should'))
+        matched_should = 0
+        for sub_query in should:
+            matches, sub_score = self.evaluate(sub_query, index, doc_id, source, scoring)
+            if matches:
+                matched_should += 1
+                score += sub_score
+
+        minimum = clause.get('minimum_should_match')
+        if minimum is None:
+            minimum = 0 if (clause.get('must') or clause.get('filter')) else (1 if should else 0)
+        elif isinstance(minimum, str) and minimum.endswith('%'):
+            minimum = math.floor(len(should) * int(minimum[:-1]) / 100)
+        if matched_should < int(minimum):
+            return False, 0.0
+        return True, score * float(clause.get('boost', 1.0))
+
+    def q_constant_score(self, clause, index, doc_id, source, scoring):
+        matches, _ = self.evaluate(clause.get('filter', {}), index, doc_id, source, False)
+        return matches, float(clause.get('boost', 1.0)) if matches else 0.0
+
+    def q_dis_max(self, clause, index, doc_id, source, scoring):
+        scores = []
+        for sub_query in clause.get('queries', []):
+            matches, score = self.evaluate(sub_query, index, doc_id, source, scoring)
+            if matches:
+                scores.append(score)
+        if not scores:
+            return False, 0.0
+        tie_breaker = float(clause.get('tie_breaker', 0.0))
+        best = max(scores)
+        return True, best + tie_breaker * (sum(scores) - best)
+
+    # -- full text ---------------------------------------------------------
+
+    def match_tokens(self, field, query_tokens, operator, fuzziness, index, doc_id, source, boost):
+        doc_tokens = self.context.doc_tokens(index, doc_id, source, field)
+        if not doc_tokens:
+            return False, 0.0
+        matched = 0
+        score = 0.0
+        for token in query_tokens:
+            edits = max_edits(fuzziness, token) if isinstance(token, str) else 0
+            if token in doc_tokens:
+                best = token
+            elif edits:
+                best = None
+                for candidate in set(doc_tokens):
+                    if isinstance(candidate, str) and levenshtein(token, candidate, edits) <= edits:
+                        best = candidate
+                        break
+            else:
+                best = None
+            if best is not None:
+                matched += 1
+                factor = 1.0 if best == token else 0.5
+                score += factor * self.context.bm25(index, doc_id, source, field, best, boost)
+        if not query_tokens:
+            return False, 0.0
+        if operator == 'and' and matched < len(query_tokens):
+            return False, 0.0
+        return matched > 0, score
+
+    def q_match(self, clause, index, doc_id, source, scoring):
+        path, options, boost = single_field_clause(clause, 'match')
+        field = index.field(path)
+        if field is None:
+            return False, 0.0
+        query_tokens = self.query_tokens(field, options.get('query'), options.get('analyzer'))
+        return self.match_tokens(
+            field, query_tokens, str(options.get('operator', 'or')).lower(),
+            options.get('fuzziness'), index, doc_id, source, boost,
+        )
+
+    def q_match_phrase(self, clause, index, doc_id, source, scoring):
+        path, options, boost = single_field_clause(clause, 'match_phrase')
+        field = index.field(path)
+        if field is None:
+            return False, 0.0
+        query_tokens = self.query_tokens(field, options.get('query'), options.get('analyzer'))
+        doc_tokens = self.context.doc_tokens(index, doc_id, source, field)
+        size = len(query_tokens)
+        for start in range(len(doc_tokens) - size + 1):
+            if doc_tokens[start:start + size] == query_tokens:
+                score = sum(self.context.bm25(index, doc_id, source, field, t, boost) for t in query_tokens)
+                return True, score
+        return False, 0.0
+
+    def q_multi_match(self, clause, index, doc_id, source, scoring):
+        query = clause.get('query')
+        fields = clause.get('fields') or ['*']
+        match_type = clause.get('type', 'best_fields')
+        operator = str(clause.get('operator', 'or')).lower()
+        scores = []
+        for spec in fields:
+            path, _, boost = spec.partition('^')
+            boost = float(boost or 1.0) * float(clause.get('boost', 1.0))
+            paths = [path]
+            if '*' in path:
+                paths = [name for name in index.mappings['properties'] if fnmatch.fnmatch(name, path)]
+            for field_path in paths:
+                field = index.field(field_path)
+                if field is None:
+                    continue
+                tokens = self.query_tokens(field, query, clause.get('analyzer'))
+                matches, score = self.match_tokens(
+                    field, tokens, operator, clause.get('fuzziness'), index, doc_id, source, boost,
+                )
+                if matches:
+                    scores.append(score)
+        if not scores:
+            return False, 0.0
+        if match_type == 'most_fields':
+            return True, sum(scores)
+        tie_breaker = float(clause.get('tie_breaker', 0.0))
+        best = max(scores)
+        return True, best + tie_breaker * (sum(scores) - best)
+
+    def query_tokens(self, field, query, analyzer=None):
+        if field.is_text:
+            return analyze(query, analyzer or field.analyzer)
+        return [field.normalize(query)]
+
+    # -- term level --------------------------------------------------------
+
+    def doc_values(self, field, source):
+        return [field.normalize(value) for value in get_source_values(source, field.source_path)]
+
+    def term_matches(self, field, value, index, doc_id, source, case_insensitive=False):
+        if field.is_text:
+            return str(value) in self.context.doc_tokens(index, doc_id, source, field)
+        target = field.normalize(value)
+        values = self.doc_values(field, source)
+        if case_insensitive and isinstance(target, str):
+            return target.lower() in [v.lower() for v in values if isinstance(v, str)]
+        return target in values
+
+    def q_term(self, clause, index, doc_id, source, scoring):
+        path, options, boost = single_field_clause(clause, 'term')
+        field = index.field(path)
+        if field is None:
+            return False, 0.0
+        value = options.get('value')
+        if not self.term_matches(field, value, index, doc_id, source, options.get('case_insensitive')):
+            return False, 0.0
+        token = value if field.is_text else field.normalize(value)
+        return True, (self.context.bm25(index, doc_id, source, field, token, boost) if scoring else 0.0)
+
+    def q_terms(self, clause, index, doc_id, source, scoring):
+        options = {key: value for key, value in clause.items() if key != 'boost'}
+        path, values = next(iter(options.items()))
+        field = index.field(path)
+        if field is None:
+            return False, 0.0
+        matches = any(self.term_matches(field, value, index, doc_id, source) for value in values)
+        return matches, float(clause.get('boost', 1.0)) if matches else 0.0
+
+    def q_ids(self, clause, index, doc_id, source, scoring):
+        matches = doc_id in {str(value) for value in clause.get('values', [])}
+        return matches, 1.0 if matches else 0.0
+
+    def q_exists(self, clause, index, doc_id, source, scoring):
+        field = index.field(clause['field'])
+        matches = field is not None and bool(get_source_values(source, field.source_path))
+        return matches, 1.0 if matches else 0.0
+
+    def q_prefix(self, clause, index, doc_id, source, scoring):
+        path, options, boost = single_field_clause(clause, 'prefix')
+        field = index.field(path)
+        if field is None:
+            return False, 0.0
+        prefix = str(options.get('value'))
+        if field.is_text:
+            candidates = self.context.doc_tokens(index, doc_id, source, field)
+            prefix = prefix.lower()
+        else:
+            candidates = [str(value) for value in self.doc_values(field, source)]
+        matches = any(str(candidate).startswith(prefix) for candidate in candidates)
+        return matches, boost if matches else 0.0
+
+    def q_range(self, clause, index, doc_id, source, scoring):
+        path, options = next(iter(clause.items()))
+        field = index.field(path)
+        if field is None:
+            return False, 0.0
+
+        def bound(key):
+            value = options.get(key)
+            if value is None:
+                return None
+            if field.is_date:
+                return parse_date_math(value, round_up=key in ('gt', 'lte'))
+            return field.normalize(value)
+
+        gte, gt, lte, lt = bound('gte'), bound('gt'), bound('lte'), bound('lt')
+        for value in self.doc_values(field, source):
+            if gte is not None and not value >= gte:
+                continue
+            if gt is not None and not value > gt:
+                continue
+            if lte is not None and not value <= lte:
+                continue
+            if lt is not None and not value < lt:
+                continue
+            return True, float(options.get('boost', 1.0))
+        return False, 0.0
+
+
+# ---------------------------------------------------------------------------
+# Sorting, highlighting, aggregations, suggestions
+# ---------------------------------------------------------------------------
+
+def sort_specs(sort):
+    """Normalize the ``sort`` body parameter into (field, order, missing)"""
+    if sort is None:
+        return []
+    if not isinstance(sort, list):
+        sort = [sort]
+    specs = []
+    for item in sort:
+        if isinstance(item, str):
+            field, _, order = item.partition(':')
+            specs.append((field, order or ('desc' if field == '_score' else 'asc'), '_last'))
+        else:
+            field, options = next(iter(item.items()))
+            if isinstance(options, str):
+                options = {'order': options}
+            order = options.get('order', 'desc' if field == '_score' else 'asc')
+            specs.append((field, order, options.get('missing', '_last')))
+    return specs
+
+
+class Descending:
+    """Wrapper that inverts comparison for descending sort keys"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def sort_value(value):
+    if isinstance(value, datetime):
+        return to_millis(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def document_sort_values(index, source, score, position, specs):
+    """Return the per-spec sort values of a document; None when missing"""
+    values = []
+    for field_path, order, _ in specs:
+        if field_path == '_score':
+            values.append(score)
+            continue
+        if field_path == '_doc':
+            values.append(position)
+            continue
+        field = index.field(field_path)
+        if field is not None and field.is_text:
+            raise bad_request(
+                f'Text fields are not optimised for operations that require '
+                f'per-document field data like aggregations and sorting [{field_path}]'
+            )
+        field_values = [] if field is None else [
+            sort_value(field.normalize(value)) for value in get_source_values(source, field.source_path)
+        ]
+        if not field_values:
+            values.append(None)
+        else:
+            values.append(max(field_values) if order == 'desc' else min(field_values))
+    return values
+
+
+def collect_highlight_terms(query, field_path, terms):
+    """Gather the query terms that apply to a highlighted field"""
+    if isinstance(query, list):
+        for item in query:
+            collect_highlight_terms(item, field_path, terms)
+        return
+    if not isinstance(query, dict):
+        return
+    for query_type, clause in query.items():
+        if query_type in ('match', 'match_phrase', 'term', 'prefix'):
+            for path, value in clause.items():
+                if path == 'boost':
+                    continue
+                if isinstance(value, dict):
+                    value = value.get('query', value.get('value'))
+                if path == field_path or path.split('.')[0] == field_path.split('.')[0]:
+                    terms.extend(analyze(value))
+        elif query_type == 'multi_match':
+            paths = [spec.partition('^')[0] for spec in clause.get('fields', [])]
+            if field_path in paths or any(p.split('.')[0] == field_path.split('.')[0] for p in paths):
+                terms.extend(analyze(clause.get('query')))
+        elif isinstance(clause, (dict, list)):
+            collect_highlight_terms(clause, field_path, terms)
+
+
+def highlight_hit(highlight, query, index, source):
+    """Build the ``highlight`` section of a hit"""
+    pre_tag = (highlight.get('pre_tags') or ['<em>'])[0]
+    post_tag = (highlight.get('post_tags') or ['</em>'])[0]
+    result = {}
+    for field_path, options in (highlight.get('fields') or {}).items():
+        options = options or {}
+        field = index.field(field_path)
+        if field is None:
+            continue
+        terms = []
+        collect_highlight_terms(query, field_path, terms)
+        if not terms:
+            continue
+        fragment_size = int(options.get('fragment_size', highlight.get('fragment_size', 100)))
+        fragments_max = int(options.get('number_of_fragments', highlight.get('number_of_fragments', 5)))
+
+        def is_hit(word):
+            token = word.lower()
+            return any(
+                token == term or levenshtein(token, term, max_edits('AUTO', term)) <= max_edits('AUTO', term)
+                for term in terms
+            )
+
+        fragments = []
+        for value in get_source_values(source, field.source_path):
+            text = str(value)
+            hits = [m for m in TOKEN_PATTERN.finditer(text) if is_hit(m.group(0))]
+            if not hits:
+                continue
+            start = max(0, hits[0].start() - fragment_size // 4)
+            end = min(len(text), start + fragment_size) if fragment_size else len(text)
+            pieces = []
+            position = start
+            for match in hits:
+                if match.start() < start or match.end() > end:
+                    continue
+                pieces.append(text[position:match.start()])
+                pieces.append(f'{pre_tag}{match.group(0)}{post_tag}')
+                position = match.end()
+            pieces.append(text[position:end])
+            fragments.append(''.join(pieces))
+            if len(fragments) >= fragments_max:
+                break
+        if fragments:
+            result[field_path] = fragments
+    return result
+
+
+CALENDAR_UNITS = {
+    'minute': 'm', '1m': 'm', 'hour': 'h', '1h': 'h', 'day': 'd', '1d': 'd',
+    'week': 'w', '1w': 'w', 'month': 'M', '1M': 'M', 'quarter': 'q', '1q': 'q',
+    'year': 'y', '1y': 'y',
+}
+
+JAVA_DATE_FORMATS = [
+    ('yyyy', '%Y'), ('MM', '%m'), ('dd', '%d'), ('HH', '%H'), ('mm', '%M'), ('ss', '%S'),
+]
+
+
+def format_bucket_date(value, date_format):
+    if not date_format:
+        return format_datetime(value)
+    pattern = date_format
+    for java, python in JAVA_DATE_FORMATS:
+        pattern = pattern.replace(java, python)
+    return value.strftime(pattern)
+
+
+class Aggregator:
+    """Computes the aggregation section of a search response"""
+
+    def __init__(self, context):
+        self.context = context
+
+    def run(self, aggs, docs):
+        return {name: self.aggregate(spec, docs) for name, spec in (aggs or {}).items()}
+
+    def aggregate(self, spec, docs):
+        sub_aggs = spec.get('aggs') or spec.get('aggregations')
+        kinds = [key for key in spec if key not in ('aggs', 'aggregations', 'meta')]
+        if len(kinds) != 1:
+            raise bad_request('aggregation must have exactly one type', 'parsing_exception')
+        kind = kinds[0]
+        handler = getattr(self, f'a_{kind}', None)
+        if handler is None:
+            raise bad_request(f'unknown aggregation type [{kind}]', 'parsing_exception')
+        return handler(spec[kind], docs, sub_aggs)
+
+    def field_values(self, index, source, path):
+        field = index.field(path)
+        if field is None:
+            return field, []
+        if field.is_text:
+            raise bad_request(
+                f'Text fields are not optimised for operations that require per-document '
+                f'field data like aggregations and sorting, so these operations are disabled '
+                f'by default. Please use a keyword field instead. [{path}]'
+            )
+        return field, [field.normalize(value) for value in get_source_values(source, field.source_path)]
+
+    def bucket(self, key, docs, sub_aggs, extra=None):
+        bucket = {'key': key, 'doc_count': len(docs)}
+        if extra:
+            bucket.update(extra)
+        bucket.update(self.run(sub_aggs, docs))
+        return bucket
+
+    def a_terms(self, options, docs, sub_aggs):
+        groups = {}
+        field = None
+        for doc in docs:
+            index, _, source = doc
+            field, values = self.field_values(index, source, options['field'])
+            for value in set(values):
+                groups.setdefault(value, []).append(doc)
+        min_doc_count = int(options.get('min_doc_count', 1))
+        order = options.get('order', {'_count': 'desc'})
+        if isinstance(order, list):
+            order = order[0]
+        order_key, direction = next(iter(order.items()))
+
+        def key_func(item):
+            key, members = item
+            primary = len(members) if order_key == '_count' else sort_value(key)
+            secondary = sort_value(key)
+            if direction == 'desc':
+                return (Descending(primary), secondary)
+            return (primary, secondary)
+
+        ordered = sorted(
+            ((key, members) for key, members in groups.items() if len(members) >= min_doc_count),
+            key=key_func,
+        )
+        size = int(options.get('size', 10))
+        buckets = []
+        for key, members in ordered[:size]:
+            extra = None
+            if field is not None and field.is_date:
+                extra = {'key_as_string': format_datetime(key)}
+                key = to_millis(key)
+            elif isinstance(key, float) and key.is_integer():
+                key = int(key)
+            buckets.append(self.bucket(key, members, sub_aggs, extra))
+        return {
+            'doc_count_error_upper_bound': 0,
+            'sum_other_doc_count': sum(len(members) for _, members in ordered[size:]),
+            'buckets': buckets,
+        }
+
+    def a_date_histogram(self, options, docs, sub_aggs):
+        interval = options.get('calendar_interval') or options.get('interval')
+        unit = CALENDAR_UNITS.get(interval)
+        if unit is None:
+            raise bad_request(f'unsupported calendar interval [{interval}]')
+        groups = {}
+        for doc in docs:
+            index, _, source = doc
+            _, values = self.field_values(index, source, options['field'])
+            for value in {round_down(value, unit) for value in values}:
+                groups.setdefault(value, []).append(doc)
+        min_doc_count = int(options.get('min_doc_count', 0))
+        buckets = []
+        if groups:
+            current, last = min(groups), max(groups)
+            while current <= last:
+                members = groups.get(current, [])
+                if len(members) >= min_doc_count:
+                    extra = {'key_as_string': format_bucket_date(current, options.get('format'))}
+                    buckets.append(self.bucket(to_millis(current), members, sub_aggs, extra))
+                current = add_unit(current, 1, unit)
+        return {'buckets': buckets}
+
+    def a_filter(self, options, docs, sub_aggs):
+        evaluator = QueryEvaluator(self.context)
+        members = [doc for doc in docs if evaluator.evaluate(options, *doc, scoring=False)[0]]
+        return {'doc_count': len(members), **self.run(sub_aggs, members)}
+
+    def metric_values(self, options, docs):
+        values = []
+        for index, _, source in docs:
+            _, field_values = self.field_values(index, source, options['field'])
+            values.extend(field_values)
+        return values
+
+    def a_cardinality(self, options, docs, sub_aggs):
+        return {'value': len(set(self.metric_values(options, docs)))}
+
+    def a_value_count(self, options, docs, sub_aggs):
+        return {'value': len(self.metric_values(options, docs))}
+
+    def a_min(self, options, docs, sub_aggs):
+        values = [sort_value(value) for value in self.metric_values(options, docs)]
+        return {'value': float(min(values)) if values else None}
+
+    def a_max(self, options, docs, sub_aggs):
+        values = [sort_value(value) for value in self.metric_values(options, docs)]
+        return {'value': float(max(values)) if values else None}
+
+
+def vector_similarity(similarity, query_vector, stored_vector):
+    """Score two vectors the way Elasticsearch scores a dense_vector kNN hit"""
+    if len(query_vector) != len(stored_vector):
+        raise bad_request(
+            f'The query vector has a different number of dimensions '
+            f'[{len(query_vector)}] than the document vectors [{len(stored_vector)}].'
+        )
+    dot = sum(a * b for a, b in zip(query_vector, stored_vector))
+    if similarity == 'l2_norm':
+        distance = sum((a - b) ** 2 for a, b in zip(query_vector, stored_vector))
+        return 1 / (1 + distance)
+    if similarity == 'max_inner_product':
+        return 1 / (1 - dot) if dot < 0 else dot + 1
+    if similarity == 'cosine':
+        norms = math.sqrt(sum(a * a for a in query_vector)) * math.sqrt(sum(b * b for b in stored_vector))
+        dot = dot / norms if norms else 0.0
+    return (1 + dot) / 2
+
+
+def knn_search(spec, context, evaluator):
+    """
+    Exact nearest-neighbour search for a top-level ``knn`` clause.
+
+    Returns ``{position: score}`` for the ``k`` best documents that pass the
+    clause's filter. Real clusters search approximately among
+    ``num_candidates``; exact search is the best case of that.
+    """
+    vector = spec['query_vector']
+    k = int(spec.get('k', 10))
+    boost = float(spec.get('boost', 1.0))
+    filters = spec.get('filter') or []
+    if not isinstance(filters, list):
+        filters = [filters]
+
+    candidates = []
+    for position, (index, doc_id, source) in enumerate(context.docs):
+        field = index.field(spec['field'])
+        if field is None or field.type != 'dense_vector':
+            continue
+        stored = get_source_values(source, field.source_path)
+        if not stored:
+            continue
+        if not all(evaluator.evaluate(query, index, doc_id, source, scoring=False)[0] for query in filters):
+            continue
+        similarity = vector_similarity(field.mapping.get('similarity', 'cosine'), vector, stored)
+        candidates.append((similarity, position))
+
+    candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+    return {position: similarity * boost for similarity, position in candidates[:k]}
+
+
+def completion_score(prefix, candidate, fuzziness):
+    """Score a completion input against a prefix, or None if it doesn't match"""
+    if candidate.startswith(prefix):
+        return 1.0
+    edits = max_edits(fuzziness, prefix)
+    if not edits or not candidate or candidate[0] != prefix[:1]:
+        return None
+    for length in range(max(len(prefix) - edits, 1), len(prefix) + edits + 1):
+        if levenshtein(prefix, candidate[:length], edits) <= edits:
+            return 0.5
+    return None
+
+
+def run_suggesters(suggest, context):
+    results = {}
+    global_text = suggest.get('text')
+    for name, spec in suggest.items():
+        if name == 'text':
+            continue
+        text = spec.get('prefix', spec.get('text', global_text)) or ''
+        completion = spec.get('completion')
+        if completion is None:
+            raise bad_request(f'unsupported suggester for [{name}]')
+        fuzzy = completion.get('fuzzy')
+        fuzziness = None
+        if fuzzy:
+            fuzziness = fuzzy.get('fuzziness', 'AUTO') if isinstance(fuzzy, dict) else 'AUTO'
+        prefix = text.lower()
+
+        options = []
+        for index, doc_id, source in context.docs:
+            field = index.field(completion['field'])
+            if field is None or field.type != 'completion':
+                continue
+            best = None
+            for value in get_source_values(source, field.source_path):
+                inputs = value.get('input', []) if isinstance(value, dict) else [value]
+                for candidate in inputs if isinstance(inputs, list) else [inputs]:
+                    score = completion_score(prefix, str(candidate).lower(), fuzziness)
+                    if score is not None and (best is None or score > best[0]):
+                        best = (score, str(candidate))
+            if best is not None:
+                options.append({
+                    'text': best[1],
+                    '_index': index.name,
+                    '_id': doc_id,
+                    '_score': best[0],
+                    '_source': source,
+                })
+
+        options.sort(key=lambda option: (-option['_score'], option['text'], option['_id']))
+        if completion.get('skip_duplicates'):
+            seen = set()
+            unique = []
+            for option in options:
+                if option['text'] not in seen:
+                    seen.add(option['text'])
+                    unique.append(option)
+            options = unique
+        results[name] = [{
+            'text': text,
+            'offset': 0,
+            'length': len(text),
+            'options': options[:int(completion.get('size', 5))],
+        }]
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Cluster
+# ---------------------------------------------------------------------------
+
+class FakeCluster:
+    """In-memory cluster state shared by every fake node in the process"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """Drop all indices, aliases and scroll contexts"""
+        with self.lock:
+            self.indices = {}
+            self.scrolls = {}
+            self.request_counts = {}
+            self._scroll_ids = itertools.count(1)
+
+    # -- name resolution ---------------------------------------------------
+
+    def aliases(self):
+        result = {}
+        for index in self.indices.values():
+            for alias in index.aliases:
+                result.setdefault(alias, []).append(index)
+        return result
+
+    def resolve(self, expression, ignore_unavailable=False):
+        """Resolve an index expression (names, aliases, wildcards) to indices"""
+        if expression in (None, '', '_all', '*'):
+            return list(self.indices.values())
+        names = expression if isinstance(expression, list) else str(expression).split(',')
+        aliases = self.aliases()
+        resolved = []
+        for name in names:
+            if '*' in name:
+                resolved.extend(
+                    index for index_name, index in sorted(self.indices.items())
+                    if fnmatch.fnmatch(index_name, name)
+                )
+                for alias, targets in aliases.items():
+                    if fnmatch.fnmatch(alias, name):
+                        resolved.extend(targets)
+            elif name in self.indices:
+                resolved.append(self.indices[name])
+            elif name in aliases:
+                resolved.extend(aliases[name])
+            elif not ignore_unavailable:
+                raise index_not_found(name)
+        unique = []
+        for index in resolved:
+            if index not in unique:
+                unique.append(index)
+        return unique
+
+    def write_index(self, name):
+        """Return the index a write to ``name`` goes to, creating it if needed"""
+        if name in self.indices:
+            return self.indices[name]
+        targets = self.aliases().get(name)
+        if targets:
+            if len(targets) == 1:
+                return targets[0]
+            for index in targets:
+                if index.aliases[name].get('is_write_index'):
+                    return index
+            raise bad_request(
+                f'no write index is defined for alias [{name}]. The write index may be '
+                f'explicitly disabled using is_write_index=false or the alias points to '
+                f'multiple indices without one being designated as a write index'
+            )
+        # action.auto_create_index defaults to true
+        index = FakeIndex(name)
+        self.indices[name] = index
+        return index
+
+    # -- request dispatch --------------------------------------------------
+
+    def handle(self, method, path, params, body):
+        """Dispatch a REST request; returns ``(status, payload)``"""
+        parts = [unquote(part) for part in path.strip('/').split('/') if part]
+        with self.lock:
+            endpoint = parts[-1] if parts else ''
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+            try:
+                return self.route(method, parts, params, body)
+            except FakeElasticsearchError as e:
+                return e.status, e.to_dict()
+
+    def route(self, method, parts, params, body):
+        if not parts:
+            return 200, {
+                'name': 'fake-node',
+                'cluster_name': 'fake-elasticsearch',
+                'version': {'number': '8.11.0', 'build_flavor': 'default'},
+                'tagline': 'You Know, for Search',
+            }
+        first = parts[0]
+        if first == '_bulk':
+            return self.bulk(None, params, body)
+        if first == '_aliases':
+            return self.update_aliases(body)
+        if first == '_alias':
+            return self.get_alias(None, parts[1] if len(parts) > 1 else None, method)
+        if first == '_search' and len(parts) > 1 and parts[1] == 'scroll':
+            return self.scroll(method, params, body)
+        if first in ('_search', '_count', '_refresh', '_mapping'):
+            return self.route(method, ['_all'] + parts, params, body)
+
+        target = first
+        if len(parts) == 1:
+            if method == 'PUT':
+                return self.create_index(target, body)
+            if method == 'DELETE':
+                return self.delete_index(target, params)
+            if method == 'HEAD':
+                found = self.resolve(target, ignore_unavailable=True)
+                return (200 if found else 404), None
+            if method == 'GET':
+                indices = self.resolve(target, ignore_unavailable=params.get('ignore_unavailable') == 'true' or '*' in target)
+                return 200, {index.name: index.to_dict() for index in indices}
+
+        action = parts[1]
+        if action == '_search':
+            return self.search(target, params, body)
+        if action == '_count':
+            return self.count(target, body)
+        if action == '_bulk':
+            return self.bulk(target, params, body)
+        if action == '_refresh':
+            self.resolve(target, ignore_unavailable=True)
+            return 200, {'_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+        if action == '_settings':
+            return self.settings(method, target, body)
+        if action == '_mapping':
+            return self.mapping(method, target, body)
+        if action == '_alias':
+            return self.get_alias(target, parts[2] if len(parts) > 2 else None, method)
+        if action in ('_doc', '_create') and len(parts) == 3:
+            return self.document(method, target, parts[2], params, body, create=action == '_create')
+        if action == '_update' and len(parts) == 3:
+            return self.update_document(target, parts[2], body)
+        raise bad_request(f'no handler found for uri [/{"/".join(parts)}] and method [{method}]')
+
+    # -- index management --------------------------------------------------
+
+    def create_index(self, name, body):
+        if name in self.indices or name in self.aliases():
+            raise FakeElasticsearchError(
+                400, 'resource_already_exists_exception', f'index [{name}] already exists'
+            )
+        body = body or {}
+        index = FakeIndex(name, body.get('settings'), body.get('mappings'))
+        for alias, options in (body.get('aliases') or {}).items():
+            index.aliases[alias] = options or {}
+        self.indices[name] = index
+        return 200, {'acknowledged': True, 'shards_acknowledged': True, 'index': name}
+
+    def delete_index(self, expression, params):
+        if expression in self.aliases() and expression not in self.indices:
+            raise bad_request(
+                f'The provided expression [{expression}] matches an alias, specify the '
+                f'corresponding concrete indices instead.'
+            )
+        indices = self.resolve(expression, ignore_unavailable=params.get('ignore_unavailable') == 'true')
+        for index in indices:
+            del self.indices[index.name]
+        return 200, {'acknowledged': True}
+
+    def settings(self, method, target, body):
+        indices = self.resolve(target)
+        if method == 'GET':
+            return 200, {index.name: {'settings': {'index': unflatten_settings(index.settings)}} for index in indices}
+        for index in indices:
+            for key, value in flatten_settings(body or {}).items():
+                if value is None:
+                    index.settings.pop(key, None)
+                else:
+                    index.settings[key] = value
+        return 200, {'acknowledged': True}
+
+    def mapping(self, method, target, body):
+        indices = self.resolve(target)
+        if method == 'GET':
+            return 200, {index.name: {'mappings': copy.deepcopy(index.mappings)} for index in indices}
+        for index in indices:
+            index.put_mapping(body or {})
+        return 200, {'acknowledged': True}
+
+    def get_alias(self, target, name, method):
+        indices = self.resolve(target, ignore_unavailable=True) if target else list(self.indices.values())
+        result = {}
+        for index in indices:
+            matching = {
+                alias: copy.deepcopy(options)
+                for alias, options in index.aliases.items()
+                if name is None or any(fnmatch.fnmatch(alias, pattern) for pattern in name.split(','))
+            }
+            if matching:
+                result[index.name] = {'aliases': matching}
+        if name and not result:
+            if method == 'HEAD':
+                return 404, None
+            return 404, {'error': f'alias [{name}] missing', 'status': 404}
+        return 200, (None if method == 'HEAD' else result)
+
+    def update_aliases(self, body):
+        # Validate against a copy first so the whole request applies atomically
+        staged = {name: dict(index.aliases) for name, index in self.indices.items()}
+        removed = set()
+        for action in (body or {}).get('actions', []):
+            kind, options = next(iter(action.items()))
+            index_names = options.get('indices') or [options.get('index')]
+            alias_names = options.get('aliases') or [options.get('alias')]
+            for index_name in index_names:
+                if index_name not in self.indices or index_name in removed:
+                    raise index_not_found(index_name)
+                if kind == 'remove_index':
+                    removed.add(index_name)
+                    continue
+                for alias in alias_names:
+                    if kind == 'add':
+                        alias_options = {
+                            key: value for key, value in options.items()
+                            if key not in ('index', 'indices', 'alias', 'aliases')
+                        }
+                        staged[index_name][alias] = alias_options
+                    elif kind == 'remove':
+                        if alias not in staged[index_name]:
+                            raise FakeElasticsearchError(
+                                404, 'aliases_not_found_exception', f'aliases [{alias}] missing'
+                            )
+                        del staged[index_name][alias]
+                    else:
+                        raise bad_request(f'unknown alias action [{kind}]')
+        remaining = set(self.indices) - removed
+        for index_name in remaining:
+            for alias in staged[index_name]:
+                if alias in remaining:
+                    raise bad_request(
+                        f'Invalid alias name [{alias}]: an index or data stream exists with the same name as the alias',
+                        'invalid_alias_name_exception',
+                    )
+        for index_name in removed:
+            del self.indices[index_name]
+        for index_name in remaining:
+            self.indices[index_name].aliases = staged[index_name]
+        return 200, {'acknowledged': True, 'errors': False}
+
+    # -- documents ---------------------------------------------------------
+
+    def document(self, method, target, doc_id, params, body, create=False):
+        if method in ('PUT', 'POST'):
+            index = self.write_index(target)
+            if (create or params.get('op_type') == 'create') and doc_id in index.docs:
+                raise FakeElasticsearchError(409, 'version_conflict_engine_exception', f'[{doc_id}]: document already exists')
+            result = index.put(doc_id, body or {})
+            return (201 if result == 'created' else 200), {
+                '_index': index.name, '_id': doc_id, '_version': index.versions[doc_id],
+                'result': result, '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+            }
+        indices = self.resolve(target)
+        for index in indices:
+            if doc_id in index.docs:
+                if method == 'DELETE':
+                    del index.docs[doc_id]
+                    return 200, {'_index': index.name, '_id': doc_id, 'result': 'deleted'}
+                return 200, {
+                    '_index': index.name, '_id': doc_id, '_version': index.versions[doc_id],
+                    'found': True, '_source': index.docs[doc_id],
+                }
+        name = indices[0].name if indices else target
+        if method == 'DELETE':
+            return 404, {'_index': name, '_id': doc_id, 'result': 'not_found'}
+        return 404, {'_index': name, '_id': doc_id, 'found': False}
+
+    def update_document(self, target, doc_id, body):
+        index = self.write_index(target)
+        body = body or {}
+        if doc_id not in index.docs:
+            if body.get('doc_as_upsert'):
+                index.put(doc_id, body.get('doc', {}))
+                return 201, {'_index': index.name, '_id': doc_id, 'result': 'created'}
+            if 'upsert' in body:
+                index.put(doc_id, body['upsert'])
+                return 201, {'_index': index.name, '_id': doc_id, 'result': 'created'}
+            raise FakeElasticsearchError(404, 'document_missing_exception', f'[{doc_id}]: document missing')
+        source = dict(index.docs[doc_id])
+        source.update(body.get('doc', {}))
+        index.put(doc_id, source)
+        return 200, {'_index': index.name, '_id': doc_id, 'result': 'updated'}
+
+    def bulk(self, default_index, params, lines):
+        started = time.monotonic()
+        items = []
+        errors = False
+        lines = list(lines or [])
+        position = 0
+        while position < len(lines):
+            action = lines[position]
+            position += 1
+            op_type, meta = next(iter(action.items()))
+            index_name = meta.get('_index', default_index)
+            doc_id = str(meta['_id']) if meta.get('_id') is not None else None
+            source = None
+            if op_type != 'delete':
+                source = lines[position]
+                position += 1
+            if doc_id is None:
+                doc_id = str(next(self._scroll_ids))
+
+            if op_type in ('index', 'create'):
+                status, response = self.document('PUT', index_name, doc_id, {}, source, create=op_type == 'create') \
+                    if not (op_type == 'create' and self._exists(index_name, doc_id)) else (
+                        409, {'error': {'type': 'version_conflict_engine_exception'}})
+            elif op_type == 'update':
+                try:
+                    status, response = self.update_document(index_name, doc_id, source)
+                except FakeElasticsearchError as e:
+                    status, response = e.status, e.to_dict()
+            elif op_type == 'delete':
+                try:
+                    status, response = self.document('DELETE', index_name, doc_id, {}, None)
+                except FakeElasticsearchError as e:
+                    status, response = e.status, e.to_dict()
+            else:
+                raise bad_request(f'Malformed action/metadata line, unknown action [{op_type}]')
+
+            item = {'_index': response.get('_index', index_name), '_id': doc_id, 'status': status}
+            if 'result' in response:
+                item['result'] = response['result']
+            if status >= 300:
+                errors = errors or status != 404 or op_type != 'delete'
+                if 'error' in response:
+                    item['error'] = response['error']
+            items.append({op_type: item})
+        took = int((time.monotonic() - started) * 1000)
+        return 200, {'took': took, 'errors': errors, 'items': items}
+
+    def _exists(self, index_name, doc_id):
+        try:
+            return any(doc_id in index.docs for index in self.resolve(index_name))
+        except FakeElasticsearchError:
+            return False
+
+    # -- search ------------------------------------------------------------
+
+    def count(self, target, body):
+        indices = self.resolve(target)
+        context = SearchContext(indices)
+        evaluator = QueryEvaluator(context)
+        query = (body or {}).get('query')
+        count = sum(1 for doc in context.docs if evaluator.evaluate(query, *doc, scoring=False)[0])
+        return 200, {'count': count, '_shards': {'total': len(indices), 'successful': len(indices), 'skipped': 0, 'failed': 0}}
+
+    def execute_search(self, target, params, body):
+        started = time.monotonic()
+        body = dict(body or {})
+        indices = self.resolve(target, ignore_unavailable=params.get('ignore_unavailable') == 'true')
+        context = SearchContext(indices)
+        evaluator = QueryEvaluator(context)
+
+        query = body.get('query')
+        specs = sort_specs(body.get('sort', params.get('sort')))
+        track_scores = not specs or any(field == '_score' for field, _, _ in specs) or body.get('track_scores')
+
+        knn = body.get('knn')
+        knn_scores = None
+        if knn:
+            knn_scores = {}
+            for spec in knn if isinstance(knn, list) else [knn]:
+                for position, score in knn_search(spec, context, evaluator).items():
+                    knn_scores[position] = knn_scores.get(position, 0.0) + score
+
+        matched = []
+        for position, doc in enumerate(context.docs):
+            if knn_scores is not None and query is None:
+                # Pure kNN: only the nearest neighbours are hits
+                if position in knn_scores:
+                    matched.append((doc, knn_scores[position], position))
+                continue
+            matches, score = evaluator.evaluate(query, *doc, scoring=bool(track_scores))
+            if knn_scores is not None and position in knn_scores:
+                # Hybrid: the union of both result sets, with scores summed
+                matched.append((doc, (score if matches else 0.0) + knn_scores[position], position))
+            elif matches:
+                matched.append((doc, score, position))
+
+        if specs:
+            sort_values = {
+                position: document_sort_values(index, source, score, position, specs)
+                for (index, _, source), score, position in matched
+            }
+
+            def key_func(item):
+                keys = []
+                for value, (_, order, missing) in zip(sort_values[item[2]], specs):
+                    is_missing = value is None
+                    keys.append(0 if is_missing == (missing == '_first') else 1)
+                    if is_missing:
+                        keys.append(0)
+                    else:
+                        keys.append(Descending(value) if order == 'desc' else value)
+                keys.append(item[2])
+                return keys
+            matched.sort(key=key_func)
+        else:
+            matched.sort(key=lambda item: (-item[1], item[2]))
+
+        offset = int(body.get('from', params.get('from', 0)))
+        size = int(body.get('size', params.get('size', 10)))
+
+        source_filter = body.get('_source', params.get('_source', True))
+        if source_filter == 'false':
+            source_filter = False
+
+        hits = []
+        for (index, doc_id, source), score, position in matched[offset:offset + size]:
+            hit = {'_index': index.name, '_id': doc_id, '_score': score if track_scores else None}
+            if source_filter is not False:
+                hit['_source'] = filter_source(source, source_filter)
+            if body.get('highlight'):
+                highlight = highlight_hit(body['highlight'], query, index, source)
+                if highlight:
+                    hit['highlight'] = highlight
+            if specs:
+                hit['sort'] = sort_values[position]
+            hits.append(hit)
+
+        scores = [score for _, score, _ in matched]
+        response = {
+            'took': 0,
+            'timed_out': False,
+            '_shards': {'total': len(indices), 'successful': len(indices), 'skipped': 0, 'failed': 0},
+            'hits': {
+                'total': {'value': len(matched), 'relation': 'eq'},
+                'max_score': (max(scores) if scores else None) if track_scores else None,
+                'hits': hits,
+            },
+        }
+
+        aggs = body.get('aggs') or body.get('aggregations')
+        if aggs:
+            docs = [doc for doc, _, _ in matched]
+            response['aggregations'] = Aggregator(context).run(aggs, docs)
+        if body.get('suggest'):
+            response['suggest'] = run_suggesters(body['suggest'], context)
+
+        response['took'] = int((time.monotonic() - started) * 1000)
+        return response, [hit for hit in matched[offset + size:]] if 'scroll' in params else None
+
+    def search(self, target, params, body):
+        response, remaining = self.execute_search(target, params, body)
+        if 'scroll' in params:
+            scroll_id = f'fake-scroll-{next(self._scroll_ids)}'
+            size = int((body or {}).get('size', params.get('size', 10)))
+            self.scrolls[scroll_id] = (remaining, size, (body or {}).get('_source', True))
+            response['_scroll_id'] = scroll_id
+        return 200, response
+
+    def scroll(self, method, params, body):
+        body = body or {}
+        scroll_id = body.get('scroll_id') or params.get('scroll_id')
+        if method == 'DELETE':
+            ids = scroll_id if isinstance(scroll_id, list) else [scroll_id]
+            freed = sum(1 for item in ids if self.scrolls.pop(item, None) is not None)
+            return 200, {'succeeded': True, 'num_freed': freed}
+        if scroll_id not in self.scrolls:
+            raise FakeElasticsearchError(404, 'search_context_missing_exception', f'No search context found for id [{scroll_id}]')
+        remaining, size, source_filter = self.scrolls[scroll_id]
+        batch, rest = remaining[:size], remaining[size:]
+        self.scrolls[scroll_id] = (rest, size, source_filter)
+        hits = []
+        for (index, doc_id, source), score, _ in batch:
+            hit = {'_index': index.name, '_id': doc_id, '_score': score}
+            if source_filter is not False:
+                hit['_source'] = filter_source(source, source_filter)
+            hits.append(hit)
+        return 200, {
+            '_scroll_id': scroll_id,
+            'took': 0,
+            'timed_out': False,
+            '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0},
+            'hits': {'total': {'value': len(hits), 'relation': 'eq'}, 'max_score': None, 'hits': hits},
+        }
+
+
+def filter_source(source, source_filter):
+    if source_filter in (True, None, 'true'):
+        return source
+    includes = source_filter
+    excludes = []
+    if isinstance(source_filter, dict):
+        includes = source_filter.get('includes') or source_filter.get('include') or ['*']
+        excludes = source_filter.get('excludes') or source_filter.get('exclude') or []
+    if isinstance(includes, str):
+        includes = includes.split(',')
+    return {
+        key: value for key, value in source.items()
+        if any(fnmatch.fnmatch(key, pattern) for pattern in includes)
+        and not any(fnmatch.fnmatch(key, pattern) for pattern in excludes)
+    }
+
+
+# Shared by every fake node in the process, so sync and async clients, the
+# signal processor and management commands all see the same data.
+cluster = FakeCluster()
+
+
+# ---------------------------------------------------------------------------
+# Transport nodes
+# ---------------------------------------------------------------------------
+
+RESPONSE_HEADERS = {
+    'content-type': 'application/json',
+    'x-elastic-product': 'Elasticsearch',
+}
+
+
+def decode_body(body):
+    if not body:
+        return None
+    text = body.decode('utf-8') if isinstance(body, bytes) else body
+    lines = [line for line in text.split('\n') if line.strip()]
+    if len(lines) > 1:
+        # NDJSON (_bulk)
+        return [json.loads(line) for line in lines]
+    return json.loads(lines[0])
+
+
+def perform(config, method, target):
+    def respond(body):
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        payload = decode_body(body)
+        if url.path.rstrip('/').endswith('_bulk') and isinstance(payload, dict):
+            payload = [payload]
+        started = time.monotonic()
+        status, response = cluster.handle(method, url.path, params, payload)
+        meta = ApiResponseMeta(
+            status=status,
+            http_version='1.1',
+            headers=HttpHeaders(RESPONSE_HEADERS),
+            duration=time.monotonic() - started,
+            node=config,
+        )
+        data = b'' if response is None or method == 'HEAD' else json.dumps(response, default=str).encode('utf-8')
+        return NodeApiResponse(meta, data)
+    return respond
+
+
+class FakeNode(BaseNode):
+    """Synchronous transport node backed by the in-process fake cluster"""
+
+    def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        return perform(self.config, method, target)(body)
+
+
+class FakeAsyncNode(BaseAsyncNode):
+    """Async transport node backed by the in-process fake cluster"""
+
+    async def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        return perform(self.config, method, target)(body)
+
+    async def close(self):
+        pass
+
+
+# Lets code that builds an async client from the sync configuration find
+# the matching async node class
+FakeNode.async_node_class = FakeAsyncNode
@@ -1,89 +1,18 @@
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from elasticsearch_dsl import Q
-from django_elasticsearch_dsl_drf.viewsets import DocumentViewSet
-from django_elasticsearch_dsl_drf.filter_backends import (
-    FilteringFilterBackend,
-    SearchFilterBackend,
-    OrderingFilterBackend,
-    DefaultOrderingFilterBackend,
-    SuggesterFilterBackend,
-)
-from django_elasticsearch_dsl_drf.constants import SUGGESTER_COMPLETION
+from .cache import SEARCH_CACHE_TIMEOUT, STALE_CACHE_TIMEOUT, data_cache_key, get_or_compute
 from .documents import XRayDocument
-from .serializers import XRaySerializer
-
-
-class XRayDocumentViewSet(DocumentViewSet):
-    """
-    Advanced Elasticsearch-powered X-ray search viewset
-    """
-    document = XRayDocument
-    serializer_class = XRaySerializer
-    
-    filter_backends = [
-        FilteringFilterBackend,
-        SearchFilterBackend,
-        OrderingFilterBackend,
-        DefaultOrderingFilterBackend,
-        SuggesterFilterBackend,
-    ]
-    
-    # Define search fields with boosting for relevance
-    search_fields = {
-        'description': {'boost': 2.0},  # Description gets higher weight
-        'description.english': {'boost': 1.5},
-        'diagnosis': {'boost': 3.0},  # Diagnosis gets highest weight
-        'tags': {'boost': 1.8},
-        'patient_id': {'boost': 1.0},
-        'institution': {'boost': 1.2},
-        'body_part': {'boost': 1.5},
-    }
-    
-    # Define filtering fields
-    filter_fields = {
-        'body_part': 'body_part.raw',
-        'diagnosis': 'diagnosis.raw',
-        'institution': 'institution.raw',
-        'scan_date': 'scan_date',
-        'created_at': 'created_at',
-        'patient_id': 'patient_id.raw',
-    }
-    
-    # Define ordering fields
-    ordering_fields = {
-        'scan_date': 'scan_date',
-        'created_at': 'created_at',
-        'patient_id': 'patient_id.raw',
-        'body_part': 'body_part.raw',
-        'diagnosis': 'diagnosis.raw',
-    }
-    
-    # Default ordering
-    ordering = ('-created_at',)
-    
-    # Suggester fields for autocomplete
-    suggester_fields = {
-        'institution_suggest': {
-            'field': 'institution.suggest',
-            'suggesters': [
-                SUGGESTER_COMPLETION,
-            ],
-        },
-        'diagnosis_suggest': {
-            'field': 'diagnosis.suggest',
-            'suggesters': [
-                SUGGESTER_COMPLETION,
-            ],
-        },
-        'tags_suggest': {
-            'field': 'tags.suggest',
-            'suggesters': [
-                SUGGESTER_COMPLETION,
-            ],
-        },
-    }
+from .rollups import monthly_counts, top_values, total_scans
+from .embeddings import compute_embedding
+from .models import XRay
+from .search_queries import (
+    FILTER_PARAMS,
+    aggregation_search,
+    build_hybrid_search,
+    build_xray_search,
+    get_filter_params,
+)
 
 
 @api_view(['GET'])
@@ -101,64 +30,14 @@ def elasticsearch_advanced_search(request):
     
     # Get search parameters
     query = request.GET.get('q', '')
-    body_part = request.GET.get('body_part', '')
-    diagnosis = request.GET.get('diagnosis', '')
-    institution = request.GET.get('institution', '')
-    date_from = request.GET.get('date_from', '')
-    date_to = request.GET.get('date_to', '')
-    tags = request.GET.get('tags', '')
-    
-    # Build Elasticsearch query
-    search = XRayDocument.search()
-    
-    # Main search query with boosting
-    if query:
-        search_query = Q(
-            'multi_match',
-            query=query,
-            fields=[
-                'description^2.0',
-                'description.english^1.5',
-                'diagnosis^3.0',
-                'tags^1.8',
-                'patient_id^1.0',
-                'institution^1.2',
-                'body_part^1.5'
-            ],
-            fuzziness='AUTO',  # Enable fuzzy matching for typos
-            type='best_fields'
-        )
-        search = search.query(search_query)
-    
-    # Apply filters
-    filters = []
-    
-    if body_part:
-        filters.append(Q('term', **{'body_part.raw': body_part}))
-    
-    if diagnosis:
-        filters.append(Q('match', diagnosis=diagnosis))
-    
-    if institution:
-        filters.append(Q('match', institution=institution))
-    
-    if tags:
-        tag_list = [tag.strip() for tag in tags.split(',')]
-        for tag in tag_list:
-            filters.append(Q('match', tags=tag))
-    
-    # Date range filter
-    if date_from or date_to:
-        date_range = {}
-        if date_from:
-            date_range['gte'] = date_from
-        if date_to:
-            date_range['lte'] = date_to
-        filters.append(Q('range', scan_date=date_range))
+    params = get_filter_params(request.GET)
     
-    # Apply all filters
-    if filters:
-        search = search.filter('bool', must=filters)
+    # Build Elasticsearch query: only the text query is scored, every other
+    # constraint runs in filter context so it can be cached
+    try:
+        search = build_xray_search(query, params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
     # Add highlighting for search results
     search = search.highlight_options(
@@ -167,10 +46,10 @@ def elasticsearch_advanced_search(request):
         fragment_size=150,
         number_of_fragments=3
     )
-    search = search.highlight('description', 'diagnosis', 'tags')
+    search = search.highlight('description', 'diagnosis', 'tags.text')
     
     # Execute search
-    try:
+    def run_search():
         response = search[:50].execute()  # Limit to 50 results
         
         # Format results
@@ -187,7 +66,7 @@ def elasticsearch_advanced_search(request):
             
             results.append(result)
         
-        return Response({
+        return {
             'results': results,
             'total': response.hits.total.value,
             'max_score': response.hits.max_score,
@@ -195,15 +74,15 @@ def elasticsearch_advanced_search(request):
             'query': {
                 'q': query,
                 'filters': {
-                    'body_part': body_part,
-                    'diagnosis': diagnosis,
-                    'institution': institution,
-                    'tags': tags,
-                    'date_from': date_from,
-                    'date_to': date_to,
+                    name: params.get(name, '')
+                    for name in FILTER_PARAMS
                 }
             }
-        })
+        }
+    
+    try:
+        key = data_cache_key('advanced_search', query, sorted(params.items()))
+        return Response(get_or_compute(key, run_search, SEARCH_CACHE_TIMEOUT))
         
     except Exception as e:
         return Response({
@@ -212,6 +91,85 @@ def elasticsearch_advanced_search(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+HYBRID_DEFAULT_SIZE = 20
+HYBRID_MAX_SIZE = 100
+
+
+@api_view(['GET', 'POST'])
+def elasticsearch_hybrid_search(request):
+    """
+    Hybrid image similarity + text search
+
+    The reference image is either an uploaded ``image`` (POST, multipart) or
+    a stored scan given by ``like`` (an X-ray id). Its embedding drives a kNN
+    search that is combined with the scored text query ``q`` in a single
+    Elasticsearch request. Also accepts the advanced search filters,
+    ``size``, and ``image_boost``/``text_boost`` to weight the two scores.
+    """
+    params_source = request.data if request.method == 'POST' else request.GET
+    query = params_source.get('q', '')
+    params = get_filter_params(params_source)
+
+    try:
+        size = min(max(int(params_source.get('size', HYBRID_DEFAULT_SIZE)), 1), HYBRID_MAX_SIZE)
+        image_boost = float(params_source.get('image_boost', 1.0))
+        text_boost = float(params_source.get('text_boost', 1.0))
+    except ValueError:
+        return Response(
+            {'error': 'size, image_boost and text_boost must be numbers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    exclude_id = None
+    if 'image' in request.FILES:
+        vector = compute_embedding(request.FILES['image'])
+        if vector is None:
+            return Response({'error': 'Could not read the uploaded image'}, status=status.HTTP_400_BAD_REQUEST)
+    elif params_source.get('like'):
+        try:
+            exclude_id = int(params_source['like'])
+        except ValueError:
+            return Response({'error': 'like must be an X-ray id'}, status=status.HTTP_400_BAD_REQUEST)
+        embeddings = XRay.objects.filter(pk=exclude_id).values_list('image_embedding', flat=True)
+        if not embeddings:
+            return Response({'error': 'X-ray not found'}, status=status.HTTP_404_NOT_FOUND)
+        vector = embeddings[0]
+        if not vector:
+            return Response({'error': 'X-ray has no image embedding'}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        return Response(
+            {'error': 'Provide an image upload or like=<xray id>'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        search = build_hybrid_search(
+            vector, query, params, size=size, exclude_id=exclude_id,
+            image_boost=image_boost, text_boost=text_boost,
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        response = search.execute()
+    except Exception as e:
+        return Response({
+            'error': f'Hybrid search failed: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    results = []
+    for hit in response:
+        result = hit.to_dict()
+        result['search_score'] = hit.meta.score
+        results.append(result)
+
+    return Response({
+        'results': results,
+        'total': response.hits.total.value,
+        'took': response.took,
+    })
+
+
 @api_view(['GET'])
 def elasticsearch_suggestions(request):
     """
@@ -256,7 +214,7 @@ def elasticsearch_suggestions(request):
             for suggestion in response.suggest.suggestions:
                 for option in suggestion.options:
                     suggestions.append({
-                        'text': option._source.to_dict().get(field.split('.')[0], ''),
+                        'text': option.text,
                         'score': option._score
                     })
         
@@ -278,52 +236,41 @@ def elasticsearch_suggestions(request):
 @api_view(['GET'])
 def elasticsearch_analytics(request):
     """
-    Get advanced analytics using Elasticsearch aggregations
+    Get advanced analytics for the dashboard
+
+    Counts by body part, diagnosis, institution and month are read from the
+    pre-aggregated monthly rollups; only popular tags, which the rollups
+    don't cover, need an Elasticsearch aggregation. The result is computed
+    once for concurrent requests and refreshed in the background once a
+    minute old.
     """
-    search = XRayDocument.search()
-    
-    # Add aggregations
-    search.aggs.bucket('body_parts', 'terms', field='body_part.raw', size=20)
-    search.aggs.bucket('diagnoses', 'terms', field='diagnosis.raw', size=20)
-    search.aggs.bucket('institutions', 'terms', field='institution.raw', size=20)
-    search.aggs.bucket('scans_by_month', 'date_histogram', field='scan_date', calendar_interval='month')
-    
-    # Add nested aggregation for tags
-    search.aggs.bucket('popular_tags', 'terms', field='tags.raw', size=30)
-    
-    try:
-        response = search[:0].execute()  # No documents, just aggregations
+    def compute_analytics():
+        # Aggregation-only request, served from the shard request cache until
+        # the index changes
+        search = aggregation_search()
+        search.aggs.bucket('popular_tags', 'terms', field='tags', size=30)
+        response = search.execute()  # No documents, just aggregations
         
-        analytics = {
-            'total_scans': response.hits.total.value,
-            'body_parts': [
-                {'name': bucket.key, 'count': bucket.doc_count}
-                for bucket in response.aggregations.body_parts.buckets
-            ],
-            'diagnoses': [
-                {'name': bucket.key, 'count': bucket.doc_count}
-                for bucket in response.aggregations.diagnoses.buckets
-            ],
-            'institutions': [
-                {'name': bucket.key, 'count': bucket.doc_count}
-                for bucket in response.aggregations.institutions.buckets
-            ],
-            'scans_by_month': [
-                {
-                    'month': bucket.key_as_string,
-                    'count': bucket.doc_count
-                }
-                for bucket in response.aggregations.scans_by_month.buckets
-            ],
+        return {
+            'total_scans': total_scans(),
+            'body_parts': top_values('body_part'),
+            'diagnoses': top_values('diagnosis'),
+            'institutions': top_values('institution'),
+            'scans_by_month': monthly_counts(),
             'popular_tags': [
                 {'tag': bucket.key, 'count': bucket.doc_count}
                 for bucket in response.aggregations.popular_tags.buckets
             ]
         }
-        
+    
+    try:
+        analytics = get_or_compute(
+            data_cache_key('analytics'), compute_analytics,
+            SEARCH_CACHE_TIMEOUT, stale_timeout=STALE_CACHE_TIMEOUT
+        )
         return Response(analytics)
         
     except Exception as e:
         return Response({
             'error': f'Analytics failed: {str(e)}'
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR) 
\ No newline at end of file
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,80 @@
+"""
+CPU image embeddings for X-ray similarity search.
+
+Every image is reduced to a fixed-length vector using Pillow alone, so
+ingest needs no GPU and no model download:
+
+- a contrast-normalized grayscale thumbnail captures the layout of the
+  image (body part, projection, implants, large opacities);
+- an intensity histogram captures exposure and tissue density.
+
+Both parts are normalized separately and weighted before being joined, and
+the result has unit length so Elasticsearch compares vectors by cosine
+similarity.
+"""
+import math
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+THUMBNAIL_SIZE = 12
+HISTOGRAM_BINS = 32
+EMBEDDING_DIMS = THUMBNAIL_SIZE * THUMBNAIL_SIZE + HISTOGRAM_BINS
+
+# Share of the vector's length given to layout versus intensity
+LAYOUT_WEIGHT = 0.8
+INTENSITY_WEIGHT = 0.6
+
+
+def normalized(values):
+    """Scale a vector to unit length; all-zero vectors are returned as is"""
+    norm = math.sqrt(sum(value * value for value in values))
+    if not norm:
+        return list(values)
+    return [value / norm for value in values]
+
+
+def embed_image(image):
+    """Return the embedding of a PIL image"""
+    gray = ImageOps.autocontrast(image.convert('L'))
+
+    thumbnail = gray.resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.BOX)
+    pixels = list(thumbnail.getdata())
+    mean = sum(pixels) / len(pixels)
+    layout = normalized([pixel - mean for pixel in pixels])
+
+    histogram = gray.histogram()
+    bin_width = len(histogram) // HISTOGRAM_BINS
+    total = sum(histogram) or 1
+    # Square roots of bin shares (Hellinger), so a few dominant bins don't
+    # drown out the rest
+    intensity = normalized([
+        math.sqrt(sum(histogram[start:start + bin_width]) / total)
+        for start in range(0, len(histogram), bin_width)
+    ])
+
+    vector = [value * LAYOUT_WEIGHT for value in layout]
+    vector += [value * INTENSITY_WEIGHT for value in intensity]
+    return [round(value, 6) for value in normalized(vector)]
+
+
+def compute_embedding(image_file):
+    """
+    Return the embedding of an image file, or None if it can't be read.
+
+    Accepts uploaded files and stored ``FieldFile`` objects; the read position
+    is reset afterwards so the file can still be saved.
+    """
+    try:
+        image_file.seek(0)
+        with Image.open(image_file) as image:
+            # Let JPEG decoding skip detail the thumbnail won't use
+            image.draft('L', (THUMBNAIL_SIZE * 16, THUMBNAIL_SIZE * 16))
+            return embed_image(image)
+    except (OSError, UnidentifiedImageError, ValueError):
+        return None
+    finally:
+        try:
+            image_file.seek(0)
+        except (OSError, ValueError):
+            pass
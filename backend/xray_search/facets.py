@@ -0,0 +1,89 @@
+"""
+Facet counts for the filter panel, computed in one pass over the scans.
+
+On PostgreSQL the filtered rows are grouped once with ``GROUPING SETS``, one
+set per facet. Other databases group by every facet together in a single
+query and the per-facet counts are summed in Python, which still reads the
+filtered rows only once.
+
+Results are cached per filter signature under the data generation, so any
+committed write makes the next request recount.
+"""
+from django.db import connections
+from django.db.models import Count
+
+from .cache import data_cache_key, get_or_compute
+
+
+FACET_FIELDS = ['body_part', 'institution', 'diagnosis']
+
+FACETS_CACHE_TIMEOUT = 10 * 60
+
+
+def grouping_sets_counts(queryset):
+    """Return ``{field: {value: count}}`` from one GROUPING SETS query"""
+    connection = connections[queryset.db]
+    quote = connection.ops.quote_name
+    inner, params = queryset.values(*FACET_FIELDS).order_by().query.sql_with_params()
+
+    columns = ', '.join(quote(field) for field in FACET_FIELDS)
+    grouping = ', '.join(f'GROUPING({quote(field)})' for field in FACET_FIELDS)
+    sets = ', '.join(f'({quote(field)})' for field in FACET_FIELDS)
+    sql = (
+        f'SELECT {columns}, {grouping}, COUNT(*) FROM ({inner}) AS scans '
+        f'GROUP BY GROUPING SETS ({sets})'
+    )
+
+    counts = {field: {} for field in FACET_FIELDS}
+    width = len(FACET_FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for row in cursor.fetchall():
+            values, grouped, count = row[:width], row[width:2 * width], row[-1]
+            # GROUPING() is 0 for the column the row was grouped by
+            index = grouped.index(0)
+            counts[FACET_FIELDS[index]][values[index]] = count
+    return counts
+
+
+def single_pass_counts(queryset):
+    """Return ``{field: {value: count}}`` from one query grouped by all facets"""
+    counts = {field: {} for field in FACET_FIELDS}
+    rows = queryset.values_list(*FACET_FIELDS).annotate(count=Count('id')).order_by()
+    for *values, count in rows:
+        for field, value in zip(FACET_FIELDS, values):
+            counts[field][value] = counts[field].get(value, 0) + count
+    return counts
+
+
+def facet_counts(queryset, signature=''):
+    """
+    Return the total and per-value counts of every facet for a queryset.
+
+    Values are ordered by count, then name; empty values are left out since
+    they can't be selected as a filter.
+    """
+    return get_or_compute(
+        data_cache_key('facets', signature),
+        lambda: compute_facet_counts(queryset),
+        FACETS_CACHE_TIMEOUT,
+    )
+
+
+def compute_facet_counts(queryset):
+    if connections[queryset.db].vendor == 'postgresql':
+        counts = grouping_sets_counts(queryset)
+    else:
+        counts = single_pass_counts(queryset)
+
+    return {
+        'total': sum(counts[FACET_FIELDS[0]].values()),
+        'facets': {
+            field: [
+                {'value': value, 'count': count}
+                for value, count in sorted(values.items(), key=lambda item: (-item[1], item[0]))
+                if value
+            ]
+            for field, values in counts.items()
+        },
+    }
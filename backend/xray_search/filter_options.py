@@ -0,0 +1,43 @@
+"""
+Dropdown metadata for the filter panel, served from a cached snapshot.
+
+The snapshot holds the body part, institution and diagnosis lists together
+with a strong ETag computed from their content. It is keyed on the data
+generation and rebuilt, once for all concurrent requests, after the next
+committed write to scans or body part categories, so checking a client's
+``If-None-Match`` only reads the cache. The snapshot also expires like other
+derived data, served stale while one request rebuilds it, so changes that
+miss a generation bump don't outlive the timeout.
+"""
+import hashlib
+import json
+
+from .cache import STALE_CACHE_TIMEOUT, data_cache_key, get_or_compute
+from .models import BodyPart, XRay
+from .rollups import distinct_values
+
+
+def available_body_parts():
+    """Return active BodyPart names followed by the remaining static choices"""
+    body_parts = list(BodyPart.objects.filter(is_active=True).values_list('name', flat=True))
+    seen = set(body_parts)
+    for choice, _ in XRay.BODY_PART_CHOICES:
+        if choice not in seen:
+            body_parts.append(choice)
+            seen.add(choice)
+    return body_parts
+
+
+def filter_options_snapshot():
+    """Return ``(etag, options)`` for the current data generation"""
+    return get_or_compute(data_cache_key('filter_options'), build_filter_options, stale_timeout=STALE_CACHE_TIMEOUT)
+
+
+def build_filter_options():
+    options = {
+        'body_parts': available_body_parts(),
+        'institutions': distinct_values('institution'),
+        'diagnoses': distinct_values('diagnosis'),
+    }
+    digest = hashlib.sha1(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+    return f'"{digest}"', options
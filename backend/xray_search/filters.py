@@ -115,4 +115,14 @@ class XRayFilter(django_filters.FilterSet):
         for tag in tags:
             queryset = queryset.filter(tags__icontains=tag)
         
-        return queryset 
\ No newline at end of file
+        return queryset 
+
+
+def accepted_params(filterset):
+    """Return the query parameter names a FilterSet reads, including range suffixes"""
+    params = set()
+    for name, field in filterset.form.fields.items():
+        params.add(name)
+        for suffix in getattr(field.widget, 'suffixes', []):
+            params.add(f'{name}_{suffix}' if suffix else name)
+    return params
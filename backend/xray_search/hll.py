@@ -0,0 +1,77 @@
+"""
+HyperLogLog cardinality sketches.
+
+A sketch estimates the number of distinct values added to it in a fixed
+16 KiB of registers, with a standard error of about 0.8% at the default
+precision. Sketches of the same precision merge by taking the register-wise
+maximum, so the sketch of a union never needs the underlying values.
+"""
+import hashlib
+import math
+
+
+PRECISION = 14
+REGISTER_COUNT = 1 << PRECISION
+
+HASH_BITS = 64
+RANK_BITS = HASH_BITS - PRECISION
+
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTER_COUNT)
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(RANK_BITS + 2)]
+
+
+def hash_value(value):
+    """Return a 64-bit hash of a string"""
+    digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class HyperLogLog:
+    """A mergeable distinct-count sketch with one byte per register"""
+
+    def __init__(self, registers=None):
+        if registers is None:
+            self.registers = bytearray(REGISTER_COUNT)
+        else:
+            if len(registers) != REGISTER_COUNT:
+                raise ValueError(f'Expected {REGISTER_COUNT} registers, got {len(registers)}')
+            self.registers = bytearray(registers)
+
+    def add(self, value):
+        """Add a value; return True if the sketch changed"""
+        return self.add_hash(hash_value(value))
+
+    def add_hash(self, hashed):
+        """Add a value by its ``hash_value``, to hash once for several sketches"""
+        index = hashed >> RANK_BITS
+        # Position of the leftmost 1-bit in the remaining bits
+        rank = RANK_BITS - (hashed & ((1 << RANK_BITS) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def update(self, values):
+        """Add several values; return True if the sketch changed"""
+        changed = False
+        for value in values:
+            changed = self.add(value) or changed
+        return changed
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        """Return the estimated number of distinct values added"""
+        raw = _ALPHA * REGISTER_COUNT * REGISTER_COUNT / sum(map(_INVERSE_POWERS.__getitem__, self.registers))
+        if raw <= 2.5 * REGISTER_COUNT:
+            # Small cardinalities: linear counting over the empty registers
+            zeros = self.registers.count(0)
+            if zeros:
+                return round(REGISTER_COUNT * math.log(REGISTER_COUNT / zeros))
+        return round(raw)
+
+    def to_bytes(self):
+        return bytes(self.registers)
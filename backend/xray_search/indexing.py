@@ -0,0 +1,295 @@
+"""
+Zero-downtime maintenance of the X-ray Elasticsearch index.
+
+``XRayDocument`` reads and writes through the alias ``xray_scans``. The data
+itself lives in versioned physical indices (``xray_scans_v1``,
+``xray_scans_v2``, ...). A rebuild fills the next version while the alias
+keeps serving the current one, catches up on rows changed in the meantime
+and then swaps the alias in a single atomic ``update_aliases`` call.
+"""
+import re
+from datetime import datetime, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from elasticsearch import helpers
+from elasticsearch_dsl.connections import connections
+
+from .documents import XRayDocument
+from .models import XRay
+from .rollups import refresh_rollups
+
+
+ALIAS = XRayDocument._index._name
+VERSION_PATTERN = re.compile(r'^%s_v(\d+)$' % re.escape(ALIAS))
+
+# Rows touched this close to a pass boundary are re-sent on the next pass,
+# so clock skew between app servers cannot drop an update.
+CATCH_UP_OVERLAP = timedelta(seconds=5)
+
+# Catch-up stops once a pass finds at most this many changed rows; whatever
+# is written after that is picked up by the final pass after the swap.
+CATCH_UP_THRESHOLD = 50
+MAX_CATCH_UP_PASSES = 5
+
+
+def get_connection():
+    """Return the Elasticsearch client used by XRayDocument"""
+    return connections.get_connection(XRayDocument._get_using())
+
+
+def index_name(version):
+    """Return the physical index name for a version number"""
+    return f'{ALIAS}_v{version}'
+
+
+def get_versions(es):
+    """Return the sorted version numbers of existing physical indices"""
+    indices = es.indices.get(index=f'{ALIAS}_v*', ignore_unavailable=True)
+    versions = []
+    for name in indices:
+        match = VERSION_PATTERN.match(name)
+        if match:
+            versions.append(int(match.group(1)))
+    return sorted(versions)
+
+
+def get_alias_targets(es):
+    """Return the physical indices the read alias currently points at"""
+    if not es.indices.exists_alias(name=ALIAS):
+        return []
+    return sorted(es.indices.get_alias(name=ALIAS).keys())
+
+
+def create_index(es, name):
+    """
+    Create a physical index with XRayDocument's mapping and settings.
+
+    Refreshing is disabled while the index is bulk filled and restored by
+    ``finish_bulk_fill``.
+    """
+    index = XRayDocument._index.clone(name=name)
+    index.create(using=XRayDocument._get_using())
+    es.indices.put_settings(index=name, settings={'index': {'refresh_interval': '-1'}})
+
+
+def finish_bulk_fill(es, name):
+    """Restore the default refresh interval and make the new index searchable"""
+    es.indices.put_settings(index=name, settings={'index': {'refresh_interval': None}})
+    es.indices.refresh(index=name)
+
+
+def index_queryset(es, name, queryset, chunk_size=500):
+    """
+    Bulk index a queryset into the given physical index.
+
+    Returns the number of documents sent.
+    """
+    document = XRayDocument()
+
+    def actions():
+        for xray in queryset.iterator(chunk_size=chunk_size):
+            action = document._prepare_action(xray, 'index')
+            action['_index'] = name
+            yield action
+
+    indexed, _ = helpers.bulk(es, actions(), chunk_size=chunk_size)
+    return indexed
+
+
+def get_indexed_ids(es, name):
+    """Return the set of document ids stored in a physical index"""
+    hits = helpers.scan(es, index=name, query={'query': {'match_all': {}}}, _source=False)
+    return {int(hit['_id']) for hit in hits}
+
+
+def reconcile_ids(es, name, chunk_size=500):
+    """
+    Make the set of indexed ids match the set of ids in the database.
+
+    Deletions are reconciled by diffing the id sets, since deleted rows leave
+    nothing behind to compare timestamps against. Rows missing from the index
+    (e.g. created while Elasticsearch was unreachable) are indexed. Returns
+    ``(added, removed)`` counts.
+    """
+    indexed_ids = get_indexed_ids(es, name)
+    db_ids = set(XRay.objects.values_list('id', flat=True))
+
+    missing_ids = db_ids - indexed_ids
+    added = 0
+    if missing_ids:
+        added = index_queryset(
+            es, name, XRay.objects.filter(id__in=missing_ids), chunk_size=chunk_size
+        )
+
+    stale_ids = indexed_ids - db_ids
+    if stale_ids:
+        actions = (
+            {'_op_type': 'delete', '_index': name, '_id': xray_id}
+            for xray_id in stale_ids
+        )
+        helpers.bulk(es, actions, chunk_size=chunk_size, raise_on_error=False)
+
+    return added, len(stale_ids)
+
+
+def get_watermark(es, name=ALIAS):
+    """
+    Return the ``(updated_at, id)`` high-watermark stored on the index.
+
+    The watermark lives in the mapping ``_meta`` of the physical index, so a
+    rebuilt index carries its own watermark across the alias swap. Returns
+    ``None`` if the index has never been synced.
+    """
+    for mapping in es.indices.get_mapping(index=name).values():
+        meta = mapping['mappings'].get('_meta', {}).get('sync_watermark')
+        if meta:
+            return datetime.fromisoformat(meta['updated_at']), meta['id']
+    return None
+
+
+def set_watermark(es, name, updated_at, xray_id):
+    """Store the ``(updated_at, id)`` high-watermark on the index"""
+    es.indices.put_mapping(index=name, meta={
+        'sync_watermark': {'updated_at': updated_at.isoformat(), 'id': xray_id},
+    })
+
+
+def sync_changes(es, name=ALIAS, chunk_size=500, overlap=CATCH_UP_OVERLAP):
+    """
+    Push rows changed since the stored watermark to the index in bulk.
+
+    Rows are walked in ``(updated_at, id)`` order and the watermark is
+    advanced after every chunk, so an interrupted sync resumes where it
+    stopped. ``overlap`` re-sends rows just below the watermark to cover
+    transactions that committed late with an older ``updated_at``.
+
+    Returns the number of documents sent.
+    """
+    watermark = get_watermark(es, name)
+    queryset = XRay.objects.order_by('updated_at', 'id')
+    if watermark is not None:
+        updated_at, xray_id = watermark
+        if overlap:
+            queryset = queryset.filter(updated_at__gte=updated_at - overlap)
+        else:
+            queryset = queryset.filter(
+                Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=xray_id)
+            )
+
+    document = XRayDocument()
+    sent = 0
+    last = None
+    while True:
+        if last is not None:
+            chunk_queryset = queryset.filter(
+                Q(updated_at__gt=last[0]) | Q(updated_at=last[0], id__gt=last[1])
+            )
+        else:
+            chunk_queryset = queryset
+        chunk = list(chunk_queryset[:chunk_size])
+        if not chunk:
+            break
+
+        actions = []
+        for xray in chunk:
+            action = document._prepare_action(xray, 'index')
+            action['_index'] = name
+            actions.append(action)
+        helpers.bulk(es, actions, chunk_size=chunk_size)
+        sent += len(chunk)
+
+        last = (chunk[-1].updated_at, chunk[-1].id)
+        set_watermark(es, name, *last)
+
+    return sent
+
+
+def catch_up(es, name, since, chunk_size=500):
+    """
+    Re-send rows changed since ``since`` until the remaining backlog is small.
+
+    Returns the start time of the last pass, which is the point from which
+    a later catch-up has to continue.
+    """
+    for _ in range(MAX_CATCH_UP_PASSES):
+        pass_started = timezone.now()
+        changed = XRay.objects.filter(updated_at__gte=since - CATCH_UP_OVERLAP)
+        count = index_queryset(es, name, changed, chunk_size=chunk_size)
+        since = pass_started
+        if count <= CATCH_UP_THRESHOLD:
+            break
+    return since
+
+
+def swap_alias(es, new_index):
+    """
+    Point the read alias at ``new_index`` in one atomic request.
+
+    Returns the indices that were previously behind the alias. A legacy
+    concrete index named like the alias is removed in the same request,
+    since the alias cannot be created while it exists.
+    """
+    old_indices = get_alias_targets(es)
+    actions = [{'add': {'index': new_index, 'alias': ALIAS, 'is_write_index': True}}]
+    for old_index in old_indices:
+        if old_index != new_index:
+            actions.append({'remove': {'index': old_index, 'alias': ALIAS}})
+    if not old_indices and es.indices.exists(index=ALIAS):
+        actions.append({'remove_index': {'index': ALIAS}})
+    es.indices.update_aliases(actions=actions)
+    return [index for index in old_indices if index != new_index]
+
+
+def rebuild_index(keep_old=False, chunk_size=500, log=None):
+    """
+    Build the next index version and swap it in without a search outage.
+
+    While the new index is filled, searches and signal-driven writes keep
+    using the index behind the alias. Rows changed during the fill are sent
+    again before the swap, and a final pass after the swap picks up anything
+    that was written to the old index in between.
+
+    Returns the name of the new physical index.
+    """
+    log = log or (lambda message: None)
+    es = get_connection()
+
+    versions = get_versions(es)
+    new_index = index_name(versions[-1] + 1 if versions else 1)
+
+    log(f"Creating index '{new_index}'")
+    create_index(es, new_index)
+
+    started = timezone.now()
+    count = index_queryset(es, new_index, XRay.objects.all(), chunk_size=chunk_size)
+    log(f'Indexed {count} X-ray documents')
+
+    since = catch_up(es, new_index, started, chunk_size=chunk_size)
+    finish_bulk_fill(es, new_index)
+
+    old_indices = swap_alias(es, new_index)
+    log(f"Alias '{ALIAS}' now points at '{new_index}'")
+
+    # Writes made between the last catch-up pass and the swap went to the
+    # old index only; they are re-sent now that the alias targets the new one.
+    index_queryset(
+        es, new_index,
+        XRay.objects.filter(updated_at__gte=since - CATCH_UP_OVERLAP),
+        chunk_size=chunk_size,
+    )
+    _, removed = reconcile_ids(es, new_index, chunk_size=chunk_size)
+    if removed:
+        log(f'Removed {removed} documents deleted during the rebuild')
+    set_watermark(es, new_index, since, 0)
+    es.indices.refresh(index=new_index)
+
+    rows = refresh_rollups()
+    log(f'Refreshed {rows} analytics rollup rows')
+
+    if not keep_old:
+        for old_index in old_indices:
+            es.indices.delete(index=old_index)
+            log(f"Deleted index '{old_index}'")
+
+    return new_index
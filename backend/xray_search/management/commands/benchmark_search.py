@@ -0,0 +1,100 @@
+import statistics
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+from elasticsearch_dsl.connections import connections
+from rest_framework.test import APIRequestFactory
+
+from xray_search.elasticsearch_fake import FakeNode
+from xray_search.elasticsearch_views import (
+    elasticsearch_advanced_search,
+    elasticsearch_analytics,
+    elasticsearch_suggestions,
+)
+from xray_search.indexing import rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the Elasticsearch search endpoints. With --fake the index is '
+        'built in the in-process Elasticsearch fake, so no cluster is needed'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+            help='Timed requests per endpoint'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=5,
+            help='Untimed requests per endpoint before measuring'
+        )
+        parser.add_argument(
+            '--query',
+            default='pneumonia',
+            help='Search text sent to the endpoints'
+        )
+        parser.add_argument(
+            '--fake',
+            action='store_true',
+            help='Index the database into the in-process fake and benchmark against it'
+        )
+
+    def handle(self, *args, **options):
+        context = nullcontext()
+        if options['fake']:
+            fake_settings = {'default': {'hosts': 'http://localhost:9200', 'node_class': FakeNode}}
+            connections.configure(**fake_settings)
+            context = override_settings(ELASTICSEARCH_DSL=fake_settings)
+
+        with context:
+            if options['fake']:
+                self.stdout.write('Indexing database into the in-process Elasticsearch fake...')
+                rebuild_index()
+            self.run_benchmarks(options)
+
+    def get_cases(self, query):
+        client = Client(HTTP_HOST='localhost')
+        factory = APIRequestFactory()
+        return [
+            ('search', lambda: client.get(
+                reverse('xray_search:elasticsearch_search'), {'q': query})),
+            ('search_page', lambda: client.get(
+                reverse('xray_search:elasticsearch_search_page'), {'q': query})),
+            ('advanced_search', lambda: elasticsearch_advanced_search(
+                factory.get('/', {'q': query}))),
+            ('suggestions', lambda: elasticsearch_suggestions(
+                factory.get('/', {'field': 'diagnosis', 'text': query[:3]}))),
+            ('analytics', lambda: elasticsearch_analytics(factory.get('/'))),
+        ]
+
+    def run_benchmarks(self, options):
+        self.stdout.write(f"{'endpoint':<18}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+
+        for name, request in self.get_cases(options['query']):
+            for _ in range(options['warmup']):
+                request()
+
+            timings = []
+            for _ in range(options['iterations']):
+                started = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f'{name} returned HTTP {response.status_code}')
+
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f'{name:<18}{statistics.mean(timings):>10.2f}'
+                f'{statistics.median(timings):>10.2f}{p95:>10.2f}'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
@@ -0,0 +1,58 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from xray_search.models import XRay
+from xray_search.serializers import FastXRayListSerializer, XRayListSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Time XRayListSerializer against FastXRayListSerializer on one page of '
+        'scans, including the query, and check that both produce the same data'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=100,
+            help='Scans per serialized page'
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+            help='Timed runs per serializer'
+        )
+
+    def handle(self, *args, **options):
+        queryset = XRay.objects.order_by('-created_at')[:options['rows']]
+        context = {'request': Request(APIRequestFactory().get('/api/xrays/', HTTP_HOST='localhost'))}
+
+        cases = [
+            ('XRayListSerializer', lambda: XRayListSerializer(queryset, many=True, context=context).data),
+            ('FastXRayListSerializer', lambda: FastXRayListSerializer(
+                queryset.values(*FastXRayListSerializer.source_fields), context=context).data),
+        ]
+
+        expected, actual = (run() for _, run in cases)
+        if [dict(row) for row in expected] != actual:
+            raise CommandError('FastXRayListSerializer output differs from XRayListSerializer')
+        self.stdout.write(f'Serializing {len(actual)} rows, {options["iterations"]} runs each')
+
+        self.stdout.write(f"{'serializer':<24}{'mean ms':>10}{'p50 ms':>10}")
+        means = []
+        for name, run in cases:
+            timings = []
+            for _ in range(options['iterations']):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            means.append(statistics.mean(timings))
+            self.stdout.write(f'{name:<24}{means[-1]:>10.2f}{statistics.median(timings):>10.2f}')
+
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {means[0] / means[1]:.1f}x'))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from xray_search.embeddings import compute_embedding
+from xray_search.models import XRay
+
+
+class Command(BaseCommand):
+    help = (
+        'Compute image embeddings for X-rays that have none. New uploads are '
+        'embedded on save; this backfills existing rows'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recompute embeddings for every X-ray, not just missing ones'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of rows written per bulk update'
+        )
+
+    def handle(self, *args, **options):
+        queryset = XRay.objects.exclude(image='').only('id', 'image', 'image_embedding')
+        if not options['force']:
+            queryset = queryset.filter(image_embedding__isnull=True)
+
+        self.stdout.write(f'Computing embeddings for {queryset.count()} X-rays...')
+
+        updated = 0
+        failed = 0
+        batch = []
+        for xray in queryset.iterator(chunk_size=options['batch_size']):
+            xray.image_embedding = compute_embedding(xray.image)
+            if xray.image_embedding is None:
+                failed += 1
+                continue
+            # bulk_update skips auto_now; bumping updated_at lets
+            # sync_search_index push the new vectors
+            xray.updated_at = timezone.now()
+            batch.append(xray)
+            if len(batch) >= options['batch_size']:
+                updated += self.save_batch(batch)
+                batch = []
+        updated += self.save_batch(batch)
+
+        if failed:
+            self.stdout.write(self.style.WARNING(f'Could not read {failed} images'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {updated} embeddings; run sync_search_index to index them'
+        ))
+
+    def save_batch(self, batch):
+        XRay.objects.bulk_update(batch, ['image_embedding', 'updated_at'])
+        return len(batch)
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch.exceptions import TransportError
+
+from xray_search.checks import warn_if_cache_not_shared
+from xray_search.indexing import ALIAS, rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the X-ray search index into a new versioned index and '
+        'atomically swap the read alias, without a search outage'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-old',
+            action='store_true',
+            help='Keep the previous index version after the alias swap'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of rows fetched and sent to Elasticsearch per batch'
+        )
+
+    def handle(self, *args, **options):
+        warn_if_cache_not_shared(self)
+        self.stdout.write(f"Rebuilding Elasticsearch index behind alias '{ALIAS}'...")
+
+        try:
+            new_index = rebuild_index(
+                keep_old=options['keep_old'],
+                chunk_size=options['chunk_size'],
+                log=self.stdout.write,
+            )
+        except TransportError as e:
+            raise CommandError(f'Rebuild failed: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt as '{new_index}'"))
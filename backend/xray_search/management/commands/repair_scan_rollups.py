@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from xray_search.checks import warn_if_cache_not_shared
+from xray_search.rollups import refresh_rollups
+from xray_search.sketches import rebuild_sketches
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the scan rollup table from the scans table, and the '
+        'distinct-patient sketches unless limited to some months. Saves and '
+        'deletes keep them current; run this after bulk writes that bypass '
+        'model signals, or to fix drift'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month',
+            action='append',
+            dest='months',
+            help='Only recompute this month (YYYY-MM); may be repeated'
+        )
+
+    def handle(self, *args, **options):
+        warn_if_cache_not_shared(self)
+        months = None
+        if options['months']:
+            try:
+                months = [datetime.strptime(month, '%Y-%m').date() for month in options['months']]
+            except ValueError:
+                raise CommandError('Months must be given as YYYY-MM')
+
+        scope = ', '.join(options['months']) if months else 'all months'
+        self.stdout.write(f'Recomputing scan rollups for {scope}...')
+
+        rows = refresh_rollups(months)
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} rollup rows'))
+
+        if months is None:
+            self.stdout.write('Rebuilding distinct-patient sketches...')
+            sketches = rebuild_sketches()
+            self.stdout.write(self.style.SUCCESS(f'Wrote {sketches} patient sketches'))
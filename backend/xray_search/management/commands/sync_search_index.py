@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch.exceptions import TransportError
+
+from xray_search.checks import warn_if_cache_not_shared
+from xray_search.indexing import (
+    ALIAS,
+    CATCH_UP_OVERLAP,
+    get_connection,
+    reconcile_ids,
+    sync_changes,
+)
+from xray_search.rollups import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Incrementally sync the X-ray search index: push rows changed since '
+        'the stored updated_at watermark and reconcile deleted rows'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of rows sent to Elasticsearch per bulk request'
+        )
+        parser.add_argument(
+            '--overlap',
+            type=int,
+            default=int(CATCH_UP_OVERLAP.total_seconds()),
+            help='Seconds below the watermark to re-send, covering late commits'
+        )
+        parser.add_argument(
+            '--skip-deletes',
+            action='store_true',
+            help='Skip the id-set diff that removes documents for deleted rows'
+        )
+
+    def handle(self, *args, **options):
+        warn_if_cache_not_shared(self)
+        es = get_connection()
+        self.stdout.write(f"Syncing Elasticsearch index '{ALIAS}'...")
+
+        try:
+            sent = sync_changes(
+                es,
+                chunk_size=options['chunk_size'],
+                overlap=timedelta(seconds=options['overlap']),
+            )
+            self.stdout.write(f'Indexed {sent} changed X-ray documents')
+
+            if not options['skip_deletes']:
+                added, removed = reconcile_ids(es, ALIAS, chunk_size=options['chunk_size'])
+                self.stdout.write(f'Reconciled ids: {added} added, {removed} removed')
+
+            es.indices.refresh(index=ALIAS)
+        except TransportError as e:
+            raise CommandError(f'Sync failed: {e}')
+
+        # Changes that bypassed signals can move scans between any months
+        rows = refresh_rollups()
+        self.stdout.write(f'Refreshed {rows} analytics rollup rows')
+
+        self.stdout.write(self.style.SUCCESS('Search index is up to date'))
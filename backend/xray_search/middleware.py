@@ -0,0 +1,188 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+The server prefers zstd, then brotli, then gzip, limited to the codecs the
+client accepts. Streaming responses are compressed chunk by
+chunk and flushed after each chunk, so clients can decode rows as they
+arrive.
+
+Responses are left alone when they:
+- already have a Content-Encoding (e.g. WhiteNoise's precompressed static
+  files)
+- are already-compressed media such as images
+- are HTML pages, which carry CSRF tokens, to stay clear of BREACH
+- ask for ``Cache-Control: no-transform``
+"""
+import zlib
+
+import brotli
+import zstandard
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+
+
+MIN_COMPRESS_LENGTH = 200
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+SKIPPED_TYPE_PREFIXES = ('image/', 'video/', 'audio/', 'font/woff')
+SKIPPED_TYPES = {
+    'text/html',
+    'application/zip',
+    'application/gzip',
+    'application/zstd',
+    'application/x-brotli',
+    'application/octet-stream',
+}
+# Vector images are text and compress well
+COMPRESSIBLE_IMAGE_TYPES = {'image/svg+xml'}
+
+strong_etag_re = _lazy_re_compile(r'^\s*"')
+
+
+class GzipCompressor:
+    def __init__(self):
+        # wbits=31 writes a gzip header and trailer
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+# ``(coding, compressor class)`` pairs in server preference order
+ENCODINGS = [
+    ('zstd', ZstdCompressor),
+    ('br', BrotliCompressor),
+    ('gzip', GzipCompressor),
+]
+
+
+def parse_accept_encoding(header):
+    """Return ``{coding: q}`` from an Accept-Encoding header"""
+    qualities = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities
+
+
+def select_encoding(header):
+    """Return the preferred coding the client accepts, or None"""
+    qualities = parse_accept_encoding(header)
+    for coding, _ in ENCODINGS:
+        if qualities.get(coding, qualities.get('*', 0)) > 0:
+            return coding
+    return None
+
+
+def is_compressible(response):
+    if response.has_header('Content-Encoding'):
+        return False
+    if 'no-transform' in response.get('Cache-Control', ''):
+        return False
+    content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+    if content_type in COMPRESSIBLE_IMAGE_TYPES:
+        return True
+    return content_type not in SKIPPED_TYPES and not content_type.startswith(SKIPPED_TYPE_PREFIXES)
+
+
+def compress_chunks(compressor, chunks):
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def compress_chunks_async(compressor, chunks):
+    async for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress responses with zstd, brotli or gzip, as the client accepts"""
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < MIN_COMPRESS_LENGTH:
+            return response
+        if not is_compressible(response):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = select_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if coding is None:
+            return response
+        compressor = dict(ENCODINGS)[coding]()
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compress_chunks_async(compressor, response.streaming_content)
+            else:
+                response.streaming_content = compress_chunks(compressor, response.streaming_content)
+            # The compressed length isn't known up front
+            del response.headers['Content-Length']
+        else:
+            compressed = compressor.compress(response.content) + compressor.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The body differs byte for byte from the identity encoding, so a
+        # strong ETag has to become weak (as Django's GZipMiddleware does)
+        etag = response.get('ETag')
+        if etag and strong_etag_re.match(etag):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = coding
+        return response
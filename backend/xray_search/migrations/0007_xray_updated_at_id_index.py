@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xray_search', '0006_remove_body_part_category'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='xray',
+            index=models.Index(fields=['updated_at', 'id'], name='xray_search_updated_a585f8_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:19
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+
+def backfill_rollups(apps, schema_editor):
+    """Count the existing scans into rollup rows"""
+    XRay = apps.get_model('xray_search', 'XRay')
+    ScanRollup = apps.get_model('xray_search', 'ScanRollup')
+    buckets = (
+        XRay.objects.annotate(month=TruncMonth('scan_date'))
+        .values('month', 'body_part', 'institution', 'diagnosis')
+        .annotate(scan_count=Count('id'))
+        .order_by()
+    )
+    ScanRollup.objects.bulk_create(
+        [ScanRollup(scan_count=row.pop('scan_count'), **row) for row in buckets],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xray_search', '0007_xray_updated_at_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the scan month')),
+                ('body_part', models.CharField(max_length=50)),
+                ('institution', models.CharField(max_length=200)),
+                ('diagnosis', models.CharField(max_length=200)),
+                ('scan_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Scan Rollup',
+                'verbose_name_plural': 'Scan Rollups',
+                'ordering': ['month', 'body_part', 'institution', 'diagnosis'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='scanrollup',
+            constraint=models.UniqueConstraint(fields=('month', 'body_part', 'institution', 'diagnosis'), name='unique_scan_rollup_bucket'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
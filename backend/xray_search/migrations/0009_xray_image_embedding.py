@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xray_search', '0008_scanrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='xray',
+            name='image_embedding',
+            field=models.JSONField(blank=True, editable=False, help_text='CPU-computed image feature vector used for similarity search', null=True),
+        ),
+    ]
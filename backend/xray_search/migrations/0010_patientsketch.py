@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:29
+
+from django.db import migrations, models
+
+from xray_search.hll import HyperLogLog, hash_value
+
+
+def backfill_sketches(apps, schema_editor):
+    """Sketch the patients of the existing scans"""
+    XRay = apps.get_model('xray_search', 'XRay')
+    PatientSketch = apps.get_model('xray_search', 'PatientSketch')
+    sketches = {}
+    scans = XRay.objects.values_list('patient_id', 'scan_date', 'body_part', 'institution').order_by()
+    for patient_id, scan_date, body_part, institution in scans.iterator(chunk_size=2000):
+        hashed = hash_value(patient_id)
+        keys = [
+            ('total', ''),
+            ('institution', institution),
+            ('body_part', body_part),
+            ('month', f'{scan_date:%Y-%m}'),
+        ]
+        for key in keys:
+            sketches.setdefault(key, HyperLogLog()).add_hash(hashed)
+
+    PatientSketch.objects.bulk_create(
+        [
+            PatientSketch(dimension=dimension, value=value, registers=hll.to_bytes(), estimate=hll.estimate())
+            for (dimension, value), hll in sketches.items()
+        ],
+        batch_size=100,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xray_search', '0009_xray_image_embedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('total', 'Total'), ('institution', 'Institution'), ('body_part', 'Body Part'), ('month', 'Month')], max_length=20)),
+                ('value', models.CharField(blank=True, max_length=200)),
+                ('registers', models.BinaryField()),
+                ('estimate', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Patient Sketch',
+                'verbose_name_plural': 'Patient Sketches',
+                'ordering': ['dimension', 'value'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='patientsketch',
+            constraint=models.UniqueConstraint(fields=('dimension', 'value'), name='unique_patient_sketch'),
+        ),
+        migrations.RunPython(backfill_sketches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('xray_search', '0010_patientsketch'),
+    ]
+
+    operations = [
+        # Add the composite index before dropping the one it supersedes
+        migrations.AddIndex(
+            model_name='xray',
+            index=models.Index(fields=['patient_id', 'scan_date', 'id'], name='xray_search_patient_76a9b9_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='xray',
+            name='xray_search_patient_9a1c98_idx',
+        ),
+    ]
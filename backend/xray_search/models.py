@@ -2,6 +2,8 @@ from django.db import models
 from django.core.validators import RegexValidator
 import os
 
+from .embeddings import compute_embedding
+
 
 def xray_upload_path(instance, filename):
     """Generate upload path for X-ray images"""
@@ -101,6 +103,14 @@ class XRay(models.Model):
         help_text='List of tags for categorization (e.g., ["lung", "infection", "opacity"])'
     )
     
+    # Image feature vector for similarity search, computed from the image on save
+    image_embedding = models.JSONField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="CPU-computed image feature vector used for similarity search"
+    )
+    
     # Metadata fields for tracking
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -114,7 +124,10 @@ class XRay(models.Model):
             models.Index(fields=['diagnosis']),
             models.Index(fields=['institution']),
             models.Index(fields=['scan_date']),
-            models.Index(fields=['patient_id']),
+            # Patient timelines: exact patient match, keyset-ordered by date
+            models.Index(fields=['patient_id', 'scan_date', 'id']),
+            # Incremental search index sync walks rows in this order
+            models.Index(fields=['updated_at', 'id']),
         ]
         permissions = [
             ("can_upload_xrays", "Can upload X-ray scans"),
@@ -125,6 +138,14 @@ class XRay(models.Model):
     def __str__(self):
         return f"{self.patient_id} - {self.get_body_part_display()} ({self.scan_date})"
     
+    def save(self, *args, **kwargs):
+        # A new upload is an uncommitted file; embed it before it is stored.
+        # Existing rows without an embedding are left to
+        # compute_image_embeddings, so edits never read the stored file
+        if self.image and not self.image._committed:
+            self.image_embedding = compute_embedding(self.image)
+        super().save(*args, **kwargs)
+    
     def get_body_part_display(self):
         """Return the body part name"""
         return self.body_part
@@ -149,15 +170,63 @@ class XRay(models.Model):
         return None
 
 
-# Conditional Elasticsearch signal handling
-import os
-if os.environ.get('SKIP_ELASTICSEARCH', 'False').lower() != 'true':
-    try:
-        from django_elasticsearch_dsl import signals
-        from .documents import XRayDocument
-        
-        # Connect signals only if Elasticsearch is available
-        signals.RealTimeSignalProcessor.setup()
-    except ImportError:
-        # Elasticsearch not available, skip signals
-        pass
+class ScanRollup(models.Model):
+    """
+    Pre-aggregated scan counts per month, body part, institution and diagnosis
+
+    Dashboard analytics sum these rows instead of aggregating every scan.
+    Rows are derived data: see ``xray_search.rollups``.
+    """
+    month = models.DateField(help_text="First day of the scan month")
+    body_part = models.CharField(max_length=50)
+    institution = models.CharField(max_length=200)
+    diagnosis = models.CharField(max_length=200)
+    scan_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['month', 'body_part', 'institution', 'diagnosis']
+        verbose_name = "Scan Rollup"
+        verbose_name_plural = "Scan Rollups"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['month', 'body_part', 'institution', 'diagnosis'],
+                name='unique_scan_rollup_bucket',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.body_part}/{self.institution}/{self.diagnosis}: {self.scan_count}"
+
+
+class PatientSketch(models.Model):
+    """
+    HyperLogLog sketch of the distinct patients scanned in one facet value
+
+    One row per institution, body part and month, plus a single ``total``
+    row. The estimate is stored alongside the registers so reading counts
+    doesn't decode the sketch. Rows are derived data: see
+    ``xray_search.sketches``.
+    """
+    DIMENSION_CHOICES = [
+        ('total', 'Total'),
+        ('institution', 'Institution'),
+        ('body_part', 'Body Part'),
+        ('month', 'Month'),
+    ]
+
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    value = models.CharField(max_length=200, blank=True)
+    registers = models.BinaryField()
+    estimate = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['dimension', 'value']
+        verbose_name = "Patient Sketch"
+        verbose_name_plural = "Patient Sketches"
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'value'], name='unique_patient_sketch'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension} {self.value}: ~{self.estimate} patients"
@@ -0,0 +1,42 @@
+"""
+Per-patient scan summaries.
+
+A summary is computed with one grouped query over the patient's scans,
+which the (patient_id, scan_date, id) index answers without touching
+other patients' rows, and cached under the data generation.
+"""
+from django.db.models import Count, Max, Min
+
+from .cache import data_cache_key, get_or_compute
+from .models import XRay
+
+
+PATIENT_SUMMARY_CACHE_TIMEOUT = 60 * 60
+
+
+def patient_summary(patient_id):
+    """Return the scan count, date range and body parts of a patient, or None"""
+    return get_or_compute(
+        data_cache_key('patient_summary', patient_id),
+        lambda: compute_patient_summary(patient_id),
+        PATIENT_SUMMARY_CACHE_TIMEOUT,
+    )
+
+
+def compute_patient_summary(patient_id):
+    rows = list(
+        XRay.objects.filter(patient_id=patient_id)
+        .values('body_part')
+        .annotate(count=Count('id'), first=Min('scan_date'), last=Max('scan_date'))
+        .order_by('body_part')
+    )
+    if not rows:
+        return None
+
+    return {
+        'patient_id': patient_id,
+        'scan_count': sum(row['count'] for row in rows),
+        'first_scan_date': min(row['first'] for row in rows),
+        'last_scan_date': max(row['last'] for row in rows),
+        'body_parts': {row['body_part']: row['count'] for row in rows},
+    }
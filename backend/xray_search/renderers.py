@@ -0,0 +1,164 @@
+"""
+Alternative response encodings, all opted into through content negotiation.
+
+- orjson: ``Accept: application/json; encoder=orjson`` (or ``?format=orjson``)
+  renders with orjson, and request bodies sent as
+  ``Content-Type: application/json; encoder=orjson`` are parsed with it.
+  orjson encodes dates, datetimes, UUIDs and dict/list subclasses natively;
+  anything else (Decimal, lazy translation strings, querysets, ...) goes
+  through DRF's JSON encoder, so the output matches ``JSONRenderer``.
+- columnar: ``Accept: application/json; layout=columnar`` (or
+  ``?format=columnar``) turns list results into column names plus row
+  arrays, with repeated strings dictionary-encoded.
+- MessagePack: ``Accept: application/msgpack`` (or ``?format=msgpack``).
+- NDJSON: one JSON document per line, for the streaming export
+  (``/api/xrays/export.ndjson``).
+
+Plain ``application/json`` keeps DRF's stdlib-based renderer and parser.
+"""
+import msgpack
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+ORJSON_MEDIA_TYPE = 'application/json; encoder=orjson'
+COLUMNAR_MEDIA_TYPE = 'application/json; layout=columnar'
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+_fallback_encoder = JSONEncoder()
+
+
+def encode_default(obj):
+    """Encode what orjson or msgpack don't handle natively the way DRF does"""
+    return _fallback_encoder.default(obj)
+
+
+def ndjson_line(obj):
+    """Return ``obj`` as one line of NDJSON"""
+    return orjson.dumps(obj, default=encode_default, option=orjson.OPT_APPEND_NEWLINE)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """JSON renderer on orjson, selected only when the client asks for it"""
+    media_type = ORJSON_MEDIA_TYPE
+    format = 'orjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        option = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+        # orjson only indents by two spaces; any requested indent gets that
+        if accepted_media_type and 'indent=' in accepted_media_type:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=encode_default, option=option)
+
+
+class ORJSONParser(BaseParser):
+    """JSON parser on orjson for request bodies sent with the orjson media type"""
+    media_type = ORJSON_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class FormatContentNegotiation(DefaultContentNegotiation):
+    """
+    Let an explicit ``?format=`` pick its renderer whatever the Accept header
+
+    The opt-in media types carry parameters, which a plain ``*/*`` Accept
+    header never matches, so DRF's default negotiation would refuse them.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format = format_suffix or request.query_params.get(self.settings.URL_FORMAT_OVERRIDE)
+        if format:
+            matching = self.filter_renderers(renderers, format)
+            return matching[0], matching[0].media_type
+        return super().select_renderer(request, renderers, format_suffix)
+
+
+def to_columnar(rows):
+    """
+    Return list-of-dict rows as ``{'columns', 'dictionaries', 'rows'}``.
+
+    A string column whose values repeat (at most half of them distinct) is
+    dictionary-encoded: its cells hold indexes into
+    ``dictionaries[column]`` instead of the strings themselves.
+    """
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    dictionaries = {}
+    encoded_columns = []
+    for column in columns:
+        values = [row.get(column) for row in rows]
+        present = [value for value in values if value is not None]
+        if present and all(isinstance(value, str) for value in present):
+            distinct = list(dict.fromkeys(present))
+            if len(distinct) * 2 <= len(present):
+                index = {value: position for position, value in enumerate(distinct)}
+                dictionaries[column] = distinct
+                values = [None if value is None else index[value] for value in values]
+        encoded_columns.append(values)
+
+    return {
+        'columns': columns,
+        'dictionaries': dictionaries,
+        'rows': [list(row) for row in zip(*encoded_columns)],
+    }
+
+
+def columnar_data(data):
+    """Apply ``to_columnar`` to a list response or the results of a paginated one"""
+    if isinstance(data, list) and all(isinstance(row, dict) for row in data):
+        return to_columnar(data)
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        rows = data['results']
+        if all(isinstance(row, dict) for row in rows):
+            data = {key: value for key, value in data.items() if key != 'results'}
+            data.update(to_columnar(rows))
+    # Anything else (details, errors, statistics) is rendered unchanged
+    return data
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """JSON renderer that lays list results out as columns and row arrays"""
+    media_type = COLUMNAR_MEDIA_TYPE
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(columnar_data(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """MessagePack renderer; dates and other non-native types are encoded as in JSON"""
+    media_type = MSGPACK_MEDIA_TYPE
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Renders a list as one JSON document per line, anything else as a single line"""
+    media_type = NDJSON_MEDIA_TYPE
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return b''.join(ndjson_line(row) for row in rows)
@@ -0,0 +1,164 @@
+"""
+Monthly scan rollups for the analytics dashboard.
+
+``ScanRollup`` holds one row per (month, body part, institution, diagnosis)
+with the number of scans in it, so dashboards and statistics sum a few
+hundred rows instead of aggregating every scan.
+
+Saves and deletes apply +1/-1 counter deltas once their transaction commits
+(see ``signals.py``). Bulk writes that bypass model signals are covered by
+refreshing: a month is recomputed from the scans table with a single grouped
+query, which is idempotent and safe to repeat.
+"""
+from datetime import date
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .cache import bump_data_generation
+from .models import ScanRollup, XRay
+
+
+ROLLUP_DIMENSIONS = ['body_part', 'institution', 'diagnosis']
+
+
+def month_start(value):
+    """Return the first day of the month of a date"""
+    return date(value.year, value.month, 1)
+
+
+def next_month(value):
+    """Return the first day of the month after a date"""
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def rollup_key(scan_date, body_part, institution, diagnosis):
+    """Return the rollup bucket a scan is counted in"""
+    return (month_start(scan_date), body_part, institution, diagnosis)
+
+
+def apply_rollup_deltas(deltas):
+    """
+    Add ``{rollup key: delta}`` counter changes to the rollup table.
+
+    Increments use ``F()`` expressions so concurrent writers don't lose
+    updates; buckets that drop to zero are removed so they no longer show
+    up as distinct values.
+    """
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        month, body_part, institution, diagnosis = key
+        bucket = ScanRollup.objects.filter(
+            month=month, body_part=body_part, institution=institution, diagnosis=diagnosis
+        )
+        if delta < 0:
+            # A bucket that would reach zero is removed; one that would go
+            # negative has drifted and is removed too, for repair to redo.
+            # Both steps are conditional, so a bucket another writer grows
+            # in between is decremented on the next pass instead of deleted
+            while not bucket.filter(scan_count__gt=-delta).update(scan_count=F('scan_count') + delta):
+                if bucket.filter(scan_count__lte=-delta).delete()[0] or not bucket.exists():
+                    break
+            continue
+        if bucket.update(scan_count=F('scan_count') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                ScanRollup.objects.create(
+                    month=month, body_part=body_part, institution=institution,
+                    diagnosis=diagnosis, scan_count=delta,
+                )
+        except IntegrityError:
+            # Another writer created the bucket first
+            bucket.update(scan_count=F('scan_count') + delta)
+
+
+def refresh_rollups(months=None):
+    """
+    Recompute rollup rows from the scans table.
+
+    ``months`` limits the refresh to the given months (any date inside the
+    month works); by default every month is rebuilt. Returns the number of
+    rollup rows written.
+    """
+    scans = XRay.objects.annotate(month=TruncMonth('scan_date'))
+    rollups = ScanRollup.objects.all()
+    if months is not None:
+        months = {month_start(value) for value in months}
+        if not months:
+            return 0
+        scans = scans.filter(month__in=months)
+        rollups = rollups.filter(month__in=months)
+
+    rows = [
+        ScanRollup(scan_count=row.pop('scan_count'), **row)
+        for row in scans.values('month', *ROLLUP_DIMENSIONS).annotate(scan_count=Count('id')).order_by()
+    ]
+    with transaction.atomic():
+        rollups.delete()
+        ScanRollup.objects.bulk_create(rows, batch_size=500)
+        # Cached statistics and filter options are read from the rollups
+        transaction.on_commit(bump_data_generation)
+    return len(rows)
+
+
+def total_scans():
+    """Return the number of scans covered by the rollups"""
+    return ScanRollup.objects.aggregate(total=Sum('scan_count'))['total'] or 0
+
+
+def top_values(field, limit=20):
+    """Return the most frequent values of a dimension as name/count dicts"""
+    rows = (
+        ScanRollup.objects.values(field)
+        .annotate(count=Sum('scan_count'))
+        .order_by('-count', field)[:limit]
+    )
+    return [{'name': row[field], 'count': row['count']} for row in rows]
+
+
+def monthly_counts():
+    """
+    Return scans per month from the first to the last scanned month.
+
+    Months without scans are included with a zero count, and months are
+    formatted like Elasticsearch ``date_histogram`` keys.
+    """
+    counts = dict(
+        ScanRollup.objects.values_list('month')
+        .annotate(count=Sum('scan_count'))
+        .order_by('month')
+    )
+    if not counts:
+        return []
+
+    buckets = []
+    month, last = min(counts), max(counts)
+    while month <= last:
+        buckets.append({
+            'month': f'{month.isoformat()}T00:00:00.000Z',
+            'count': counts.get(month, 0),
+        })
+        month = next_month(month)
+    return buckets
+
+
+def distinct_values(field):
+    """Return the sorted values of a dimension that have scans"""
+    return list(
+        ScanRollup.objects.filter(scan_count__gt=0)
+        .values_list(field, flat=True)
+        .distinct()
+        .order_by(field)
+    )
+
+
+def dimension_counts(field):
+    """Return ``{value: scans}`` for a dimension, ordered by value"""
+    return dict(
+        ScanRollup.objects.values_list(field)
+        .annotate(count=Sum('scan_count'))
+        .order_by(field)
+    )
@@ -0,0 +1,160 @@
+"""
+Query building for the Elasticsearch search endpoints.
+
+Only the free-text query is scored. Every other constraint goes into the
+``bool.filter`` list as its own clause, so Elasticsearch can skip scoring it
+and cache each clause independently in the node query cache. Date bounds are
+rounded to whole days, which keeps equivalent requests byte-identical and
+therefore cacheable.
+"""
+from django.utils.dateparse import parse_date
+from elasticsearch_dsl import Q
+
+from .documents import XRayDocument
+
+
+# Fields and boosts for the scored free-text query
+TEXT_SEARCH_FIELDS = [
+    'description^2.0',
+    'description.english^1.5',
+    'diagnosis^3.0',
+    'tags.text^1.8',
+    'patient_id^1.0',
+    'institution^1.2',
+    'body_part^1.5',
+]
+
+FILTER_PARAMS = ['body_part', 'diagnosis', 'institution', 'tags', 'date_from', 'date_to']
+
+# Large fields only used for ranking, left out of returned hits
+EXCLUDED_SOURCE_FIELDS = ['image_embedding']
+
+# Image similarity candidates examined per shard for every kNN hit returned
+KNN_CANDIDATES_PER_HIT = 5
+
+
+def get_filter_params(query_params):
+    """Return the non-empty filter parameters of a request"""
+    return {
+        name: query_params.get(name, '').strip()
+        for name in FILTER_PARAMS
+        if query_params.get(name, '').strip()
+    }
+
+
+def text_query(query):
+    """Scored multi-field query with fuzzy matching for typos"""
+    return Q(
+        'multi_match',
+        query=query,
+        fields=TEXT_SEARCH_FIELDS,
+        fuzziness='AUTO',
+        type='best_fields'
+    )
+
+
+def rounded_date(value):
+    """
+    Validate a ``YYYY-MM-DD`` date and round it to the day with date math.
+
+    ``gte`` rounds down to the start of the day and ``lte`` rounds up to its
+    end, so the bounds stay inclusive.
+    """
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(f'Invalid date: {value!r}, expected YYYY-MM-DD')
+    return f'{parsed.isoformat()}||/d'
+
+
+def build_filters(params):
+    """
+    Build non-scoring filter clauses from request parameters.
+
+    Raises ValueError for malformed dates.
+    """
+    filters = []
+
+    if params.get('body_part'):
+        filters.append(Q('term', **{'body_part.raw': params['body_part']}))
+
+    if params.get('diagnosis'):
+        filters.append(Q('term', **{'diagnosis.raw': params['diagnosis']}))
+
+    if params.get('institution'):
+        filters.append(Q('term', **{'institution.raw': params['institution']}))
+
+    if params.get('tags'):
+        tag_list = sorted({tag.strip() for tag in params['tags'].split(',') if tag.strip()})
+        for tag in tag_list:
+            filters.append(Q('term', tags=tag))
+
+    date_range = {}
+    if params.get('date_from'):
+        date_range['gte'] = rounded_date(params['date_from'])
+    if params.get('date_to'):
+        date_range['lte'] = rounded_date(params['date_to'])
+    if date_range:
+        filters.append(Q('range', scan_date=date_range))
+
+    return filters
+
+
+def build_xray_search(query='', params=None, search=None):
+    """
+    Return a Search with ``query`` scored and ``params`` in filter context.
+
+    Raises ValueError for malformed filter parameters.
+    """
+    search = search if search is not None else XRayDocument.search()
+    search = search.source(excludes=EXCLUDED_SOURCE_FIELDS)
+
+    if query:
+        search = search.query(text_query(query))
+
+    filters = build_filters(params or {})
+    if filters:
+        search = search.query('bool', filter=filters)
+
+    return search
+
+
+def aggregation_search(search=None):
+    """
+    Return a ``size: 0`` Search that uses the shard request cache.
+
+    Aggregation-only responses are cached per shard until the next refresh
+    that changes the shard, so repeated dashboard loads skip recomputation.
+    """
+    search = search if search is not None else XRayDocument.search()
+    return search.extra(size=0).params(request_cache=True)
+
+
+def build_hybrid_search(vector, query='', params=None, size=20, exclude_id=None,
+                        image_boost=1.0, text_boost=1.0):
+    """
+    Return a Search ranking by image similarity and text relevance together.
+
+    The kNN clause finds the ``size`` scans whose image embeddings are closest
+    to ``vector``; if ``query`` is given, its BM25 score is added to theirs in
+    the same request, and text matches outside the nearest neighbours are
+    still returned. Filters apply to both sides. Raises ValueError for
+    malformed filter parameters.
+    """
+    filters = build_filters(params or {})
+    excluded = [Q('ids', values=[str(exclude_id)])] if exclude_id is not None else []
+
+    search = XRayDocument.search().source(excludes=EXCLUDED_SOURCE_FIELDS).extra(knn={
+        'field': 'image_embedding',
+        'query_vector': vector,
+        'k': size,
+        'num_candidates': max(size * KNN_CANDIDATES_PER_HIT, 100),
+        'filter': Q('bool', filter=filters, must_not=excluded).to_dict(),
+        'boost': image_boost,
+    })
+
+    if query:
+        search = search.query(
+            'bool', must=[text_query(query)], filter=filters, must_not=excluded, boost=text_boost
+        )
+
+    return search[:size]
@@ -1,3 +1,5 @@
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
 from rest_framework import serializers
 from .models import XRay
 
@@ -96,6 +98,60 @@ class XRayListSerializer(serializers.ModelSerializer):
         return obj.get_tags_display()
 
 
+class FastXRayListSerializer:
+    """
+    Serializes list rows from ``.values()`` dicts without model instances
+    
+    Produces the same data as XRayListSerializer. The absolute media URL
+    prefix is built once per serializer instead of once per row, and tags
+    are joined inline.
+    """
+    
+    source_fields = [
+        'id', 'patient_id', 'image', 'body_part', 'scan_date',
+        'institution', 'diagnosis', 'tags', 'created_at'
+    ]
+    
+    def __init__(self, rows, context=None):
+        self.rows = rows
+        self.context = context or {}
+    
+    def get_image_url_builder(self):
+        """Return a function mapping a stored image name to its URL"""
+        request = self.context.get('request')
+        storage = XRay._meta.get_field('image').storage
+        if isinstance(storage, FileSystemStorage):
+            base_url = storage.base_url
+            if request:
+                base_url = request.build_absolute_uri(base_url)
+            return lambda name: base_url + filepath_to_uri(name).lstrip('/')
+        # Other storages may compute URLs per file (signed URLs, CDNs)
+        if request:
+            return lambda name: request.build_absolute_uri(storage.url(name))
+        return storage.url
+    
+    def iter_data(self):
+        """Yield serialized rows one at a time, for streaming"""
+        image_url = self.get_image_url_builder()
+        format_datetime = serializers.DateTimeField().to_representation
+        for row in self.rows:
+            yield {
+                'id': row['id'],
+                'patient_id': row['patient_id'],
+                'image_url': image_url(row['image']) if row['image'] else None,
+                'body_part': row['body_part'],
+                'scan_date': row['scan_date'].isoformat() if row['scan_date'] else None,
+                'institution': row['institution'],
+                'diagnosis': row['diagnosis'],
+                'tags_display': ", ".join(row['tags']) if row['tags'] else "No tags",
+                'created_at': format_datetime(row['created_at']),
+            }
+    
+    @property
+    def data(self):
+        return list(self.iter_data())
+
+
 class XRayCreateSerializer(serializers.ModelSerializer):
     """
     Serializer for creating new X-ray records
@@ -136,4 +192,29 @@ class XRayCreateSerializer(serializers.ModelSerializer):
         if not isinstance(value, list):
             raise serializers.ValidationError("Tags must be a list or comma-separated string")
         
-        return value 
\ No newline at end of file
+        return value 
+
+
+class XRayBulkUpdateSerializer(serializers.Serializer):
+    """
+    Validates a bulk update: the scans to change, given as ``ids`` or as
+    list ``filter`` parameters, and the changes to apply to all of them
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    filter = serializers.DictField(child=serializers.CharField(), required=False, allow_empty=False)
+    add_tags = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    remove_tags = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    body_part = serializers.CharField(required=False, max_length=50)
+    diagnosis = serializers.CharField(required=False, max_length=200)
+    
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError("Select the scans with either ids or filter")
+        if not (attrs['add_tags'] or attrs['remove_tags'] or 'body_part' in attrs or 'diagnosis' in attrs):
+            raise serializers.ValidationError(
+                "Nothing to update; give add_tags, remove_tags, body_part or diagnosis"
+            )
+        # Keep order, drop repeats
+        attrs['add_tags'] = list(dict.fromkeys(attrs['add_tags']))
+        attrs['remove_tags'] = list(dict.fromkeys(attrs['remove_tags']))
+        return attrs
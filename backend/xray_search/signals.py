@@ -0,0 +1,98 @@
+"""
+Signal handlers that keep the scan rollups in step with the scans table.
+
+Each save or delete turns into +1/-1 deltas on the affected rollup buckets.
+The deltas are applied in ``transaction.on_commit``, so rolled-back writes
+never touch the rollups and the counting happens after the row lock is
+released.
+
+Committed writes also bump the cache generations (see ``cache.py``): every
+write bumps the data generation, updates and deletes the mutation generation.
+Saved scans are also added to the distinct-patient sketches on commit.
+
+Body part categories feed the filter dropdowns, so their writes bump the
+data generation too.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_data_generation, bump_mutation_generation
+from .models import BodyPart, XRay
+from .rollups import apply_rollup_deltas, rollup_key
+from .sketches import add_patients, sketch_keys
+
+
+ROLLUP_FIELDS = ['scan_date', 'body_part', 'institution', 'diagnosis']
+
+
+def instance_rollup_key(xray):
+    """Return the rollup bucket of an in-memory X-ray"""
+    scan_date = XRay._meta.get_field('scan_date').to_python(xray.scan_date)
+    return rollup_key(scan_date, xray.body_part, xray.institution, xray.diagnosis)
+
+
+def schedule_deltas(deltas):
+    transaction.on_commit(lambda: apply_rollup_deltas(deltas))
+
+
+@receiver(pre_save, sender=XRay, dispatch_uid='xray_rollups_pre_save')
+def remember_rollup_key(sender, instance, **kwargs):
+    """Record the bucket and patient the stored row is counted under before it changes"""
+    instance._stored_rollup_key = None
+    instance._stored_patient_id = None
+    if instance.pk is not None:
+        stored = XRay.objects.filter(pk=instance.pk).values('patient_id', *ROLLUP_FIELDS).first()
+        if stored is not None:
+            instance._stored_rollup_key = rollup_key(*(stored[field] for field in ROLLUP_FIELDS))
+            instance._stored_patient_id = stored['patient_id']
+
+
+@receiver(post_save, sender=XRay, dispatch_uid='xray_rollups_post_save')
+def count_saved_scan(sender, instance, created, **kwargs):
+    new_key = instance_rollup_key(instance)
+    old_key = getattr(instance, '_stored_rollup_key', None)
+    if old_key == new_key:
+        return
+    deltas = {new_key: 1}
+    if old_key is not None:
+        deltas[old_key] = -1
+    schedule_deltas(deltas)
+
+
+@receiver(post_save, sender=XRay, dispatch_uid='xray_sketches_post_save')
+def sketch_saved_scan(sender, instance, **kwargs):
+    new_key = instance_rollup_key(instance)
+    if (
+        new_key == getattr(instance, '_stored_rollup_key', None)
+        and instance.patient_id == getattr(instance, '_stored_patient_id', None)
+    ):
+        return
+    month, body_part, institution, _ = new_key
+    keys = sketch_keys(month, body_part, institution)
+    patient_id = instance.patient_id
+    transaction.on_commit(lambda: add_patients(keys, [patient_id]))
+
+
+@receiver(post_delete, sender=XRay, dispatch_uid='xray_rollups_post_delete')
+def uncount_deleted_scan(sender, instance, **kwargs):
+    schedule_deltas({instance_rollup_key(instance): -1})
+
+
+@receiver(post_save, sender=XRay, dispatch_uid='xray_cache_post_save')
+def invalidate_on_save(sender, instance, created, **kwargs):
+    transaction.on_commit(bump_data_generation)
+    if not created:
+        transaction.on_commit(bump_mutation_generation)
+
+
+@receiver(post_delete, sender=XRay, dispatch_uid='xray_cache_post_delete')
+def invalidate_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(bump_data_generation)
+    transaction.on_commit(bump_mutation_generation)
+
+
+@receiver(post_save, sender=BodyPart, dispatch_uid='body_part_cache_post_save')
+@receiver(post_delete, sender=BodyPart, dispatch_uid='body_part_cache_post_delete')
+def invalidate_on_body_part_change(sender, instance, **kwargs):
+    transaction.on_commit(bump_data_generation)
@@ -0,0 +1,131 @@
+"""
+Distinct-patient sketches for dataset planning.
+
+``PatientSketch`` keeps a HyperLogLog sketch of the patients scanned per
+institution, body part and month, plus one over all scans, so "unique
+patients" is read from stored estimates instead of running
+``COUNT(DISTINCT patient_id)`` over the scans table.
+
+Saved scans are added once their transaction commits (see ``signals.py``).
+Sketches can't forget a patient, so deletes and re-bucketed scans leave
+them slightly high until ``rebuild_sketches`` recomputes them.
+"""
+from datetime import date, timedelta
+
+from django.db import IntegrityError, transaction
+
+from .cache import bump_data_generation
+from .hll import HyperLogLog, hash_value
+from .models import PatientSketch, XRay
+from .rollups import month_start
+
+
+def sketch_keys(scan_date, body_part, institution):
+    """Return the ``(dimension, value)`` sketches a scan is counted in"""
+    return [
+        ('total', ''),
+        ('institution', institution),
+        ('body_part', body_part),
+        ('month', f'{scan_date:%Y-%m}'),
+    ]
+
+
+def add_patients(keys, patient_ids):
+    """Add patient ids to the sketches for ``keys``, creating them as needed"""
+    hashes = [hash_value(patient_id) for patient_id in patient_ids]
+    for dimension, value in keys:
+        with transaction.atomic():
+            sketch = (
+                PatientSketch.objects.select_for_update()
+                .filter(dimension=dimension, value=value)
+                .first()
+            )
+            if sketch is None:
+                hll = HyperLogLog()
+                for hashed in hashes:
+                    hll.add_hash(hashed)
+                try:
+                    with transaction.atomic():
+                        PatientSketch.objects.create(
+                            dimension=dimension, value=value,
+                            registers=hll.to_bytes(), estimate=hll.estimate(),
+                        )
+                    continue
+                except IntegrityError:
+                    # Another writer created the sketch first
+                    sketch = PatientSketch.objects.select_for_update().get(dimension=dimension, value=value)
+
+            hll = HyperLogLog(sketch.registers)
+            changed = False
+            for hashed in hashes:
+                changed = hll.add_hash(hashed) or changed
+            if changed:
+                sketch.registers = hll.to_bytes()
+                sketch.estimate = hll.estimate()
+                sketch.save(update_fields=['registers', 'estimate', 'updated_at'])
+
+
+def rebuild_sketches():
+    """Recompute every sketch from the scans table; return the number written"""
+    sketches = {}
+    scans = XRay.objects.values_list('patient_id', 'scan_date', 'body_part', 'institution').order_by()
+    for patient_id, scan_date, body_part, institution in scans.iterator(chunk_size=2000):
+        hashed = hash_value(patient_id)
+        for key in sketch_keys(scan_date, body_part, institution):
+            sketch = sketches.get(key)
+            if sketch is None:
+                sketch = sketches[key] = HyperLogLog()
+            sketch.add_hash(hashed)
+
+    rows = [
+        PatientSketch(dimension=dimension, value=value, registers=hll.to_bytes(), estimate=hll.estimate())
+        for (dimension, value), hll in sketches.items()
+    ]
+    with transaction.atomic():
+        PatientSketch.objects.all().delete()
+        PatientSketch.objects.bulk_create(rows, batch_size=100)
+        transaction.on_commit(bump_data_generation)
+    return len(rows)
+
+
+def recent_months(today, count):
+    """Return the ``YYYY-MM`` keys of the last ``count`` months, newest first"""
+    month = month_start(today)
+    months = []
+    for _ in range(count):
+        months.append(f'{month:%Y-%m}')
+        month = month_start(month - timedelta(days=1))
+    return months
+
+
+def merged_estimate(dimension, values):
+    """Estimate the distinct patients across several sketches of a dimension"""
+    merged = HyperLogLog()
+    for registers in PatientSketch.objects.filter(dimension=dimension, value__in=values).values_list('registers', flat=True):
+        merged.merge(HyperLogLog(registers))
+    return merged.estimate()
+
+
+def unique_patients(today=None):
+    """
+    Return estimated distinct patients overall, per institution, body part
+    and month, and over the last twelve months (current month included)
+    """
+    block = {
+        'total': 0,
+        'last_12_months': 0,
+        'by_institution': {},
+        'by_body_part': {},
+        'by_month': {},
+    }
+    for dimension, value, estimate in PatientSketch.objects.values_list('dimension', 'value', 'estimate'):
+        if dimension == 'total':
+            block['total'] = estimate
+        elif value:  # Skip empty values
+            block[f'by_{dimension}'][value] = estimate
+    for name in ['by_institution', 'by_body_part', 'by_month']:
+        block[name] = dict(sorted(block[name].items()))
+
+    months = recent_months(today or date.today(), 12)
+    block['last_12_months'] = merged_estimate('month', [month for month in months if month in block['by_month']])
+    return block
@@ -1,3 +1,1321 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import brotli
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import QuerySet
+from django.db.models.sql import UpdateQuery
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from elasticsearch_dsl import Search
+from elasticsearch_dsl.connections import connections
+import msgpack
+from PIL import Image, ImageDraw
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+import zstandard
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+from . import async_views, elasticsearch_views, indexing
+from .bulk import tags_expression
+from .cache import (
+    DERIVED_CACHE_TIMEOUT, data_cache_key, get_data_generation, get_or_compute, refresh_in_background,
+)
+from .cache_backends import TieredCache
+from .checks import check_shared_cache, warn_if_cache_not_shared
+from .elasticsearch_fake import FakeAsyncNode, FakeNode, cluster
+from .embeddings import EMBEDDING_DIMS, compute_embedding
+from .hll import HyperLogLog
+from .indexing import (
+    ALIAS, get_alias_targets, get_connection, get_indexed_ids, get_watermark, rebuild_index, reconcile_ids,
+    sync_changes,
+)
+from .middleware import CompressionMiddleware, select_encoding
+from .models import BodyPart, PatientSketch, ScanRollup, XRay
+from .renderers import (
+    MSGPACK_MEDIA_TYPE, ORJSON_MEDIA_TYPE, MessagePackRenderer, ORJSONParser, ORJSONRenderer, to_columnar,
+)
+from .rollups import apply_rollup_deltas, dimension_counts, monthly_counts, refresh_rollups, rollup_key
+from .search_queries import aggregation_search, build_xray_search, text_query
+from .serializers import FastXRayListSerializer, XRayListSerializer
+from .sketches import rebuild_sketches, unique_patients
+
+
+FAKE_ELASTICSEARCH_DSL = {
+    'default': {
+        'hosts': 'http://localhost:9200',
+        'timeout': 20,
+        'node_class': FakeNode,
+    },
+}
+
+SAMPLE_SCANS = [
+    ('P001', 'Chest', date(2024, 1, 10), 'Mayo Clinic', 'Pneumonia',
+     'Right lower lobe consolidation consistent with pneumonia', ['lung', 'infection']),
+    ('P002', 'Chest', date(2024, 2, 3), 'Cleveland Clinic', 'Normal',
+     'Clear lungs, no acute findings', ['lung']),
+    ('P003', 'Knee', date(2024, 2, 20), 'Mayo Clinic', 'Fracture',
+     'Tibial plateau fracture with joint effusion', ['trauma', 'bone']),
+    ('P004', 'Spine', date(2024, 3, 5), 'Johns Hopkins', 'Degenerative disc disease',
+     'Disc space narrowing at L4-L5', ['degenerative']),
+]
+
+
+def make_image(box, speck=None):
+    """Return a PNG file object of a bright box on a dark background"""
+    image = Image.new('L', (64, 64), 20)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle(box, fill=230)
+    if speck:
+        draw.rectangle(speck, fill=120)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    buffer.seek(0)
+    return buffer
+
+
+def cosine(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+@override_settings(ELASTICSEARCH_DSL=FAKE_ELASTICSEARCH_DSL)
+class FakeElasticsearchTestCase(TestCase):
+    """Sample scans, with Elasticsearch served by the in-process fake"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Connect before fixtures are created so signal-driven indexing
+        # (when django_elasticsearch_dsl is installed) reaches the fake
+        connections.configure(**FAKE_ELASTICSEARCH_DSL)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections.configure(**getattr(settings, 'ELASTICSEARCH_DSL', {}))
+
+    @classmethod
+    def setUpTestData(cls):
+        for patient_id, body_part, scan_date, institution, diagnosis, description, tags in SAMPLE_SCANS:
+            XRay.objects.create(
+                patient_id=patient_id,
+                image=f'xrays/{patient_id}.png',
+                body_part=body_part,
+                scan_date=scan_date,
+                institution=institution,
+                diagnosis=diagnosis,
+                description=description,
+                tags=tags,
+            )
+
+    def setUp(self):
+        cache.clear()
+        cluster.reset()
+        rebuild_index()
+        self.factory = APIRequestFactory()
+
+
+class ElasticsearchViewsTests(FakeElasticsearchTestCase):
+
+    def test_search(self):
+        response = self.client.get(reverse('xray_search:elasticsearch_search'), {'q': 'pneumonia'}, HTTP_HOST='localhost')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['patient_id'] for result in response.data['results']], ['P001'])
+        self.assertEqual(response.data['results'][0]['tags'], ['lung', 'infection'])
+
+    def test_advanced_search_matches_misspelled_terms(self):
+        request = self.factory.get('/', {'q': 'pnuemonia'})
+        response = elasticsearch_views.elasticsearch_advanced_search(request)
+
+        self.assertEqual([result['patient_id'] for result in response.data['results']], ['P001'])
+
+    def test_advanced_search_filters_and_highlights(self):
+        request = self.factory.get('/', {'q': 'lungs', 'body_part': 'Chest', 'date_from': '2024-02-01'})
+        response = elasticsearch_views.elasticsearch_advanced_search(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], 1)
+        result = response.data['results'][0]
+        self.assertEqual(result['patient_id'], 'P002')
+        self.assertIn('<mark>lungs</mark>', result['highlight']['description'][0])
+
+    def test_advanced_search_filters_by_tag(self):
+        request = self.factory.get('/', {'tags': 'lung'})
+        response = elasticsearch_views.elasticsearch_advanced_search(request)
+
+        self.assertEqual(
+            sorted(result['patient_id'] for result in response.data['results']),
+            ['P001', 'P002']
+        )
+
+    def test_advanced_search_filters_on_exact_values(self):
+        for params, expected in [
+            ({'institution': 'Mayo Clinic'}, ['P001', 'P003']),
+            ({'institution': 'Clinic'}, []),
+            ({'diagnosis': 'Degenerative disc disease'}, ['P004']),
+            ({'diagnosis': 'disc'}, []),
+        ]:
+            response = elasticsearch_views.elasticsearch_advanced_search(self.factory.get('/', params))
+            self.assertEqual(sorted(result['patient_id'] for result in response.data['results']), expected)
+
+    def test_advanced_search_rejects_malformed_dates(self):
+        request = self.factory.get('/', {'date_to': '03/05/2024'})
+        response = elasticsearch_views.elasticsearch_advanced_search(request)
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_suggestions(self):
+        request = self.factory.get('/', {'field': 'institution', 'text': 'may'})
+        response = elasticsearch_views.elasticsearch_suggestions(request)
+
+        self.assertEqual(response.data['suggestions'], ['Mayo Clinic'])
+
+    def test_analytics(self):
+        response = elasticsearch_views.elasticsearch_analytics(self.factory.get('/'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_scans'], 4)
+        self.assertEqual(response.data['body_parts'][0], {'name': 'Chest', 'count': 2})
+        self.assertEqual(response.data['institutions'][0], {'name': 'Mayo Clinic', 'count': 2})
+        self.assertEqual(
+            [bucket['count'] for bucket in response.data['scans_by_month']],
+            [1, 2, 1]
+        )
+        self.assertIn({'tag': 'lung', 'count': 2}, response.data['popular_tags'])
+
+    def test_search_page(self):
+        response = self.client.get(
+            reverse('xray_search:elasticsearch_search_page'),
+            {'q': 'mayo', 'body_part': 'Knee', 'page_size': 1},
+            HTTP_HOST='localhost',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(data['results'][0]['patient_id'], 'P003')
+        self.assertEqual(data['facets']['body_parts'], [{'name': 'Knee', 'count': 1}])
+        self.assertEqual(data['suggestions']['institution'], ['Mayo Clinic'])
+
+    def test_search_page_closes_its_client_under_wsgi(self):
+        with mock.patch.object(FakeAsyncNode, 'close', autospec=True) as close:
+            response = self.client.get(
+                reverse('xray_search:elasticsearch_search_page'), {'q': 'mayo'}, HTTP_HOST='localhost'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        close.assert_awaited_once()
+        self.assertEqual(len(async_views._clients), 0)
+
+    async def test_search_page_shares_one_client_under_asgi(self):
+        url = reverse('xray_search:elasticsearch_search_page')
+        spy = mock.patch.object(async_views, 'create_async_client', wraps=async_views.create_async_client)
+        with self.settings(ALLOWED_HOSTS=['testserver']), spy as create:
+            for _ in range(2):
+                response = await self.async_client.get(url, {'q': 'mayo'})
+                self.assertEqual(response.status_code, 200)
+
+        create.assert_called_once()
+        await async_views.get_async_client().close()
+
+
+class ImageSimilarityTests(FakeElasticsearchTestCase):
+
+    def setUp(self):
+        self.left = compute_embedding(make_image((0, 0, 31, 63)))
+        self.left_speck = compute_embedding(make_image((0, 0, 31, 63), speck=(40, 40, 44, 44)))
+        self.top = compute_embedding(make_image((0, 0, 63, 31)))
+        for patient_id, embedding in [('P001', self.left), ('P002', self.left_speck), ('P003', self.top)]:
+            XRay.objects.filter(patient_id=patient_id).update(image_embedding=embedding)
+        super().setUp()
+
+    def test_similar_images_have_closer_embeddings(self):
+        self.assertEqual(len(self.left), EMBEDDING_DIMS)
+        self.assertGreater(cosine(self.left, self.left_speck), cosine(self.left, self.top))
+
+    def test_unreadable_image_has_no_embedding(self):
+        self.assertIsNone(compute_embedding(io.BytesIO(b'not an image')))
+
+    def test_only_new_uploads_are_embedded_on_save(self):
+        xray = XRay.objects.get(patient_id='P004')
+        with mock.patch('xray_search.models.compute_embedding', return_value=None) as embed:
+            xray.diagnosis = 'Normal'
+            xray.save()
+            embed.assert_not_called()
+
+            xray.image = SimpleUploadedFile('P004.png', make_image((0, 0, 63, 31)).getvalue())
+            with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+                xray.save()
+            embed.assert_called_once()
+
+    def test_hybrid_search_like_scan(self):
+        reference = XRay.objects.get(patient_id='P001')
+        response = self.client.get(
+            reverse('xray_search:elasticsearch_hybrid_search'),
+            {'like': reference.id, 'size': 2},
+            HTTP_HOST='localhost',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([result['patient_id'] for result in results], ['P002', 'P003'])
+        self.assertNotIn('image_embedding', results[0])
+
+    def test_hybrid_search_combines_text_and_image_scores(self):
+        upload = make_image((0, 0, 31, 63))
+        upload.name = 'query.png'
+        response = self.client.post(
+            reverse('xray_search:elasticsearch_hybrid_search'),
+            {'image': upload, 'q': 'fracture', 'size': 1},
+            HTTP_HOST='localhost',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        # P001 is the nearest image; the text match on P003 outranks it
+        self.assertEqual(response.data['total'], 2)
+        self.assertEqual(response.data['results'][0]['patient_id'], 'P003')
+
+    def test_hybrid_search_requires_reference_image(self):
+        response = self.client.get(reverse('xray_search:elasticsearch_hybrid_search'), HTTP_HOST='localhost')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchIndexMaintenanceTests(FakeElasticsearchTestCase):
+
+    def test_rebuild_swaps_alias_to_new_version(self):
+        es = get_connection()
+        self.assertEqual(get_alias_targets(es), [f'{ALIAS}_v1'])
+
+        rebuild_index()
+
+        self.assertEqual(get_alias_targets(es), [f'{ALIAS}_v2'])
+        self.assertFalse(es.indices.exists(index=f'{ALIAS}_v1'))
+        self.assertEqual(es.count(index=ALIAS)['count'], 4)
+
+    def test_rebuild_catches_up_on_writes_made_during_the_fill(self):
+        es = get_connection()
+        fill = indexing.index_queryset
+        calls = []
+
+        def fill_then_write(*args, **kwargs):
+            count = fill(*args, **kwargs)
+            if not calls:
+                # Bypasses signals, like a backfill script would
+                XRay.objects.filter(patient_id='P002').update(diagnosis='Atelectasis', updated_at=timezone.now())
+            calls.append(args)
+            return count
+
+        with mock.patch('xray_search.indexing.index_queryset', side_effect=fill_then_write):
+            rebuild_index(keep_old=True)
+
+        self.assertEqual(get_alias_targets(es), [f'{ALIAS}_v2'])
+        self.assertTrue(es.indices.exists(index=f'{ALIAS}_v1'))
+        hits = es.search(index=ALIAS, query={'term': {'diagnosis.raw': 'Atelectasis'}})['hits']['hits']
+        self.assertEqual([hit['_source']['patient_id'] for hit in hits], ['P002'])
+
+    def test_rebuild_replaces_a_legacy_concrete_index(self):
+        es = get_connection()
+        cluster.reset()
+        es.indices.create(index=ALIAS)
+
+        rebuild_index()
+
+        self.assertEqual(get_alias_targets(es), [f'{ALIAS}_v1'])
+        self.assertEqual(es.count(index=ALIAS)['count'], 4)
+
+    def test_sync_changes_pushes_updated_rows(self):
+        es = get_connection()
+        XRay.objects.filter(patient_id='P002').update(diagnosis='Atelectasis', updated_at=timezone.now())
+
+        # Rows written before the rebuild are below the watermark
+        self.assertEqual(sync_changes(es, overlap=timedelta(0)), 1)
+
+        hits = es.search(index=ALIAS, query={'term': {'diagnosis.raw': 'Atelectasis'}})['hits']['hits']
+        self.assertEqual([hit['_source']['patient_id'] for hit in hits], ['P002'])
+
+    def test_sync_advances_the_watermark(self):
+        es = get_connection()
+        XRay.objects.filter(patient_id='P002').update(diagnosis='Atelectasis', updated_at=timezone.now())
+        sync_changes(es, overlap=timedelta(0))
+
+        xray = XRay.objects.get(patient_id='P002')
+        self.assertEqual(get_watermark(es), (xray.updated_at, xray.id))
+        # Nothing changed since, so nothing is sent again
+        self.assertEqual(sync_changes(es, overlap=timedelta(0)), 0)
+
+    def test_reconcile_diffs_indexed_and_stored_ids(self):
+        es = get_connection()
+        missing = XRay.objects.get(patient_id='P004')
+        es.delete(index=ALIAS, id=missing.id, refresh=True)
+        es.index(index=ALIAS, id='9999', document={'patient_id': 'P999'}, refresh=True)
+
+        self.assertEqual(reconcile_ids(es, ALIAS), (1, 1))
+        es.indices.refresh(index=ALIAS)
+        self.assertEqual(get_indexed_ids(es, ALIAS), set(XRay.objects.values_list('id', flat=True)))
+
+    def test_refresh_rollups_moves_scans_between_months(self):
+        XRay.objects.filter(patient_id='P004').update(scan_date=date(2024, 1, 20))
+
+        refresh_rollups([date(2024, 3, 5), date(2024, 1, 20)])
+
+        self.assertEqual(monthly_counts(), [
+            {'month': '2024-01-01T00:00:00.000Z', 'count': 2},
+            {'month': '2024-02-01T00:00:00.000Z', 'count': 2},
+        ])
+
+
+class SearchMappingTests(FakeElasticsearchTestCase):
+
+    def test_mapping_declares_facet_text_and_suggest_subfields(self):
+        es = get_connection()
+        index = get_alias_targets(es)[0]
+        properties = es.indices.get_mapping(index=index)[index]['mappings']['properties']
+
+        for field in ['body_part', 'institution', 'diagnosis']:
+            self.assertEqual(properties[field]['type'], 'text')
+            self.assertEqual(properties[field]['fields']['raw'], {'type': 'keyword', 'eager_global_ordinals': True})
+            self.assertEqual(properties[field]['fields']['suggest']['type'], 'completion')
+        self.assertEqual(properties['tags']['type'], 'keyword')
+        self.assertEqual(properties['tags']['fields']['text']['type'], 'text')
+        self.assertEqual(properties['description']['fields']['english']['analyzer'], 'english')
+
+    def test_index_is_sorted_newest_scan_first(self):
+        es = get_connection()
+        index = get_alias_targets(es)[0]
+        settings = es.indices.get_settings(index=index)[index]['settings']['index']
+
+        self.assertEqual(settings['sort']['field'], ['scan_date', 'created_at'])
+        self.assertEqual(settings['sort']['order'], ['desc', 'desc'])
+
+    def test_tags_are_indexed_as_exact_keywords(self):
+        es = get_connection()
+        hits = es.search(index=ALIAS, query={'term': {'tags': 'lung'}})['hits']['hits']
+        self.assertEqual(sorted(hit['_source']['patient_id'] for hit in hits), ['P001', 'P002'])
+        # A keyword doesn't match part of a tag
+        self.assertEqual(es.count(index=ALIAS, query={'term': {'tags': 'lun'}})['count'], 0)
+
+
+class SearchQueryBuildingTests(SimpleTestCase):
+
+    def test_only_the_text_query_is_scored(self):
+        search = build_xray_search(
+            'lungs',
+            {
+                'body_part': 'Chest', 'diagnosis': 'Normal', 'institution': 'Cleveland Clinic',
+                'tags': 'lung, infection', 'date_from': '2024-02-01',
+            },
+            search=Search()
+        )
+        query = search.to_dict()['query']['bool']
+
+        self.assertEqual(query['must'], [text_query('lungs').to_dict()])
+        self.assertEqual(query['filter'], [
+            {'term': {'body_part.raw': 'Chest'}},
+            {'term': {'diagnosis.raw': 'Normal'}},
+            {'term': {'institution.raw': 'Cleveland Clinic'}},
+            {'term': {'tags': 'infection'}},
+            {'term': {'tags': 'lung'}},
+            {'range': {'scan_date': {'gte': '2024-02-01||/d'}}},
+        ])
+
+    def test_equivalent_requests_build_identical_queries(self):
+        first = build_xray_search('', {'tags': 'lung,infection', 'date_to': '2024-03-05'}, search=Search())
+        second = build_xray_search('', {'tags': ' infection , lung', 'date_to': '2024-03-05'}, search=Search())
+        self.assertEqual(first.to_dict(), second.to_dict())
+        self.assertNotIn('must', first.to_dict()['query']['bool'])
+
+    def test_malformed_dates_are_rejected(self):
+        with self.assertRaises(ValueError):
+            build_xray_search('', {'date_from': '03/05/2024'}, search=Search())
+
+    def test_aggregation_searches_use_the_request_cache(self):
+        search = aggregation_search(Search())
+        self.assertEqual(search.to_dict(), {'size': 0})
+        self.assertEqual(search._params, {'request_cache': True})
+
+
+class XRayStatsTests(FakeElasticsearchTestCase):
+
+    def test_stats_read_rollups(self):
+        today = timezone.now().date()
+        XRay.objects.filter(patient_id='P004').update(scan_date=today)
+        refresh_rollups()
+        rebuild_sketches()
+
+        # The conditional GET validators, rollup buckets, the partial
+        # month at the start of the window, sketch estimates and the recent
+        # month sketches to merge
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('xray_search:xray-stats'), HTTP_HOST='localhost')
+
+        self.assertEqual(response.data, {
+            'total_scans': 4,
+            'body_part_distribution': {'Chest': 2, 'Knee': 1, 'Spine': 1},
+            'institution_distribution': {'Cleveland Clinic': 1, 'Johns Hopkins': 1, 'Mayo Clinic': 2},
+            'recent_scans_30_days': 1,
+            'unique_patients': {
+                'total': 4,
+                'last_12_months': 1,
+                'by_institution': {'Cleveland Clinic': 1, 'Johns Hopkins': 1, 'Mayo Clinic': 2},
+                'by_body_part': {'Chest': 2, 'Knee': 1, 'Spine': 1},
+                'by_month': {'2024-01': 1, '2024-02': 2, f'{today:%Y-%m}': 1},
+            },
+        })
+
+    def test_rollups_follow_saves_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            xray = XRay.objects.create(
+                patient_id='P005', image='xrays/P005.png', body_part='Knee', scan_date=date(2024, 3, 9),
+                institution='Johns Hopkins', diagnosis='Normal', description='No acute findings',
+            )
+        self.assertEqual(dimension_counts('body_part'), {'Chest': 2, 'Knee': 2, 'Spine': 1})
+
+        xray.body_part = 'Hip'
+        with self.captureOnCommitCallbacks(execute=True):
+            xray.save()
+        self.assertEqual(dimension_counts('body_part'), {'Chest': 2, 'Hip': 1, 'Knee': 1, 'Spine': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            xray.delete()
+        self.assertEqual(dimension_counts('body_part'), {'Chest': 2, 'Knee': 1, 'Spine': 1})
+        self.assertFalse(ScanRollup.objects.filter(body_part='Hip').exists())
+
+    def test_decrement_racing_an_increment_keeps_the_bucket(self):
+        refresh_rollups()
+        key = rollup_key(date(2024, 3, 5), 'Spine', 'Johns Hopkins', 'Degenerative disc disease')
+        bucket = ScanRollup.objects.filter(body_part='Spine')
+        delete = QuerySet.delete
+
+        def delete_after_increment(queryset):
+            # Another writer adds a scan between the failed decrement and the delete
+            apply_rollup_deltas({key: 1})
+            return delete(queryset)
+
+        with mock.patch.object(QuerySet, 'delete', delete_after_increment):
+            apply_rollup_deltas({key: -1})
+        self.assertEqual(bucket.get().scan_count, 1)
+
+    def test_repair_invalidates_cached_statistics(self):
+        generation = get_data_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('repair_scan_rollups', stdout=io.StringIO())
+        self.assertNotEqual(get_data_generation(), generation)
+
+    def test_saved_scans_are_sketched(self):
+        rebuild_sketches()
+        with self.captureOnCommitCallbacks(execute=True):
+            XRay.objects.create(
+                patient_id='P001', image='xrays/P001-2.png', body_part='Knee', scan_date=date(2024, 3, 9),
+                institution='Johns Hopkins', diagnosis='Normal', description='Follow-up',
+            )
+        block = unique_patients(today=date(2024, 3, 31))
+        self.assertEqual(block['total'], 4)
+        self.assertEqual(block['by_institution']['Johns Hopkins'], 2)
+        self.assertEqual(block['by_body_part']['Knee'], 2)
+        self.assertEqual(block['last_12_months'], 4)
+
+    def test_hyperloglog_estimates_and_merges(self):
+        left, right = HyperLogLog(), HyperLogLog()
+        left.update(f'P{i:06d}' for i in range(0, 6000))
+        right.update(f'P{i:06d}' for i in range(4000, 10000))
+        self.assertAlmostEqual(left.estimate(), 6000, delta=120)
+        self.assertAlmostEqual(left.merge(right).estimate(), 10000, delta=200)
+
+    def test_institutions_and_diagnoses_read_rollups(self):
+        response = self.client.get(reverse('xray_search:xray-institutions'), HTTP_HOST='localhost')
+        self.assertEqual(response.data['institutions'], ['Cleveland Clinic', 'Johns Hopkins', 'Mayo Clinic'])
+
+        # Served from the cached filter options snapshot
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('xray_search:xray-institutions'), HTTP_HOST='localhost')
+        self.assertEqual(response.data['institutions'], ['Cleveland Clinic', 'Johns Hopkins', 'Mayo Clinic'])
+
+        response = self.client.get(reverse('xray_search:xray-diagnoses'), HTTP_HOST='localhost')
+        self.assertEqual(
+            response.data['diagnoses'],
+            ['Degenerative disc disease', 'Fracture', 'Normal', 'Pneumonia']
+        )
+
+
+class BackfillMigrationTests(TransactionTestCase):
+    """Migrations that add derived tables fill them from the existing scans"""
+
+    def migrate(self, *targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(list(targets))
+        return executor.loader.project_state(list(targets)).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def create_sample_scans(self, apps):
+        HistoricalXRay = apps.get_model('xray_search', 'XRay')
+        for patient_id, body_part, scan_date, institution, diagnosis, description, tags in SAMPLE_SCANS:
+            HistoricalXRay.objects.create(
+                patient_id=patient_id, image=f'xrays/{patient_id}.png', body_part=body_part,
+                scan_date=scan_date, institution=institution, diagnosis=diagnosis,
+                description=description, tags=tags,
+            )
+
+    def test_rollup_migration_counts_existing_scans(self):
+        self.create_sample_scans(self.migrate(('xray_search', '0007_xray_updated_at_id_index')))
+        apps = self.migrate(('xray_search', '0008_scanrollup'))
+
+        rollups = apps.get_model('xray_search', 'ScanRollup').objects.order_by('month', 'body_part')
+        self.assertEqual(
+            list(rollups.values_list('month', 'body_part', 'institution', 'diagnosis', 'scan_count')),
+            [
+                (date(2024, 1, 1), 'Chest', 'Mayo Clinic', 'Pneumonia', 1),
+                (date(2024, 2, 1), 'Chest', 'Cleveland Clinic', 'Normal', 1),
+                (date(2024, 2, 1), 'Knee', 'Mayo Clinic', 'Fracture', 1),
+                (date(2024, 3, 1), 'Spine', 'Johns Hopkins', 'Degenerative disc disease', 1),
+            ],
+        )
+
+    def test_sketch_migration_counts_existing_patients(self):
+        self.create_sample_scans(self.migrate(('xray_search', '0009_xray_image_embedding')))
+        apps = self.migrate(('xray_search', '0010_patientsketch'))
+
+        estimates = apps.get_model('xray_search', 'PatientSketch').objects.values_list('dimension', 'value', 'estimate')
+        self.assertEqual(sorted(estimates), [
+            ('body_part', 'Chest', 2), ('body_part', 'Knee', 1), ('body_part', 'Spine', 1),
+            ('institution', 'Cleveland Clinic', 1), ('institution', 'Johns Hopkins', 1),
+            ('institution', 'Mayo Clinic', 2),
+            ('month', '2024-01', 1), ('month', '2024-02', 2), ('month', '2024-03', 1),
+            ('total', '', 4),
+        ])
+
+
+class ScanTimeseriesTests(FakeElasticsearchTestCase):
+
+    def get_timeseries(self, **params):
+        return self.client.get(reverse('xray_search:xray-timeseries'), params, HTTP_HOST='localhost')
+
+    def test_monthly_buckets_with_split_and_filters(self):
+        response = self.get_timeseries(split_by='body_part')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['buckets'], [
+            {'period': '2024-01-01', 'count': 1, 'groups': {'Chest': 1}},
+            {'period': '2024-02-01', 'count': 2, 'groups': {'Chest': 1, 'Knee': 1}},
+            {'period': '2024-03-01', 'count': 1, 'groups': {'Spine': 1}},
+        ])
+
+        response = self.get_timeseries(interval='day', institution='Mayo Clinic')
+        self.assertEqual(response.data['buckets'], [
+            {'period': '2024-01-10', 'count': 1},
+            {'period': '2024-02-20', 'count': 1},
+        ])
+
+        self.assertEqual(self.get_timeseries(interval='year').status_code, 400)
+        self.assertEqual(self.get_timeseries(split_by='diagnosis').status_code, 400)
+
+    def test_inserts_extend_cached_buckets(self):
+        self.get_timeseries()
+        # Cached and nothing new: only the max id is read
+        with self.assertNumQueries(1):
+            self.get_timeseries()
+
+        XRay.objects.create(
+            patient_id='P005', image='xrays/P005.png', body_part='Knee', scan_date=date(2024, 3, 9),
+            institution='Johns Hopkins', diagnosis='Normal', description='No acute findings',
+        )
+        response = self.get_timeseries()
+        self.assertEqual(response.data['buckets'][-1], {'period': '2024-03-01', 'count': 2})
+
+    def test_updates_and_deletes_recount(self):
+        self.get_timeseries()
+        xray = XRay.objects.get(patient_id='P001')
+        xray.scan_date = date(2024, 3, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            xray.save()
+        response = self.get_timeseries()
+        self.assertEqual(response.data['buckets'], [
+            {'period': '2024-02-01', 'count': 2},
+            {'period': '2024-03-01', 'count': 2},
+        ])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            xray.delete()
+        response = self.get_timeseries()
+        self.assertEqual(response.data['buckets'][-1], {'period': '2024-03-01', 'count': 1})
+
+
+class FacetCountsTests(FakeElasticsearchTestCase):
+
+    def get_facets(self, **params):
+        return self.client.get(reverse('xray_search:xray-facets'), params, HTTP_HOST='localhost')
+
+    def test_counts_follow_filters(self):
+        with self.assertNumQueries(1):
+            response = self.get_facets()
+        self.assertEqual(response.data['total'], 4)
+        self.assertEqual(response.data['facets']['body_part'], [
+            {'value': 'Chest', 'count': 2},
+            {'value': 'Knee', 'count': 1},
+            {'value': 'Spine', 'count': 1},
+        ])
+
+        response = self.get_facets(institution='Mayo')
+        self.assertEqual(response.data['total'], 2)
+        self.assertEqual(response.data['facets']['diagnosis'], [
+            {'value': 'Fracture', 'count': 1},
+            {'value': 'Pneumonia', 'count': 1},
+        ])
+
+    def test_cached_until_next_write(self):
+        self.get_facets(body_part='knee')
+        with self.assertNumQueries(0):
+            self.get_facets(body_part='knee')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            XRay.objects.create(
+                patient_id='P005', image='xrays/P005.png', body_part='Knee', scan_date=date(2024, 3, 9),
+                institution='Johns Hopkins', diagnosis='Normal', description='No acute findings',
+            )
+        response = self.get_facets(body_part='knee')
+        self.assertEqual(response.data['facets']['institution'], [
+            {'value': 'Johns Hopkins', 'count': 1},
+            {'value': 'Mayo Clinic', 'count': 1},
+        ])
+
+
+class FilterOptionsTests(FakeElasticsearchTestCase):
+
+    def get_options(self, **headers):
+        return self.client.get(reverse('xray_search:xray-filter-options'), HTTP_HOST='localhost', **headers)
+
+    def test_repeat_loads_are_not_modified(self):
+        response = self.get_options()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['institutions'], ['Cleveland Clinic', 'Johns Hopkins', 'Mayo Clinic'])
+        self.assertIn('Chest', response.data['body_parts'])
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.get_options(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_writes_change_the_etag(self):
+        etag = self.get_options()['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BodyPart.objects.create(name='Wrist')
+        response = self.get_options(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['body_parts'][0], 'Wrist')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_rollup_rebuilds_refresh_the_options(self):
+        self.get_options()
+        XRay.objects.filter(institution='Johns Hopkins').update(institution='Mount Sinai')
+        with self.captureOnCommitCallbacks(execute=True):
+            refresh_rollups()
+        self.assertEqual(self.get_options().data['institutions'], ['Cleveland Clinic', 'Mayo Clinic', 'Mount Sinai'])
+
+    def test_snapshot_expires(self):
+        self.get_options()
+        entry = cache.get(data_cache_key('filter_options'))
+        self.assertLessEqual(entry['fresh_until'], time.time() + DERIVED_CACHE_TIMEOUT)
+
+
+class PatientTimelineTests(FakeElasticsearchTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for month in [4, 6, 5]:
+            XRay.objects.create(
+                patient_id='P001', image=f'xrays/P001-{month}.png', body_part='Chest',
+                scan_date=date(2024, month, 1), institution='Mayo Clinic', diagnosis='Normal',
+                description='Follow-up',
+            )
+
+    def test_scans_are_keyset_paginated_in_date_order(self):
+        url = reverse('xray_search:patient-scans', args=['P001'])
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'page_size': 3}, HTTP_HOST='localhost')
+        self.assertEqual(
+            [scan['scan_date'] for scan in response.data['results']],
+            ['2024-01-10', '2024-04-01', '2024-05-01'],
+        )
+
+        response = self.client.get(response.data['next'], HTTP_HOST='localhost')
+        self.assertEqual([scan['scan_date'] for scan in response.data['results']], ['2024-06-01'])
+        self.assertIsNone(response.data['next'])
+
+    def test_summary_is_cached(self):
+        url = reverse('xray_search:patient-summary', args=['P001'])
+        response = self.client.get(url, HTTP_HOST='localhost')
+        self.assertEqual(response.data, {
+            'patient_id': 'P001',
+            'scan_count': 4,
+            'first_scan_date': date(2024, 1, 10),
+            'last_scan_date': date(2024, 6, 1),
+            'body_parts': {'Chest': 4},
+        })
+        with self.assertNumQueries(0):
+            self.client.get(url, HTTP_HOST='localhost')
+
+        response = self.client.get(reverse('xray_search:patient-summary', args=['P999']), HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 404)
+
+
+class BulkCreateTests(FakeElasticsearchTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def post_bulk(self, manifest, files):
+        return self.client.post(
+            reverse('xray_search:xray-bulk-create'),
+            {'manifest': json.dumps(manifest), **files},
+            HTTP_HOST='localhost'
+        )
+
+    def upload(self, name):
+        return SimpleUploadedFile(name, make_image((16, 16, 48, 48)).getvalue(), content_type='image/png')
+
+    def scan(self, patient_id, image, **fields):
+        return {
+            'patient_id': patient_id, 'image': image, 'body_part': 'Hip', 'scan_date': '2024-03-12',
+            'institution': 'Mayo Clinic', 'description': 'Imported study', 'diagnosis': 'Normal',
+            'tags': ['import'], **fields,
+        }
+
+    def test_creates_indexes_and_counts_every_scan(self):
+        manifest = [self.scan('P010', 'first'), self.scan('P011', 'second')]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_bulk(manifest, {'first': self.upload('P010.png'), 'second': self.upload('P011.png')})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertTrue(response.data['indexed'])
+
+        xrays = XRay.objects.filter(id__in=response.data['ids']).order_by('patient_id')
+        self.assertEqual([xray.image.name for xray in xrays], ['xrays/P010.png', 'xrays/P011.png'])
+        self.assertTrue(all(xray.image_embedding for xray in xrays))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, 'xrays', 'P010.png')))
+
+        es = get_connection()
+        self.assertEqual(es.count(index=ALIAS, query={'term': {'body_part.raw': 'Hip'}})['count'], 2)
+        self.assertEqual(dimension_counts('body_part')['Hip'], 2)
+        self.assertEqual(PatientSketch.objects.get(dimension='body_part', value='Hip').estimate, 2)
+
+    def test_one_invalid_scan_rejects_the_batch(self):
+        manifest = [
+            self.scan('P010', 'first'), self.scan('bad', 'second'), self.scan('P012', 'missing'),
+            self.scan('P013', ['first']), self.scan('P014', {'field': 'first'}),
+        ]
+        response = self.post_bulk(manifest, {'first': self.upload('P010.png'), 'second': self.upload('P011.png')})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['scans'][0], {})
+        self.assertIn('patient_id', response.data['scans'][1])
+        for errors in response.data['scans'][2:]:
+            self.assertIn('image', errors)
+        self.assertEqual(XRay.objects.count(), 4)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'xrays')))
+
+    def test_scans_sharing_an_image_field_are_rejected(self):
+        manifest = [self.scan('P010', 'first'), self.scan('P011', 'second'), self.scan('P012', 'first')]
+        response = self.post_bulk(manifest, {'first': self.upload('P010.png'), 'second': self.upload('P011.png')})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Each scan needs its own image field; repeated: first')
+        self.assertEqual(XRay.objects.count(), 4)
+
+
+class BulkUpdateTests(FakeElasticsearchTestCase):
+
+    def post_update(self, body):
+        return self.client.post(
+            reverse('xray_search:xray-bulk-update'), body, content_type='application/json', HTTP_HOST='localhost'
+        )
+
+    def test_filtered_update_changes_rows_rollups_and_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_update({
+                'filter': {'institution': 'mayo'},
+                'add_tags': ['reviewed', 'reviewed'],
+                'remove_tags': ['lung'],
+                'diagnosis': 'Normal',
+            })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'updated': 2, 'indexed': True})
+        self.assertEqual(
+            dict(XRay.objects.filter(institution='Mayo Clinic').values_list('patient_id', 'tags')),
+            {'P001': ['infection', 'reviewed'], 'P003': ['trauma', 'bone', 'reviewed']}
+        )
+        self.assertEqual(dimension_counts('diagnosis')['Normal'], 3)
+
+        es = get_connection()
+        self.assertEqual(es.count(index=ALIAS, query={'term': {'tags': 'reviewed'}})['count'], 2)
+        self.assertEqual(es.count(index=ALIAS, query={'term': {'diagnosis.raw': 'Normal'}})['count'], 3)
+
+    def test_update_by_ids_only_touches_those_scans(self):
+        xray = XRay.objects.get(patient_id='P004')
+        response = self.post_update({'ids': [xray.pk], 'add_tags': ['lumbar'], 'body_part': 'Lumbar Spine'})
+
+        self.assertEqual(response.data['updated'], 1)
+        xray.refresh_from_db()
+        self.assertEqual((xray.body_part, xray.tags), ('Lumbar Spine', ['degenerative', 'lumbar']))
+        self.assertEqual(XRay.objects.filter(body_part='Spine').count(), 0)
+        self.assertEqual(XRay.objects.filter(tags__icontains='lumbar').count(), 1)
+
+    def test_changes_that_unmatch_the_filter_still_reach_the_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_update({'filter': {'body_part': 'Chest'}, 'body_part': 'Thorax'})
+
+        self.assertEqual(response.data, {'updated': 2, 'indexed': True})
+        self.assertEqual(dimension_counts('body_part'), {'Knee': 1, 'Spine': 1, 'Thorax': 2})
+        es = get_connection()
+        self.assertEqual(es.count(index=ALIAS, query={'term': {'body_part.raw': 'Thorax'}})['count'], 2)
+
+    def test_rows_sharing_the_timestamp_are_left_alone(self):
+        stamp = timezone.now()
+        XRay.objects.filter(patient_id='P004').update(updated_at=stamp)
+        with mock.patch('xray_search.bulk.timezone.now', return_value=stamp):
+            response = self.post_update({'filter': {'institution': 'Mayo'}, 'add_tags': ['reviewed']})
+
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(XRay.objects.get(patient_id='P004').tags, ['degenerative'])
+
+    def test_large_selections_are_updated_in_chunks(self):
+        with mock.patch('xray_search.bulk.UPDATE_CHUNK_SIZE', 3):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.post_update({
+                    'ids': list(XRay.objects.values_list('id', flat=True)), 'add_tags': ['audited'], 'diagnosis': 'Normal',
+                })
+
+        self.assertEqual(response.data, {'updated': 4, 'indexed': True})
+        self.assertEqual(XRay.objects.filter(diagnosis='Normal').count(), 4)
+        self.assertEqual(dimension_counts('diagnosis'), {'Normal': 4})
+        es = get_connection()
+        self.assertEqual(es.count(index=ALIAS, query={'term': {'tags': 'audited'}})['count'], 4)
+
+    def test_ambiguous_or_misspelt_selections_are_rejected(self):
+        for body in [
+            {'filter': {'instituton': 'Mayo'}, 'diagnosis': 'Normal'},
+            {'ids': [1], 'filter': {'institution': 'Mayo'}, 'diagnosis': 'Normal'},
+            {'filter': {'institution': 'Mayo'}},
+        ]:
+            response = self.post_update(body)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(XRay.objects.filter(diagnosis='Normal').count(), 1)
+
+    @skipUnless(psycopg2, 'psycopg2 is not installed')
+    def test_postgres_tag_update_is_one_statement(self):
+        from django.db.backends.postgresql.base import DatabaseWrapper
+
+        connection = DatabaseWrapper({
+            'NAME': 'medproject', 'USER': '', 'PASSWORD': '', 'HOST': '', 'PORT': '', 'OPTIONS': {},
+            'TIME_ZONE': None, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'AUTOCOMMIT': True,
+            'ATOMIC_REQUESTS': False,
+        }, 'postgresql')
+        query = XRay.objects.filter(institution='Mayo Clinic').query.chain(UpdateQuery)
+        query.add_update_values({'tags': tags_expression(connection, ['reviewed'], ['lung'])})
+        sql, params = query.get_compiler(connection=connection).as_sql()
+
+        self.assertEqual(sql, (
+            'UPDATE "xray_search_xray" SET "tags" = (("tags" - %s::text[]) || COALESCE(('
+            'SELECT jsonb_agg(added.tag ORDER BY added.position) '
+            'FROM jsonb_array_elements(%s::jsonb) WITH ORDINALITY AS added(tag, position) '
+            'WHERE NOT ("tags" - %s::text[]) @> jsonb_build_array(added.tag)'
+            "), '[]'::jsonb)) WHERE \"xray_search_xray\".\"institution\" = %s"
+        ))
+        self.assertEqual(params, (['lung'], '["reviewed"]', ['lung'], 'Mayo Clinic'))
+
+
+class ListSerializationTests(FakeElasticsearchTestCase):
+
+    def test_fast_list_matches_model_serializer(self):
+        XRay.objects.filter(patient_id='P002').update(tags=[])
+        request = Request(self.factory.get('/api/xrays/', HTTP_HOST='localhost'))
+        queryset = XRay.objects.order_by('-patient_id')
+
+        expected = XRayListSerializer(queryset, many=True, context={'request': request}).data
+        actual = FastXRayListSerializer(
+            queryset.values(*FastXRayListSerializer.source_fields), context={'request': request}
+        ).data
+        self.assertEqual([dict(row) for row in expected], actual)
+        self.assertEqual(actual[0]['image_url'], 'http://localhost/media/xrays/P004.png')
+
+        response = self.client.get(reverse('xray_search:xray-list'), {'ordering': '-patient_id'}, HTTP_HOST='localhost')
+        self.assertEqual(response.json()['results'], actual)
+
+    def test_export_streams_filtered_rows_as_ndjson(self):
+        list_response = self.client.get(
+            reverse('xray_search:xray-list'), {'body_part': 'chest', 'ordering': 'scan_date'}, HTTP_HOST='localhost'
+        )
+        response = self.client.get(
+            '/api/xrays/export.ndjson', {'body_part': 'chest', 'ordering': 'scan_date'}, HTTP_HOST='localhost'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], list_response.json()['results'])
+        self.assertEqual(len(lines), 2)
+
+
+class ORJSONNegotiationTests(FakeElasticsearchTestCase):
+
+    def test_orjson_only_when_asked_for(self):
+        url = reverse('xray_search:xray-list')
+        response = self.client.get(url, HTTP_HOST='localhost')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        expected = response.content
+
+        response = self.client.get(url, HTTP_HOST='localhost', HTTP_ACCEPT=ORJSON_MEDIA_TYPE)
+        self.assertEqual(response['Content-Type'], ORJSON_MEDIA_TYPE)
+        self.assertEqual(json.loads(response.content), json.loads(expected))
+
+    def test_renderer_matches_stdlib_renderer(self):
+        data = {
+            'date': date(2024, 1, 10),
+            'created': timezone.now(),
+            'price': Decimal('1.50'),
+            'label': gettext_lazy('Chest'),
+            'scans': XRay.objects.order_by('id').values_list('patient_id', flat=True),
+        }
+        self.assertEqual(
+            json.loads(ORJSONRenderer().render(data)),
+            json.loads(JSONRenderer().render(data)),
+        )
+
+    def test_parser_selected_by_content_type(self):
+        request = Request(
+            self.factory.post('/', data=b'{"tags": ["lung"]}', content_type=ORJSON_MEDIA_TYPE),
+            parsers=[ORJSONParser(), JSONParser()],
+        )
+        self.assertEqual(request.data, {'tags': ['lung']})
+        self.assertIsInstance(request.negotiator.select_parser(request, request.parsers), ORJSONParser)
+
+
+class ColumnarRenderingTests(FakeElasticsearchTestCase):
+
+    def test_columnar_list_round_trips(self):
+        url = reverse('xray_search:xray-list')
+        rows = self.client.get(url, {'ordering': 'patient_id'}, HTTP_HOST='localhost').json()['results']
+
+        response = self.client.get(url, {'ordering': 'patient_id', 'format': 'columnar'}, HTTP_HOST='localhost')
+        payload = response.json()
+        self.assertEqual(payload['count'], 4)
+        self.assertNotIn('results', payload)
+        self.assertEqual(payload['columns'], list(rows[0]))
+
+        decoded = [
+            {
+                column: payload['dictionaries'][column][cell] if column in payload['dictionaries'] else cell
+                for column, cell in zip(payload['columns'], row)
+            }
+            for row in payload['rows']
+        ]
+        self.assertEqual(decoded, rows)
+
+    def test_repeated_strings_are_dictionary_encoded(self):
+        rows = [{'id': i, 'institution': 'Mayo Clinic' if i % 2 else None} for i in range(6)]
+        self.assertEqual(to_columnar(rows), {
+            'columns': ['id', 'institution'],
+            'dictionaries': {'institution': ['Mayo Clinic']},
+            'rows': [[0, None], [1, 0], [2, None], [3, 0], [4, None], [5, 0]],
+        })
+
+    def test_non_list_responses_are_unchanged(self):
+        response = self.client.get(reverse('xray_search:xray-stats'), {'format': 'columnar'}, HTTP_HOST='localhost')
+        self.assertIn('body_part_distribution', response.json())
+
+
+class MessagePackRenderingTests(FakeElasticsearchTestCase):
+
+    def test_list_round_trips(self):
+        url = reverse('xray_search:xray-list')
+        expected = self.client.get(url, {'ordering': 'patient_id'}, HTTP_HOST='localhost').json()
+
+        response = self.client.get(url, {'ordering': 'patient_id'}, HTTP_HOST='localhost', HTTP_ACCEPT=MSGPACK_MEDIA_TYPE)
+        self.assertEqual(response['Content-Type'], MSGPACK_MEDIA_TYPE)
+        self.assertEqual(msgpack.unpackb(response.content), expected)
+
+        response = self.client.get(url, {'ordering': 'patient_id', 'format': 'msgpack'}, HTTP_HOST='localhost')
+        self.assertEqual(msgpack.unpackb(response.content), expected)
+
+    def test_non_native_types_encode_as_in_json(self):
+        data = {'date': date(2024, 1, 10), 'price': Decimal('1.50'), 'label': gettext_lazy('Chest')}
+        self.assertEqual(
+            msgpack.unpackb(MessagePackRenderer().render(data)),
+            json.loads(JSONRenderer().render(data)),
+        )
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+
+    def process(self, response, accept_encoding='gzip'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_negotiation_follows_server_preference_and_q_values(self):
+        self.assertEqual(select_encoding('gzip, deflate'), 'gzip')
+        self.assertIsNone(select_encoding('gzip;q=0, identity'))
+        self.assertIsNone(select_encoding(''))
+        self.assertEqual(select_encoding('*;q=0.1, zstd;q=0, br;q=0'), 'gzip')
+
+    def test_json_is_compressed(self):
+        body = json.dumps([{'institution': 'Mayo Clinic'}] * 50).encode()
+        response = self.process(HttpResponse(body, content_type='application/json'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.content), body)
+
+    def test_images_and_html_are_skipped(self):
+        for content_type in ['image/png', 'text/html; charset=utf-8']:
+            response = self.process(HttpResponse(b'x' * 1000, content_type=content_type))
+            self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streams_are_compressed_chunk_by_chunk(self):
+        rows = [json.dumps({'id': i, 'institution': 'Mayo Clinic'}).encode() + b'\n' for i in range(20)]
+        response = self.process(StreamingHttpResponse(iter(rows), content_type='application/x-ndjson'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        decompressor = zlib.decompressobj(31)
+        chunks = iter(response.streaming_content)
+        # Each row can be decoded as soon as its chunk arrives
+        self.assertEqual(decompressor.decompress(next(chunks)), rows[0])
+        rest = b''.join(decompressor.decompress(chunk) for chunk in chunks)
+        self.assertEqual(rest, b''.join(rows[1:]))
+
+    def assert_compresses_and_flushes(self, coding, decompressor):
+        """``decompressor()`` returns a function decoding successive chunks of one stream"""
+        body = json.dumps([{'institution': 'Mayo Clinic'}] * 50).encode()
+        response = self.process(HttpResponse(body, content_type='application/json'), coding)
+        self.assertEqual(response['Content-Encoding'], coding)
+        self.assertEqual(decompressor()(response.content), body)
+
+        rows = [json.dumps({'id': i, 'institution': 'Mayo Clinic'}).encode() + b'\n' for i in range(20)]
+        response = self.process(StreamingHttpResponse(iter(rows), content_type='application/x-ndjson'), coding)
+        self.assertEqual(response['Content-Encoding'], coding)
+        decompress = decompressor()
+        for row, chunk in zip(rows, response.streaming_content):
+            # Each row can be decoded as soon as its chunk arrives
+            self.assertEqual(decompress(chunk), row)
+
+    def test_zstd_is_preferred_and_flushed_per_chunk(self):
+        self.assertEqual(select_encoding('gzip, br, zstd'), 'zstd')
+        self.assert_compresses_and_flushes('zstd', lambda: zstandard.ZstdDecompressor().decompressobj().decompress)
+
+    def test_brotli_is_flushed_per_chunk(self):
+        self.assertEqual(select_encoding('gzip, br'), 'br')
+        self.assert_compresses_and_flushes('br', lambda: brotli.Decompressor().process)
+
+
+class ConditionalGetTests(FakeElasticsearchTestCase):
+
+    def test_unchanged_list_detail_and_stats_are_not_modified(self):
+        XRay.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+        xray = XRay.objects.get(patient_id='P001')
+        for url in [
+            reverse('xray_search:xray-list'),
+            reverse('xray_search:xray-detail', args=[xray.pk]),
+            reverse('xray_search:xray-stats'),
+        ]:
+            response = self.client.get(url, HTTP_HOST='localhost')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response['ETag'].startswith('W/"'))
+            self.assertTrue(response.has_header('Last-Modified'))
+
+            # One aggregate for the validators; no rows are fetched
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_HOST='localhost', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_writes_and_renderers_change_the_etag(self):
+        url = reverse('xray_search:xray-list')
+        etag = self.client.get(url, HTTP_HOST='localhost')['ETag']
+        columnar = self.client.get(url, {'format': 'columnar'}, HTTP_HOST='localhost')['ETag']
+        self.assertNotEqual(columnar, etag)
+
+        xray = XRay.objects.get(patient_id='P001')
+        xray.diagnosis = 'Normal'
+        with self.captureOnCommitCallbacks(execute=True):
+            xray.save()
+        response = self.client.get(url, HTTP_HOST='localhost', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_writes_that_skip_the_generation_bump_change_the_validators(self):
+        url = reverse('xray_search:xray-list')
+        etag = self.client.get(url, HTTP_HOST='localhost')['ETag']
+
+        # As another process would: no on-commit callbacks run here
+        XRay.objects.filter(patient_id='P001').update(diagnosis='Normal', updated_at=timezone.now())
+        response = self.client.get(url, HTTP_HOST='localhost', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        XRay.objects.filter(patient_id='P004').delete()
+        self.assertEqual(
+            self.client.get(url, HTTP_HOST='localhost', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200
+        )
+
+    def test_last_modified_waits_for_the_second_to_pass(self):
+        url = reverse('xray_search:xray-list')
+        XRay.objects.filter(patient_id='P001').update(updated_at=timezone.now())
+        self.assertFalse(self.client.get(url, HTTP_HOST='localhost').has_header('Last-Modified'))
+
+        XRay.objects.update(updated_at=timezone.now() - timedelta(seconds=2))
+        self.assertTrue(self.client.get(url, HTTP_HOST='localhost').has_header('Last-Modified'))
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'tiered-test-shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tiered-test-shared',
+    },
+})
+class TieredCacheTests(SimpleTestCase):
+
+    def make_cache(self, **options):
+        tiered = TieredCache('tiered-test-shared', {'OPTIONS': options})
+        tiered.clear()
+        tiered.local.counters.clear()
+        return tiered
+
+    def test_reads_are_served_locally_after_a_shared_hit(self):
+        tiered = self.make_cache()
+        caches['tiered-test-shared'].set('stats', {'total': 4})
+
+        self.assertEqual(tiered.get('stats'), {'total': 4})
+        caches['tiered-test-shared'].set('stats', {'total': 5})
+        # Another process's write shows up once the local copy expires
+        self.assertEqual(tiered.get('stats'), {'total': 4})
+        self.assertIsNone(tiered.get('missing'))
+
+        metrics = tiered.metrics()
+        self.assertEqual((metrics['local_hits'], metrics['shared_hits'], metrics['misses']), (1, 1, 1))
+        self.assertEqual(metrics['hit_ratio'], round(2 / 3, 4))
+
+    def test_writes_go_through_and_values_are_copied(self):
+        tiered = self.make_cache()
+        options = {'institutions': ['Mayo Clinic']}
+        tiered.set('options', options)
+        options['institutions'].append('Johns Hopkins')
+
+        self.assertEqual(caches['tiered-test-shared'].get('options'), {'institutions': ['Mayo Clinic']})
+        cached = tiered.get('options')
+        cached['institutions'].clear()
+        self.assertEqual(tiered.get('options'), {'institutions': ['Mayo Clinic']})
+
+        tiered.delete('options')
+        self.assertIsNone(tiered.get('options'))
+
+    def test_local_tier_evicts_least_recently_used(self):
+        tiered = self.make_cache(LOCAL_MAX_ENTRIES=2)
+        for key in ['a', 'b']:
+            tiered.set(key, key)
+        tiered.get('a')
+        tiered.set('c', 'c')
+
+        local_keys = [key.rsplit(':', 1)[-1] for key in tiered.local.entries]
+        self.assertEqual(local_keys, ['a', 'c'])
+        self.assertEqual(tiered.metrics()['evictions'], 1)
+        # Evicted entries are still in the shared tier
+        self.assertEqual(tiered.get('b'), 'b')
+
+    def test_process_local_shared_tier_is_flagged_for_deployment(self):
+        with self.settings(CACHES={'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['xray_search.W001'])
+        with self.settings(CACHES={'shared': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_commands_warn_that_web_processes_keep_their_cache(self):
+        command = BaseCommand(stdout=io.StringIO())
+        with self.settings(CACHES={'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            warn_if_cache_not_shared(command)
+        self.assertIn('REDIS_URL is unset', command.stdout.getvalue())
+
+        command = BaseCommand(stdout=io.StringIO())
+        with self.settings(CACHES={'shared': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+            warn_if_cache_not_shared(command)
+        self.assertEqual(command.stdout.getvalue(), '')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GetOrComputeTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_share_one_computation(self):
+        calls = []
+        barrier = threading.Barrier(4)
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'total_scans': 4}
+
+        results = []
+
+        def request():
+            barrier.wait()
+            results.append(get_or_compute('stats', compute))
+
+        threads = [threading.Thread(target=request) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'total_scans': 4}] * 4)
+
+    def test_expired_values_are_served_stale_while_refreshing(self):
+        counter = iter(range(1, 10))
+        compute = counter.__next__
+        refreshes = []
+
+        def refresh(*args):
+            refreshes.append(refresh_in_background(*args))
+
+        self.assertEqual(get_or_compute('analytics', compute, timeout=0, stale_timeout=60), 1)
+        # Expired: the old value comes back while one refresh runs
+        with mock.patch('xray_search.cache.refresh_in_background', refresh):
+            self.assertEqual(get_or_compute('analytics', compute, timeout=0, stale_timeout=60), 1)
+        refreshes[0].join(5)
+        self.assertFalse(refreshes[0].is_alive())
+        self.assertFalse(cache.has_key('analytics:lock'))
+        self.assertEqual(cache.get('analytics')['value'], 2)
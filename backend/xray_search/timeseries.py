@@ -0,0 +1,81 @@
+"""
+Scan volume over time, computed on the database.
+
+Counts are grouped by the truncated scan date and optionally split by body
+part or institution. Results are cached per interval, split and filter
+signature, and extended incrementally: a cache entry remembers the highest
+scan id it has counted, so a refresh only groups the rows inserted since.
+Updates and deletes bump the mutation generation (see ``cache.py``), which
+makes the next request recount from scratch.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.db.models.functions import Trunc
+
+from .cache import get_mutation_generation
+from .models import XRay
+
+
+INTERVALS = ['day', 'week', 'month']
+SPLIT_FIELDS = ['body_part', 'institution']
+
+# Upper bound on staleness for rows that commit out of id order
+TIMESERIES_CACHE_TIMEOUT = 10 * 60
+
+
+def count_by_period(queryset, interval, split=None):
+    """Group a queryset into ``{period: {group: count}}``"""
+    fields = ['period'] + ([split] if split else [])
+    rows = (
+        queryset.annotate(period=Trunc('scan_date', interval))
+        .values(*fields)
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    counts = {}
+    for row in rows:
+        groups = counts.setdefault(row['period'].isoformat(), {})
+        group = row[split] if split else ''
+        groups[group] = groups.get(group, 0) + row['count']
+    return counts
+
+
+def merge_counts(counts, new_counts):
+    for period, groups in new_counts.items():
+        merged = counts.setdefault(period, {})
+        for group, count in groups.items():
+            merged[group] = merged.get(group, 0) + count
+
+
+def scan_timeseries(queryset, interval, split=None, signature=''):
+    """
+    Return scan counts per period for a filtered queryset.
+
+    Each bucket has ``period`` (the first day of the day/week/month) and
+    ``count``, plus ``groups`` with per-value counts when ``split`` is set.
+    """
+    key = f'xray_search:timeseries:{interval}:{split or "-"}:{signature}'
+
+    # Read the generation before any data, so a concurrent mutation is
+    # caught on the next request rather than cached under the old one
+    generation = get_mutation_generation()
+    max_id = XRay.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+
+    entry = cache.get(key)
+    if entry is None or entry['generation'] != generation or entry['max_id'] > max_id:
+        entry = {'generation': generation, 'max_id': 0, 'counts': {}}
+
+    if max_id > entry['max_id']:
+        new_rows = queryset.filter(id__gt=entry['max_id'], id__lte=max_id)
+        merge_counts(entry['counts'], count_by_period(new_rows, interval, split))
+        entry['max_id'] = max_id
+        cache.set(key, entry, TIMESERIES_CACHE_TIMEOUT)
+
+    buckets = []
+    for period in sorted(entry['counts']):
+        groups = entry['counts'][period]
+        bucket = {'period': period, 'count': sum(groups.values())}
+        if split:
+            bucket['groups'] = dict(sorted(groups.items()))
+        buckets.append(bucket)
+    return buckets
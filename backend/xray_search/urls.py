@@ -1,10 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import XRayViewSet, api_root, elasticsearch_search
+from .views import PatientViewSet, XRayViewSet, api_root, cache_metrics, elasticsearch_search
+from .async_views import search_page
+from .elasticsearch_views import elasticsearch_hybrid_search
 
 # Create router for ViewSet
 router = DefaultRouter()
 router.register(r'xrays', XRayViewSet, basename='xray')
+router.register(r'patients', PatientViewSet, basename='patient')
 
 app_name = 'xray_search'
 
@@ -14,4 +17,13 @@ urlpatterns = [
     
     # Elasticsearch search endpoint
     path('api/search/', elasticsearch_search, name='elasticsearch_search'),
+    
+    # Async search page: hits, facets and suggestions fetched concurrently
+    path('api/search/page/', search_page, name='elasticsearch_search_page'),
+    
+    # Image similarity (kNN) combined with text relevance (BM25)
+    path('api/search/hybrid/', elasticsearch_hybrid_search, name='elasticsearch_hybrid_search'),
+    
+    # Cache hit ratio and local tier size, for staff
+    path('api/cache/metrics/', cache_metrics, name='cache_metrics'),
 ] 
\ No newline at end of file
@@ -1,11 +1,34 @@
+import json
+from collections import Counter
+
 from rest_framework import viewsets, filters, status
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.parsers import MultiPartParser
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
-from .models import XRay, BodyPart
-from .serializers import XRaySerializer, XRayListSerializer, XRayCreateSerializer
-from .filters import XRayFilter
+from django.core.cache import cache
+from django.db.models import Q, Sum
+from django.http import StreamingHttpResponse
+from django.utils.http import parse_etags
+from .bulk import BULK_SET_FIELDS, MAX_BULK_SCANS, bulk_create_scans, bulk_update_scans
+from .cache import (
+    SEARCH_CACHE_TIMEOUT, STALE_CACHE_TIMEOUT, data_cache_key, filter_signature, get_or_compute,
+)
+from .conditional import conditional_on_data, daily_etag, detail_etag
+from .facets import facet_counts
+from .filter_options import filter_options_snapshot
+from .patients import patient_summary
+from .renderers import NDJSON_MEDIA_TYPE, NDJSONRenderer, ndjson_line
+from .models import XRay, ScanRollup
+from .rollups import next_month
+from .sketches import unique_patients
+from .timeseries import INTERVALS, SPLIT_FIELDS, scan_timeseries
+from .serializers import (
+    XRaySerializer, XRayListSerializer, XRayCreateSerializer, FastXRayListSerializer, XRayBulkUpdateSerializer,
+)
+from .filters import XRayFilter, accepted_params
 
 
 @api_view(['GET'])
@@ -16,12 +39,21 @@ def api_root(request):
     Available endpoints:
     - GET /api/xrays/ - List all X-ray scans
     - POST /api/xrays/ - Create new X-ray scan
+    - POST /api/xrays/bulk/ - Create many X-ray scans from a manifest and image files
+    - POST /api/xrays/bulk-update/ - Add/remove tags or set body part/diagnosis on many scans
     - GET /api/xrays/{id}/ - Get specific X-ray scan
     - GET /api/xrays/search_advanced/ - Advanced search
+    - GET /api/xrays/export.ndjson - Stream all scans matching the list filters as NDJSON
     - GET /api/xrays/stats/ - Get statistics
+    - GET /api/xrays/timeseries/ - Scan counts per day, week or month
+    - GET /api/xrays/facets/ - Counts per body part, institution and diagnosis
     - GET /api/xrays/body_parts/ - Get available body parts
     - GET /api/xrays/institutions/ - Get institutions
     - GET /api/xrays/diagnoses/ - Get diagnoses
+    - GET /api/xrays/filter_options/ - Body parts, institutions and diagnoses in one response
+    - GET /api/patients/{patient_id}/scans/ - Scans of a patient in date order
+    - GET /api/patients/{patient_id}/summary/ - Scan count, date range and body parts of a patient
+    - GET /api/cache/metrics/ - Cache hit ratio and local tier size (staff only)
     
     Query parameters for filtering:
     - search: Search across description, diagnosis, tags
@@ -37,10 +69,17 @@ def api_root(request):
             'xrays_list': request.build_absolute_uri('/api/xrays/'),
             'xrays_create': request.build_absolute_uri('/api/xrays/'),
             'advanced_search': request.build_absolute_uri('/api/xrays/search_advanced/'),
+            'export': request.build_absolute_uri('/api/xrays/export.ndjson'),
             'statistics': request.build_absolute_uri('/api/xrays/stats/'),
+            'timeseries': request.build_absolute_uri('/api/xrays/timeseries/'),
+            'facets': request.build_absolute_uri('/api/xrays/facets/'),
             'body_parts': request.build_absolute_uri('/api/xrays/body_parts/'),
             'institutions': request.build_absolute_uri('/api/xrays/institutions/'),
             'diagnoses': request.build_absolute_uri('/api/xrays/diagnoses/'),
+            'filter_options': request.build_absolute_uri('/api/xrays/filter_options/'),
+            'patient_scans': request.build_absolute_uri('/api/patients/P001/scans/'),
+            'patient_summary': request.build_absolute_uri('/api/patients/P001/summary/'),
+            'cache_metrics': request.build_absolute_uri('/api/cache/metrics/'),
             'admin': request.build_absolute_uri('/admin/'),
         },
         'sample_queries': {
@@ -51,6 +90,17 @@ def api_root(request):
     })
 
 
+# Rows fetched from the database per round trip, and sent per chunk
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BATCH_SIZE = 500
+
+
+class XRayPagination(PageNumberPagination):
+    """Page-number pagination; bulk readers can raise ``page_size`` to 1000"""
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
 class XRayViewSet(viewsets.ModelViewSet):
     """
     ViewSet for X-ray scan management with advanced search and filtering
@@ -66,6 +116,7 @@ class XRayViewSet(viewsets.ModelViewSet):
     """
     
     queryset = XRay.objects.all()
+    pagination_class = XRayPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = XRayFilter
     
@@ -84,6 +135,27 @@ class XRayViewSet(viewsets.ModelViewSet):
             return XRayCreateSerializer
         return XRaySerializer
     
+    @conditional_on_data()
+    def list(self, request, *args, **kwargs):
+        """
+        List X-rays from ``.values()`` rows, without building model instances
+        """
+        queryset = self.filter_queryset(self.get_queryset()).values(*FastXRayListSerializer.source_fields)
+        context = self.get_serializer_context()
+        
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(FastXRayListSerializer(page, context=context).data)
+        
+        return Response(FastXRayListSerializer(queryset, context=context).data)
+    
+    @conditional_on_data(detail_etag)
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Get one X-ray, or 304 if unchanged since the client's copy
+        """
+        return super().retrieve(request, *args, **kwargs)
+    
     def get_queryset(self):
         """
         Optionally filter the queryset based on query parameters
@@ -158,71 +230,257 @@ class XRayViewSet(viewsets.ModelViewSet):
         serializer = XRayListSerializer(queryset, many=True, context={'request': request})
         return Response(serializer.data)
     
-    @action(detail=False, methods=['get'])
-    def stats(self, request):
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[MultiPartParser])
+    def bulk_create(self, request):
         """
-        Get statistics about X-ray scans
+        Create many X-rays in one request
+        
+        Send ``multipart/form-data`` with a ``manifest`` field holding a JSON
+        list of scans (the fields of a single create). Each scan's ``image``
+        names the form field carrying its image file. Every scan is validated
+        before anything is written; then the images are stored concurrently,
+        the rows inserted in one transaction and indexed with one bulk
+        request.
         """
-        total_scans = XRay.objects.count()
+        try:
+            manifest = json.loads(request.data.get('manifest', ''))
+        except json.JSONDecodeError:
+            return Response(
+                {'error': 'manifest must be a JSON list of scans'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not isinstance(manifest, list) or not all(isinstance(row, dict) for row in manifest):
+            return Response(
+                {'error': 'manifest must be a JSON list of scans'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 0 < len(manifest) <= MAX_BULK_SCANS:
+            return Response(
+                {'error': f'manifest must list between 1 and {MAX_BULK_SCANS} scans'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Count by body part - get all unique body parts from actual data
-        body_part_stats = {}
+        # Scans sharing a file field would read and store one upload at once
+        references = Counter(row['image'] for row in manifest if isinstance(row.get('image'), str))
+        repeated = sorted(name for name, count in references.items() if count > 1)
+        if repeated:
+            return Response(
+                {'error': f'Each scan needs its own image field; repeated: {", ".join(repeated)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Get all distinct body parts from X-rays
-        distinct_body_parts = XRay.objects.values_list('body_part', flat=True).distinct()
-        for body_part in distinct_body_parts:
-            if body_part:  # Skip empty values
-                count = XRay.objects.filter(body_part=body_part).count()
-                body_part_stats[body_part] = count
+        # Swap file field names for the uploaded files; unknown names and
+        # non-string values are left for the serializer to reject
+        rows = [
+            dict(row, image=request.FILES.get(row['image'], row['image']))
+            if isinstance(row.get('image'), str) else row
+            for row in manifest
+        ]
+        serializer = XRayCreateSerializer(data=rows, many=True)
+        if not serializer.is_valid():
+            return Response(
+                {'error': 'Some scans are invalid; nothing was created', 'scans': serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Count by institution
-        institution_stats = {}
-        institutions = XRay.objects.values_list('institution', flat=True).distinct()
-        for institution in institutions:
-            count = XRay.objects.filter(institution=institution).count()
-            institution_stats[institution] = count
+        xrays, indexed = bulk_create_scans(serializer.validated_data)
+        return Response({
+            'created': len(xrays),
+            'ids': [xray.pk for xray in xrays],
+            'indexed': indexed,
+        }, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['post'], url_path='bulk-update')
+    def bulk_update(self, request):
+        """
+        Apply the same changes to many X-rays at once
         
-        # Recent scans count (last 30 days)
+        Body (JSON):
+        - ids: scan ids to change, or
+        - filter: list filter parameters selecting the scans, e.g.
+          ``{"institution": "Mayo", "diagnosis": "Pneumonia"}``
+        - add_tags / remove_tags: tags to add to or remove from every scan
+        - body_part / diagnosis: value to set on every scan
+        
+        Changes are applied with set-based UPDATEs and sent to the search
+        index in one bulk request.
+        """
+        serializer = XRayBulkUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {'error': 'Invalid bulk update', 'details': serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        data = serializer.validated_data
+        
+        if 'ids' in data:
+            queryset = XRay.objects.filter(id__in=data['ids'])
+        else:
+            filterset = XRayFilter(data=data['filter'], queryset=XRay.objects.all(), request=request)
+            # A misspelt parameter would otherwise be ignored and widen the update
+            unknown = sorted(set(data['filter']) - accepted_params(filterset))
+            if unknown:
+                return Response(
+                    {'error': f'Unknown filter parameters: {", ".join(unknown)}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if not filterset.is_valid():
+                return Response(
+                    {'error': 'Invalid filter', 'details': filterset.errors},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = filterset.qs
+        
+        values = {field: data[field] for field in BULK_SET_FIELDS if field in data}
+        updated, indexed = bulk_update_scans(queryset, data['add_tags'], data['remove_tags'], values)
+        return Response({'updated': updated, 'indexed': indexed})
+    
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer])
+    def export(self, request, *args, **kwargs):
+        """
+        Stream every scan matching the list filters as NDJSON
+        
+        Served at ``/api/xrays/export.ndjson``, one list row per line, in the
+        list's ordering. Rows are read with a database iterator and sent in
+        batches as they are serialized, so memory use doesn't grow with the
+        export and the first rows arrive before the query is exhausted.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).values(*FastXRayListSerializer.source_fields)
+        rows = FastXRayListSerializer(
+            queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE), context=self.get_serializer_context()
+        ).iter_data()
+        
+        def stream():
+            batch = []
+            for row in rows:
+                batch.append(ndjson_line(row))
+                if len(batch) == EXPORT_BATCH_SIZE:
+                    yield b''.join(batch)
+                    batch = []
+            if batch:
+                yield b''.join(batch)
+        
+        response = StreamingHttpResponse(stream(), content_type=NDJSON_MEDIA_TYPE)
+        # Tell nginx not to buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    @action(detail=False, methods=['get'])
+    @conditional_on_data(daily_etag)
+    def stats(self, request):
+        """
+        Get statistics about X-ray scans
+        
+        Distributions are summed from the scan rollups, so the cost depends
+        on the number of distinct values rather than the number of scans.
+        Only the partial month at the start of the 30-day window is counted
+        from the scans table. ``unique_patients`` holds HyperLogLog estimates
+        of distinct patients (about 1% error). Results are cached until the
+        next write; concurrent requests after a write share one computation,
+        and an expired result is served while it is refreshed in the
+        background.
+        """
         from datetime import datetime, timedelta
         thirty_days_ago = datetime.now().date() - timedelta(days=30)
-        recent_scans = XRay.objects.filter(scan_date__gte=thirty_days_ago).count()
+        first_full_month = next_month(thirty_days_ago) if thirty_days_ago.day > 1 else thirty_days_ago
         
-        return Response({
-            'total_scans': total_scans,
-            'body_part_distribution': body_part_stats,
-            'institution_distribution': institution_stats,
-            'recent_scans_30_days': recent_scans
-        })
+        def compute_stats():
+            groups = (
+                ScanRollup.objects.values('body_part', 'institution')
+                .annotate(
+                    count=Sum('scan_count'),
+                    recent=Sum('scan_count', filter=Q(month__gte=first_full_month)),
+                )
+                .order_by('body_part', 'institution')
+            )
+            
+            total_scans = 0
+            recent_scans = XRay.objects.filter(
+                scan_date__gte=thirty_days_ago, scan_date__lt=first_full_month
+            ).count()
+            body_part_stats = {}
+            institution_stats = {}
+            for group in groups:
+                total_scans += group['count']
+                recent_scans += group['recent'] or 0
+                if group['body_part']:  # Skip empty values
+                    body_part_stats[group['body_part']] = body_part_stats.get(group['body_part'], 0) + group['count']
+                institution_stats[group['institution']] = institution_stats.get(group['institution'], 0) + group['count']
+            
+            return {
+                'total_scans': total_scans,
+                'body_part_distribution': body_part_stats,
+                'institution_distribution': dict(sorted(institution_stats.items())),
+                'recent_scans_30_days': recent_scans,
+                'unique_patients': unique_patients()
+            }
+            
+        # Cached per day, until the next write
+        return Response(get_or_compute(
+            data_cache_key('stats', thirty_days_ago), compute_stats, stale_timeout=STALE_CACHE_TIMEOUT
+        ))
     
     @action(detail=False, methods=['get'])
-    def body_parts(self, request):
+    def timeseries(self, request):
         """
-        Get list of available body parts including both static choices and dynamic BodyPart model entries
+        Get scan counts over time
+        
+        Query parameters:
+        - interval: day, week or month (default: month)
+        - split_by: body_part or institution, to break each period down
+        - any list filter (body_part, diagnosis, institution, date_from, ...)
+        
+        Buckets are cached and only scans added since the last request are
+        counted, unless scans were updated or deleted in the meantime.
         """
-        # Get static choices
-        static_body_parts = [choice[0] for choice in XRay.BODY_PART_CHOICES]
+        interval = request.query_params.get('interval', 'month')
+        split_by = request.query_params.get('split_by') or None
         
-        # Get active body parts from BodyPart model
-        dynamic_body_parts = list(BodyPart.objects.filter(is_active=True).values_list('name', flat=True))
+        if interval not in INTERVALS:
+            return Response(
+                {'error': f'interval must be one of: {", ".join(INTERVALS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if split_by is not None and split_by not in SPLIT_FIELDS:
+            return Response(
+                {'error': f'split_by must be one of: {", ".join(SPLIT_FIELDS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        filterset = XRayFilter(request.query_params, queryset=XRay.objects.all(), request=request)
+        if not filterset.is_valid():
+            return Response({'error': filterset.errors}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Combine and remove duplicates while preserving order
-        all_body_parts = []
-        seen = set()
+        buckets = scan_timeseries(filterset.qs, interval, split_by, filter_signature(filterset))
         
-        # Add dynamic body parts first (they take priority)
-        for bp in dynamic_body_parts:
-            if bp not in seen:
-                all_body_parts.append(bp)
-                seen.add(bp)
+        return Response({
+            'interval': interval,
+            'split_by': split_by,
+            'buckets': buckets
+        })
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Get counts for every body part, institution and diagnosis value
+        among the scans matching the list filters
         
-        # Add static body parts that aren't already included
-        for bp in static_body_parts:
-            if bp not in seen:
-                all_body_parts.append(bp)
-                seen.add(bp)
+        All facets are counted in one pass over the matching scans and
+        cached until the next write.
+        """
+        filterset = XRayFilter(request.query_params, queryset=XRay.objects.all(), request=request)
+        if not filterset.is_valid():
+            return Response({'error': filterset.errors}, status=status.HTTP_400_BAD_REQUEST)
         
+        return Response(facet_counts(filterset.qs, filter_signature(filterset)))
+    
+    @action(detail=False, methods=['get'])
+    def body_parts(self, request):
+        """
+        Get list of available body parts including both static choices and dynamic BodyPart model entries
+        """
         return Response({
-            'body_parts': all_body_parts
+            'body_parts': filter_options_snapshot()[1]['body_parts']
         })
     
     @action(detail=False, methods=['get'])
@@ -230,9 +488,8 @@ class XRayViewSet(viewsets.ModelViewSet):
         """
         Get list of institutions with X-ray data
         """
-        institutions = XRay.objects.values_list('institution', flat=True).distinct().order_by('institution')
         return Response({
-            'institutions': list(institutions)
+            'institutions': filter_options_snapshot()[1]['institutions']
         })
     
     @action(detail=False, methods=['get'])
@@ -240,11 +497,83 @@ class XRayViewSet(viewsets.ModelViewSet):
         """
         Get list of unique diagnoses
         """
-        diagnoses = XRay.objects.values_list('diagnosis', flat=True).distinct().order_by('diagnosis')
         return Response({
-            'diagnoses': list(diagnoses)
+            'diagnoses': filter_options_snapshot()[1]['diagnoses']
         })
+    
+    @action(detail=False, methods=['get'])
+    def filter_options(self, request):
+        """
+        Get body parts, institutions and diagnoses for the filter dropdowns
+        
+        Served from a snapshot cached until the next write, with a strong
+        ETag; a matching If-None-Match gets a 304 without a database query.
+        """
+        etag, options = filter_options_snapshot()
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            # Weak comparison: compression middleware weakens the ETag
+            etags = [tag.removeprefix('W/') for tag in parse_etags(if_none_match)]
+            if '*' in etags or etag in etags:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        
+        return Response(options, headers=headers)
+
+
 
+class PatientTimelinePagination(CursorPagination):
+    """Keyset pagination over a patient's scans, oldest first"""
+    ordering = ('scan_date', 'id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class PatientViewSet(viewsets.GenericViewSet):
+    """
+    ViewSet for per-patient scan access by exact patient ID
+    
+    Provides:
+    - Scan timeline in date order, keyset-paginated so deep pages cost the
+      same as the first one
+    - Cached summary of the patient's scans
+    """
+    
+    queryset = XRay.objects.all()
+    serializer_class = XRayListSerializer
+    pagination_class = PatientTimelinePagination
+    # The timeline has a fixed order; no search or ordering parameters
+    filter_backends = []
+    lookup_field = 'patient_id'
+    lookup_value_regex = r'P\d+'
+    
+    @action(detail=True, methods=['get'])
+    def scans(self, request, patient_id=None):
+        """
+        Get the scans of a patient ordered by scan date
+        
+        Follow the ``next`` link for further pages; ``page_size`` can be
+        raised to 200.
+        """
+        queryset = XRay.objects.filter(patient_id=patient_id).values(*FastXRayListSerializer.source_fields)
+        page = self.paginate_queryset(queryset)
+        serializer = FastXRayListSerializer(page, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+    
+    @action(detail=True, methods=['get'])
+    def summary(self, request, patient_id=None):
+        """
+        Get the scan count, first and last scan date and body parts of a patient
+        """
+        summary = patient_summary(patient_id)
+        if summary is None:
+            return Response(
+                {'error': f'No scans found for patient {patient_id}'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(summary)
 
 @api_view(['GET'])
 def elasticsearch_search(request):
@@ -259,48 +588,68 @@ def elasticsearch_search(request):
     try:
         from .documents import XRayDocument
         
-        # Perform search
-        search = XRayDocument.search()
-        search = search.query("multi_match", query=query, fields=['patient_id', 'body_part', 'description', 'diagnosis', 'institution', 'tags'])
-        
-        # Execute search
-        response = search[:20].execute()
-        
-        # Format results
-        results = []
-        for hit in response:
-            # Get the actual XRay object to access image field
-            try:
-                xray_obj = XRay.objects.get(id=hit.id)
-                image_url = request.build_absolute_uri(xray_obj.image.url) if xray_obj.image else None
-            except XRay.DoesNotExist:
-                image_url = None
+        def run_search():
+            # Perform search
+            search = XRayDocument.search()
+            search = search.query("multi_match", query=query, fields=['patient_id', 'body_part', 'description', 'diagnosis', 'institution', 'tags.text'])
             
-            results.append({
-                'id': hit.id,
-                'patient_id': hit.patient_id,
-                'body_part': hit.body_part,
-                'diagnosis': hit.diagnosis,
-                'description': hit.description,
-                'institution': hit.institution,
-                'tags': hit.tags,
-                'tags_display': hit.tags,  # For compatibility
-                'scan_date': hit.scan_date,
-                'image': getattr(hit, 'image', ''),
-                'image_url': image_url,
-                'created_at': getattr(hit, 'created_at', ''),
-                'updated_at': getattr(hit, 'updated_at', ''),
-                'score': hit.meta.score
-            })
+            # Execute search
+            response = search[:20].execute()
+            
+            # Format results
+            results = []
+            for hit in response:
+                # Get the actual XRay object to access image field
+                try:
+                    xray_obj = XRay.objects.get(id=hit.id)
+                    image_url = request.build_absolute_uri(xray_obj.image.url) if xray_obj.image else None
+                except XRay.DoesNotExist:
+                    image_url = None
+                
+                tags = list(getattr(hit, 'tags', []))
+                results.append({
+                    'id': hit.id,
+                    'patient_id': hit.patient_id,
+                    'body_part': hit.body_part,
+                    'diagnosis': hit.diagnosis,
+                    'description': hit.description,
+                    'institution': hit.institution,
+                    'tags': tags,
+                    'tags_display': ', '.join(tags) if tags else 'No tags',  # For compatibility
+                    'scan_date': hit.scan_date,
+                    'image': getattr(hit, 'image', ''),
+                    'image_url': image_url,
+                    'created_at': getattr(hit, 'created_at', ''),
+                    'updated_at': getattr(hit, 'updated_at', ''),
+                    'score': hit.meta.score
+                })
+            
+            return {
+                'query': query,
+                'total_hits': response.hits.total.value,
+                'results': results
+            }
         
-        return Response({
-            'query': query,
-            'total_hits': response.hits.total.value,
-            'results': results
-        })
+        # Image URLs are absolute, so the key includes the requested host
+        key = data_cache_key('search', query, request.build_absolute_uri('/'))
+        return Response(get_or_compute(key, run_search, SEARCH_CACHE_TIMEOUT))
         
     except Exception as e:
         return Response({
             'error': f'Search failed: {str(e)}',
             'query': query
         }, status=500)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_metrics(request):
+    """
+    Hit/miss counters and local tier size of this process's cache
+    """
+    if not hasattr(cache, 'metrics'):
+        return Response(
+            {'error': 'The configured cache backend does not report metrics'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(cache.metrics())
@@ -3,7 +3,7 @@ import styled from 'styled-components';
 import { X, Calendar, MapPin, Stethoscope, Tag } from 'lucide-react';
 import { useQuery } from '@tanstack/react-query';
 import { XRayAPI } from '../../services/api';
-import { SearchFilters } from '../../types';
+import { FacetValue, SearchFilters } from '../../types';
 import { theme } from '../../styles/theme';
 
 interface FilterPanelProps {
@@ -191,6 +191,19 @@ const FilterPanel: React.FC<FilterPanelProps> = ({
     queryFn: XRayAPI.getDropdownData,
   });
 
+  // Fetch counts for the active filters
+  const { data: facetData } = useQuery({
+    queryKey: ['facets', filters],
+    queryFn: () => XRayAPI.getFacets(filters),
+    enabled: visible,
+  });
+
+  const optionLabel = (facet: FacetValue[] | undefined, value: string) => {
+    if (!facet) return value;
+    const match = facet.find((item) => item.value === value);
+    return `${value} (${match ? match.count : 0})`;
+  };
+
   const handleFilterChange = (key: keyof SearchFilters, value: string) => {
     onChange({ ...filters, [key]: value });
   };
@@ -231,7 +244,7 @@ const FilterPanel: React.FC<FilterPanelProps> = ({
               <option value="">All Body Parts</option>
               {dropdownData?.body_parts?.map((bodyPart) => (
                 <option key={bodyPart} value={bodyPart}>
-                  {bodyPart}
+                  {optionLabel(facetData?.facets.body_part, bodyPart)}
                 </option>
               ))}
             </FilterSelect>
@@ -249,7 +262,7 @@ const FilterPanel: React.FC<FilterPanelProps> = ({
               <option value="">All Diagnoses</option>
               {dropdownData?.diagnoses?.map((diagnosis) => (
                 <option key={diagnosis} value={diagnosis}>
-                  {diagnosis}
+                  {optionLabel(facetData?.facets.diagnosis, diagnosis)}
                 </option>
               ))}
             </FilterSelect>
@@ -267,7 +280,7 @@ const FilterPanel: React.FC<FilterPanelProps> = ({
               <option value="">All Institutions</option>
               {dropdownData?.institutions?.map((institution) => (
                 <option key={institution} value={institution}>
-                  {institution}
+                  {optionLabel(facetData?.facets.institution, institution)}
                 </option>
               ))}
             </FilterSelect>
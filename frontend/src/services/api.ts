@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { XRayListResponse, XRayRecord, SearchFilters, ApiStats, DropdownData, ElasticsearchResult } from '../types';
+import { XRayListResponse, XRayRecord, SearchFilters, ApiStats, DropdownData, ElasticsearchResult, FacetCounts } from '../types';
 
 // Configure axios base URL
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://127.0.0.1:8000';
@@ -98,17 +98,27 @@ export class XRayAPI {
    * Get dropdown data for filters
    */
   static async getDropdownData(): Promise<DropdownData> {
-    const [bodyPartsResponse, institutionsResponse, diagnosesResponse] = await Promise.all([
-      api.get('/api/xrays/body_parts/'),
-      api.get('/api/xrays/institutions/'),
-      api.get('/api/xrays/diagnoses/'),
-    ]);
-
-    return {
-      body_parts: bodyPartsResponse.data.body_parts,
-      institutions: institutionsResponse.data.institutions,
-      diagnoses: diagnosesResponse.data.diagnoses,
-    };
+    // One cached snapshot; the browser revalidates it with its ETag
+    const response = await api.get('/api/xrays/filter_options/');
+    return response.data;
+  }
+
+  /**
+   * Get per-value counts of each filter dropdown for the active filters
+   */
+  static async getFacets(filters: SearchFilters = {}): Promise<FacetCounts> {
+    const params = new URLSearchParams();
+
+    if (filters.search) params.append('search', filters.search);
+    if (filters.body_part) params.append('body_part', filters.body_part);
+    if (filters.diagnosis) params.append('diagnosis', filters.diagnosis);
+    if (filters.institution) params.append('institution', filters.institution);
+    if (filters.date_from) params.append('scan_date_from', filters.date_from);
+    if (filters.date_to) params.append('scan_date_to', filters.date_to);
+    if (filters.tags) params.append('tags', filters.tags);
+
+    const response = await api.get(`/api/xrays/facets/?${params.toString()}`);
+    return response.data;
   }
 
   /**
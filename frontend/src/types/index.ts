@@ -38,6 +38,13 @@ export interface ApiStats {
   body_part_distribution: { [key: string]: number };
   institution_distribution: { [key: string]: number };
   recent_scans_30_days: number;
+  unique_patients: {
+    total: number;
+    last_12_months: number;
+    by_institution: { [key: string]: number };
+    by_body_part: { [key: string]: number };
+    by_month: { [key: string]: number };
+  };
 }
 
 export interface DropdownData {
@@ -46,6 +53,20 @@ export interface DropdownData {
   diagnoses: string[];
 }
 
+export interface FacetValue {
+  value: string;
+  count: number;
+}
+
+export interface FacetCounts {
+  total: number;
+  facets: {
+    body_part: FacetValue[];
+    institution: FacetValue[];
+    diagnosis: FacetValue[];
+  };
+}
+
 export interface ElasticsearchResult {
   results: XRayRecord[];
   total_hits: number;